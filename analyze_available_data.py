@@ -17,13 +17,10 @@ Arguments:
 """
 
 from collections import defaultdict
-from pathlib import Path
-import os
-from tabulate import tabulate
-from det_mod_configs import CHOICES_DETECTOR_MODELS
+from data_inventory import DataInventory
 
 
-def parse_files(directory):
+def parse_files(directory, inventory=None):
     """
     Parse the specified directory for files that match the expected naming format.
 
@@ -33,6 +30,8 @@ def parse_files(directory):
 
     Parameters:
     directory (str): The directory to scan for files.
+    inventory (DataInventory, optional): An already refreshed inventory of the
+                                         directory; otherwise one is refreshed here.
 
     Returns:
     defaultdict: A nested dictionary containing detector models as keys,
@@ -41,26 +40,14 @@ def parse_files(directory):
 
     detector_data = defaultdict(lambda: defaultdict(lambda: defaultdict(set)))
 
-    for folder in os.listdir(directory):
-        folder_path = os.path.join(directory, folder)
-        if os.path.isdir(folder_path) and folder in CHOICES_DETECTOR_MODELS:  # only look at folders
-            for subfolder in os.listdir(folder_path):
-                bX_number = subfolder.split("_")[-1]
-
-                subfolder_path = os.path.join(folder_path, subfolder)
-                for file_path in (Path(directory) / folder / subfolder).rglob("*.edm4hep.root"):
-                    # Extract components of the filename
-                    parts = file_path.stem.split("-")
-                    if len(parts) != 5:
-                        continue  # Skip any files that don't match the expected format
-                    detector_model = parts[0]
-                    scenario = parts[1]
-                    bX_number = parts[2]
-                    e_number = parts[3].split("_")[-1]
-                    part = parts[4].split("_")[-1].split(".")[0]
-
-                    # Add the bX_Number to the appropriate detector_model and scenario
-                    detector_data[detector_model][scenario][bX_number].add(part)
+    if inventory is None:
+        inventory = DataInventory(directory).refresh()
+
+    for sim_file in inventory.iter_sim_files():
+        # Add the bX_Number to the appropriate detector_model and scenario
+        detector_data[sim_file.detector_model][sim_file.scenario][
+            sim_file.bX_number
+        ].add(sim_file.part)
 
     return detector_data
 
@@ -119,6 +106,8 @@ def print_detector_info(sorted_detector_data):
             table_data.append([detector_model, scenario, num_bX, num_files])
 
     # Print the table using tabulate
+    from tabulate import tabulate
+
     print(
         tabulate(
             table_data,
@@ -1,13 +1,20 @@
 import argparse
+import hashlib
+import re
+import sys
+import time
 from collections import defaultdict
+from dataclasses import dataclass
 from os import fspath
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, NamedTuple, Tuple
 
 import numpy as np
 import uproot
+from uproot.source.futures import TrivialExecutor
 
 from det_mod_configs import detector_model_configurations
+from instrumentation import record
 
 save_plots = False
 show_plts = True
@@ -82,47 +89,294 @@ def get_p_n_t(
 
     return dict(pos_n_t)
 
-def get_hits(file_paths: List[str], detector_model: str) -> Dict[str, Dict[str, np.ndarray]]:
+OBSERVABLE_BRANCH_SUFFIXES = {
+    "x": ".position.x",
+    "y": ".position.y",
+    "z": ".position.z",
+    "t": ".time",
+}
+ALL_OBSERVABLES = tuple(OBSERVABLE_BRANCH_SUFFIXES)
+CUT_PATTERN = re.compile(
+    r"^\s*(?:(?P<low>[-+\d.eE]+)\s*<=?\s*)?(?P<abs>\|)?(?P<observable>[xyzt])\|?"
+    r"\s*(?:(?P<op><=?|>=?)\s*(?P<value>[-+\d.eE]+))?\s*$"
+)
+
+
+class HitCut(NamedTuple):
+    """Selects hits with `low <= observable < high`, of the absolute value if `absolute`."""
+
+    observable: str
+    low: float | None = None
+    high: float | None = None
+    absolute: bool = False
+
+    def get_mask(self, values: np.ndarray) -> np.ndarray:
+        if self.absolute:
+            values = np.abs(values)
+        mask = np.ones(len(values), dtype=bool)
+        if self.low is not None:
+            mask &= values >= self.low
+        if self.high is not None:
+            mask &= values < self.high
+        return mask
+
+
+def parse_cut(text: str) -> HitCut:
+    """
+    Parses cuts like "t<10", "|z|<2200", "t>1" or "-100<z<100", e.g. given on
+    the command line. Strict and non-strict comparisons are treated alike.
+    """
+    match = CUT_PATTERN.match(text)
+    if match is None or (match["low"] is None and match["op"] is None):
+        raise ValueError(f"Invalid cut '{text}', expected e.g. 't<10', '|z|<2200' or '-100<z<100'")
+    low = float(match["low"]) if match["low"] is not None else None
+    high = None
+    if match["op"] is not None:
+        if match["op"].startswith("<"):
+            high = float(match["value"])
+        elif low is None:
+            low = float(match["value"])
+        else:
+            raise ValueError(f"Invalid cut '{text}', use 'low<observable<high'")
+    return HitCut(match["observable"], low, high, match["abs"] is not None)
+
+
+@dataclass(frozen=True)
+class HitSelection:
+    """
+    What `get_hits` reads.
+
+    Parameters:
+    - observables (Tuple[str, ...] | Dict[str, Tuple[str, ...]]): Observables
+      returned for all sub-detectors, or per sub-detector key.
+    - cuts (Tuple[HitCut, ...]): Only hits passing all cuts are returned.
+    - entry_start, entry_stop (int, optional): Event range of the whole
+      sample, i.e. of all files one after the other.
+    """
+
+    observables: Tuple[str, ...] | Dict[str, Tuple[str, ...]] = ALL_OBSERVABLES
+    cuts: Tuple[HitCut, ...] = ()
+    entry_start: int | None = None
+    entry_stop: int | None = None
+
+    def get_observables(self, sub_det_key: str) -> Tuple[str, ...]:
+        if isinstance(self.observables, dict):
+            return tuple(self.observables.get(sub_det_key, ALL_OBSERVABLES))
+        return tuple(self.observables)
+
+    def get_read_observables(self, sub_det_key: str) -> Tuple[str, ...]:
+        """The returned observables and those only needed for the cuts."""
+        observables = self.get_observables(sub_det_key)
+        return observables + tuple(
+            dict.fromkeys(c.observable for c in self.cuts if c.observable not in observables)
+        )
+
+    def get_mask(self, values: Dict[str, np.ndarray], n_hits: int) -> np.ndarray | None:
+        """Mask of the hits of a chunk passing all cuts, None without cuts."""
+        if not self.cuts:
+            return None
+        mask = np.ones(n_hits, dtype=bool)
+        for cut in self.cuts:
+            mask &= cut.get_mask(values[cut.observable])
+        return mask
+
+    def get_file_entry_range(self, first_entry: int, num_entries: int) -> Tuple[int, int]:
+        """The part of the sample's event range within a file, relative to the file."""
+        start = 0 if self.entry_start is None else self.entry_start - first_entry
+        stop = num_entries if self.entry_stop is None else self.entry_stop - first_entry
+        start = min(max(start, 0), num_entries)
+        return start, min(max(stop, start), num_entries)
+
+    def is_default(self) -> bool:
+        return self == HitSelection()
+
+    def get_tag(self) -> str:
+        """Short tag distinguishing the caches of different selections, empty for the default."""
+        if self.is_default():
+            return ""
+        return "_sel" + hashlib.sha1(repr(self).encode()).hexdigest()[:10]
+
+
+class TimedExecutor(TrivialExecutor):
+    """
+    Runs uproot's tasks synchronously like its default executor and sums up
+    their duration. As decompression executor it times reading the baskets,
+    which is dominated by their decompression.
+    """
+
+    def __init__(self):
+        self.seconds = 0.0
+
+    def submit(self, task, /, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().submit(task, *args, **kwargs)
+        finally:
+            self.seconds += time.perf_counter() - start
+
+
+def get_branch_bytes(branch, entry_start: int, entry_stop: int) -> Tuple[int, int, int]:
+    """Compressed and uncompressed bytes and number of the baskets of a branch overlapping an entry range."""
+    offsets = branch.entry_offsets
+    compressed = uncompressed = n_baskets = 0
+    for basket_num in range(branch.num_baskets):
+        if offsets[basket_num] < entry_stop and offsets[basket_num + 1] > entry_start:
+            compressed += branch.basket_compressed_bytes(basket_num)
+            uncompressed += branch.basket_uncompressed_bytes(basket_num)
+            n_baskets += 1
+    return compressed, uncompressed, n_baskets
+
+
+def flatten_events(array: np.ndarray) -> np.ndarray:
+    """Concatenates the per event arrays of a jagged branch read with library="np"."""
+    if array.dtype == object:
+        return np.concatenate(array)
+    return array
+
+
+def read_file_hits(
+    file_path: str,
+    branches: Dict[str, Dict[str, str]],
+    selection: "HitSelection",
+    pos_n_t: Dict,
+    first_entry: int = 0,
+) -> Dict:
+    """
+    Appends the selected hits of one file to `pos_n_t` and returns the reader
+    telemetry of the file: bytes, baskets, decompression time, events and hits
+    per collection.
+
+    Parameters:
+    - branches (Dict[str, Dict[str, str]]): Branch name per sub-detector and
+      observable, including the observables only needed by the cuts.
+    - selection (HitSelection): Observables, cuts and event range to read.
+    - first_entry (int): Index of the first event of the file in the whole
+      sample, the event range of the selection refers to the whole sample.
+    """
+    branch_names = [name for observables in branches.values() for name in observables.values()]
+    decompression_executor = TimedExecutor()
+    hits_per_collection = defaultdict(int)
+    selected_hits_per_collection = defaultdict(int)
+
+    start = time.perf_counter()
+    with uproot.open(file_path) as f:
+        tree = f["events"]
+        num_entries = tree.num_entries
+        entry_start, entry_stop = selection.get_file_entry_range(first_entry, num_entries)
+
+        for batch in tree.iterate(
+            filter_name=branch_names,
+            entry_start=entry_start,
+            entry_stop=entry_stop,
+            library="np",
+            decompression_executor=decompression_executor,
+        ):
+            if len(batch[branch_names[0]]) == 0:
+                continue
+            for sub_det_key, observables in branches.items():
+                values = {
+                    observable_key: flatten_events(batch[branch_name])
+                    for observable_key, branch_name in observables.items()
+                }
+                collection = next(iter(observables.values())).split(".")[0]
+                n_hits = len(next(iter(values.values())))
+                hits_per_collection[collection] += n_hits
+
+                # the cuts are applied per chunk, only selected hits are accumulated
+                mask = selection.get_mask(values, n_hits)
+                for observable_key in selection.get_observables(sub_det_key):
+                    selected = values[observable_key] if mask is None else values[observable_key][mask]
+                    pos_n_t[sub_det_key][observable_key].append(selected)
+                selected_hits_per_collection[collection] += (
+                    n_hits if mask is None else int(np.count_nonzero(mask))
+                )
+
+        compressed = uncompressed = n_baskets = 0
+        if entry_stop > entry_start:
+            for name in branch_names:
+                branch_bytes = get_branch_bytes(tree[name], entry_start, entry_stop)
+                compressed += branch_bytes[0]
+                uncompressed += branch_bytes[1]
+                n_baskets += branch_bytes[2]
+    read_s = time.perf_counter() - start
+
+    return {
+        "file": fspath(file_path),
+        "events": num_entries,
+        "events_read": entry_stop - entry_start,
+        "compressed_bytes": compressed,
+        "uncompressed_bytes": uncompressed,
+        "baskets": n_baskets,
+        "read_s": read_s,
+        "decompression_s": decompression_executor.seconds,
+        "mb_per_s": compressed / 1e6 / read_s if read_s else 0.0,
+        "hits": dict(hits_per_collection),
+        "hits_selected": dict(selected_hits_per_collection),
+    }
+
+
+def print_reader_progress(n_done: int, n_files: int, telemetry: Dict) -> None:
+    """Live progress line of the reader, only shown on a terminal."""
+    if not sys.stdout.isatty():
+        return
+    print(
+        f"\r[{n_done}/{n_files}] {Path(telemetry['file']).name}: "
+        f"{telemetry['compressed_bytes'] / 1e6:.1f} MB in {telemetry['read_s']:.2f} s "
+        f"({telemetry['mb_per_s']:.1f} MB/s, {telemetry['decompression_s']:.2f} s decompression), "
+        f"{sum(telemetry['hits_selected'].values())} hits",
+        end="\n" if n_done == n_files else "",
+        flush=True,
+    )
+
+
+def get_hits(
+    file_paths: List[str], detector_model: str, selection: HitSelection | None = None
+) -> Dict[str, Dict[str, np.ndarray]]:
     """
     Returns hits as a single dictionary:
     {
         'vb': {'x': ..., 'y': ..., 'z': ..., 't': ...},
         've': {'x': ..., 'y': ..., 'z': ..., 't': ...}
     }
+
+    A `HitSelection` restricts the reading to the needed observables, an
+    event range of the whole sample and hits passing simple cuts. Only the
+    branches of the selected and cut observables are read and the cuts are
+    applied per chunk before accumulating. By default all hits with x, y, z
+    and t are returned.
+
+    The files are read one by one; the telemetry of every file is shown as
+    progress line and added to the active run report (see instrumentation).
     """
+    selection = selection or HitSelection()
     pos_n_t = defaultdict(lambda: defaultdict(list))
 
-    key_mapping = {
-        ".position.x": "x",
-        ".position.y": "y",
-        ".position.z": "z",
-        ".time": "t",
-    }
-
     sub_det_cols = detector_model_configurations[detector_model].get_sub_detector_collection_info()
+    branches = {
+        sub_det_key: {
+            observable_key: f"{hit_col.root_tree_branch_name}{OBSERVABLE_BRANCH_SUFFIXES[observable_key]}"
+            for observable_key in selection.get_read_observables(sub_det_key)
+        }
+        for sub_det_key, hit_col in sub_det_cols.items()
+    }
 
-    for sub_det_key, hit_col in sub_det_cols.items():
-        alis = {value: f"{hit_col.root_tree_branch_name}{key}" for key, value in key_mapping.items()}
-
-        for batch in uproot.iterate(
-            [{fp: "events"} for fp in file_paths],
-            list(alis.keys()),
-            library="np",
-            aliases=alis,
-        ):
-            for observable_key in alis.keys():
-                pos_n_t[sub_det_key][observable_key].append(batch[observable_key])
+    first_entry = 0
+    for n_done, file_path in enumerate(file_paths, start=1):
+        if selection.entry_stop is not None and first_entry >= selection.entry_stop:
+            break
+        telemetry = read_file_hits(file_path, branches, selection, pos_n_t, first_entry)
+        first_entry += telemetry["events"]
+        print_reader_progress(n_done, len(file_paths), telemetry)
+        record("files", telemetry)
 
-    # Flatten arrays
+    # Concatenate the chunks, they are flattened already
     hits = {}
-    for sub_det_key, observables in pos_n_t.items():
+    for sub_det_key in sub_det_cols:
         hits[sub_det_key] = {}
-        for observable_key, arrays in observables.items():
-            # concatenate arrays
-            concatenated_array = np.concatenate(arrays) if len(arrays) > 1 else arrays[0]
-            # flatten nested arrays if needed
-            if isinstance(concatenated_array[0], np.ndarray):
-                concatenated_array = np.concatenate(concatenated_array)
-            hits[sub_det_key][observable_key] = concatenated_array
+        for observable_key in selection.get_observables(sub_det_key):
+            arrays = pos_n_t[sub_det_key][observable_key]
+            hits[sub_det_key][observable_key] = (
+                np.concatenate(arrays) if len(arrays) > 1 else arrays[0] if arrays else np.empty(0)
+            )
 
     return hits
@@ -1,39 +1,126 @@
+"""
+Hit counts of the reconstructed tracks in `.edm4hep.root` files.
+
+The default columnar reader takes the `trackerHits_begin`/`trackerHits_end`
+members of the track collections with uproot. These members index the track's
+tracker hit relation. The number of hits of every track of every event is then
+their difference, computed for whole batches of events at once. The input
+files are read in parallel processes, which is what full reconstructed
+background samples need. The podio reader keeps the original event loop, which
+only looks at the first track of each event.
+
+Usage:
+    python analyze_tracks.py --mode print --inputFile <dir>/*_REC.edm4hep.root
+"""
+
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 from os import fspath
 from pathlib import Path
+from typing import Dict, List
 
-import matplotlib.pyplot as plt
-from podio import root_io
+TRACK_COLLECTIONS = ["SiTracksCT", "ClupatraTracks"]
+# events per batch, bounds the memory of a worker for large files
+DEFAULT_STEP_SIZE = 10000
 
+inputFileDefault = (
+    Path.home()
+    / "promotion/code/ILDConfig/StandardConfig/production/data/muon_tracking_test_if1_REC.edm4hep.root"
+)
 
-def main():
-    # Set up argument parser
-    parser = argparse.ArgumentParser(description="Process and display track hit data.")
-    parser.add_argument(
-        "--mode",
-        choices=["print", "plot"],
-        required=True,
-        help="Choose 'print' to display hit numbers, or 'plot' to show histograms.",
-    )
-    parser.add_argument(
-        "--inputFile",
-        type=str,
-        default=fspath(
-            Path.home()
-            / "promotion/code/ILDConfig/StandardConfig/production/data/muon_tracking_test_if1_REC.edm4hep.root"
-        ),
-        help=(
-            "Specify the input file. If not provided, a default path "
-            "will be used: ~/promotion/code/ILDConfig/StandardConfig/production/data/muon_tracking_test_if1_REC.edm4hep.root"
-        ),
-    )
 
-    args = parser.parse_args()
+def get_track_hit_counts(
+    file_path: str, collections: List[str] = TRACK_COLLECTIONS, step_size: int = DEFAULT_STEP_SIZE
+) -> Dict[str, Dict]:
+    """
+    Reads the hit counts of all tracks of a file columnar.
+
+    Parameters:
+    - file_path (str): Path of the `.edm4hep.root` file.
+    - collections (List[str]): Track collections to read; collections missing
+      in the file are skipped.
+    - step_size (int): Number of events read per batch.
+
+    Returns:
+    - Dict[str, Dict]: Per collection the numpy arrays `hits_per_track` (all
+      tracks of all events), `tracks_per_event` and `hits_first_track` (0 for
+      events without tracks).
+    """
+    import awkward as ak
+    import numpy as np
+    import uproot
+
+    with uproot.open(file_path) as f:
+        tree = f["events"]
+        branches = {
+            collection: (f"{collection}.trackerHits_begin", f"{collection}.trackerHits_end")
+            for collection in collections
+            if f"{collection}.trackerHits_begin" in tree
+        }
+        for collection in collections:
+            if collection not in branches:
+                print(f"{file_path}: no track collection {collection}, skipped")
+
+        batches = {collection: [] for collection in branches}
+        for batch in tree.iterate(
+            [name for names in branches.values() for name in names],
+            library="ak",
+            step_size=step_size,
+        ):
+            for collection, (begin, end) in branches.items():
+                n_hits = batch[end] - batch[begin]
+                batches[collection].append(
+                    {
+                        "hits_per_track": ak.to_numpy(ak.flatten(n_hits)),
+                        "tracks_per_event": ak.to_numpy(ak.num(n_hits)),
+                        "hits_first_track": ak.to_numpy(ak.fill_none(ak.firsts(n_hits), 0)),
+                    }
+                )
+
+    return {
+        collection: {
+            key: np.concatenate([b[key] for b in collection_batches])
+            for key in ("hits_per_track", "tracks_per_event", "hits_first_track")
+        }
+        for collection, collection_batches in batches.items()
+        if collection_batches
+    }
 
-    # Determine the input file path
-    input_file_path = args.inputFile
 
-    f = root_io.Reader(fspath(input_file_path))
+def get_track_hit_counts_of_files(
+    file_paths: List[str],
+    collections: List[str] = TRACK_COLLECTIONS,
+    max_workers: int | None = None,
+    step_size: int = DEFAULT_STEP_SIZE,
+) -> Dict[str, Dict]:
+    """Reads the files in parallel processes and concatenates their hit counts."""
+    import numpy as np
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        per_file = list(
+            pool.map(
+                get_track_hit_counts,
+                file_paths,
+                [collections] * len(file_paths),
+                [step_size] * len(file_paths),
+            )
+        )
+
+    hit_counts = {}
+    for collection in collections:
+        arrays = [counts[collection] for counts in per_file if collection in counts]
+        if arrays:
+            hit_counts[collection] = {
+                key: np.concatenate([a[key] for a in arrays]) for key in arrays[0]
+            }
+    return hit_counts
+
+
+def get_first_track_hit_counts_podio(file_path: str, collections: List[str], should_print_hits: bool):
+    """The original event loop with podio, only the first track of every event is counted."""
+    from podio import root_io
+
+    f = root_io.Reader(fspath(file_path))
 
     # Get the list of events and determine the number of events
     events = f.get("events")
@@ -42,14 +129,8 @@ def main():
     # Print the total number of available events
     print(f"Total number of available events: {total_events}")
 
-    # List of collections we're interested in
-    collections_of_interest = ["SiTracksCT", "ClupatraTracks"]
-
     # Dictionary to store hit counts per collection
-    hit_counts = {collection: [] for collection in collections_of_interest}
-
-    # Flag to control printing
-    should_print_hits = args.mode == "print"
+    hit_counts = {collection: [] for collection in collections}
 
     # Iterate over each event in the file
     for event_index, e in enumerate(events, start=1):
@@ -59,7 +140,7 @@ def main():
             print(f"Event {event_number}:")
 
         # Loop over each collection of interest
-        for collection_name in collections_of_interest:
+        for collection_name in collections:
             try:
                 first_track = e.get(collection_name)[0]
                 n_tracker_hits = first_track.trackerHits_size()
@@ -79,9 +160,107 @@ def main():
                     print(f"  No tracks available in the {collection_name}")
                 hit_counts[collection_name].append(0)
 
+    return hit_counts
+
+
+def print_hit_count_summary(hit_counts: Dict[str, Dict]) -> None:
+    import numpy as np
+    from tabulate import tabulate
+
+    table_data = []
+    for collection, counts in hit_counts.items():
+        hits = counts["hits_per_track"]
+        table_data.append(
+            [
+                collection,
+                len(counts["tracks_per_event"]),
+                len(hits),
+                np.mean(counts["tracks_per_event"]) if len(counts["tracks_per_event"]) else 0,
+                np.mean(hits) if len(hits) else 0,
+                int(np.median(hits)) if len(hits) else 0,
+                int(hits.max()) if len(hits) else 0,
+            ]
+        )
+    print(
+        tabulate(
+            table_data,
+            headers=["Collection", "Events", "Tracks", "Tracks / Event", "Mean Hits", "Median Hits", "Max Hits"],
+            tablefmt="grid",
+            floatfmt=".2f",
+        )
+    )
+
+
+def main():
+    # Set up argument parser
+    parser = argparse.ArgumentParser(description="Process and display track hit data.")
+    parser.add_argument(
+        "--mode",
+        choices=["print", "plot"],
+        required=True,
+        help="Choose 'print' to display hit numbers, or 'plot' to show histograms.",
+    )
+    parser.add_argument(
+        "--inputFile",
+        "--inputFiles",
+        type=str,
+        nargs="+",
+        default=[fspath(inputFileDefault)],
+        help=(
+            "Specify the input file(s). If not provided, a default path "
+            "will be used: ~/promotion/code/ILDConfig/StandardConfig/production/data/muon_tracking_test_if1_REC.edm4hep.root"
+        ),
+    )
+    parser.add_argument(
+        "--reader",
+        choices=["columnar", "podio"],
+        default="columnar",
+        help="Read all tracks with uproot (default) or only the first track per event with the podio event loop (single file)",
+    )
+    parser.add_argument(
+        "--collections",
+        nargs="+",
+        default=TRACK_COLLECTIONS,
+        help="Track collections to analyse",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of files read in parallel, defaults to the number of cores",
+    )
+    parser.add_argument(
+        "--stepSize",
+        type=int,
+        default=DEFAULT_STEP_SIZE,
+        help="Number of events read per batch by the columnar reader",
+    )
+
+    args = parser.parse_args()
+
+    if args.reader == "podio":
+        if len(args.inputFile) > 1:
+            parser.error("The podio reader processes a single input file")
+        hit_counts = get_first_track_hit_counts_podio(
+            args.inputFile[0], args.collections, args.mode == "print"
+        )
+    else:
+        track_hit_counts = get_track_hit_counts_of_files(
+            args.inputFile, args.collections, args.workers, args.stepSize
+        )
+        if args.mode == "print":
+            print_hit_count_summary(track_hit_counts)
+        hit_counts = {
+            collection: counts["hits_per_track"]
+            for collection, counts in track_hit_counts.items()
+        }
+
     # Plot histograms if mode is 'plot'
     if args.mode == "plot":
+        import matplotlib.pyplot as plt
+
         for collection_name, counts in hit_counts.items():
+            if len(counts) == 0:
+                continue
             plt.figure()
             plt.hist(counts, bins=range(max(counts) + 2), alpha=0.75)
             plt.title(f"Histogram of Hit Counts for {collection_name}")
@@ -0,0 +1,370 @@
+"""
+Benchmark suite of the analysis hot paths on synthetic samples.
+
+A synthetic sample (see generate_synthetic_data.py) of the chosen size class is
+written to a temporary directory. The following steps are then timed on it:
+- reading the hits (`analyze_bs.get_hits`);
+- saving and loading the cache (`caching`) with the default codec, and decoding
+  it with each installed codec of `BENCHMARK_CACHE_CODECS`;
+- sharing the hits with the workers (`hit_store`) and attaching to them;
+- dividing the hits into layers (`divide_hits`);
+- binning the fine-grained density profiles (`density_profiles`);
+- scaling the hit rates (`scale_hits_dict`);
+- the coordinate transformation (`cartesian_to_spherical`);
+- creating the table (`create_table`) from the stored layer summaries (warm)
+  and after summarizing the `_pos.json` files (cold);
+- creating the histograms (`plotting`).
+
+For every step the median wall time over the repeats, the throughput in hits/s
+and the peak memory allocated during one extra traced run are reported. The cache
+loads also report the file size and the modelled cold load time from a storage
+with the bandwidth given by `--readBandwidth`, e.g. the dust storage.
+
+Results are appended to a JSON lines file together with the git commit, so
+trends across commits can be compared. `--compare` fails if a step became
+slower than in the latest run of another commit.
+
+The steps that need the detector geometry (divide_hits, density_profiles,
+scale_hits_dict, create_table, plotting) are skipped if the k4geo compact files can not be read.
+
+Usage:
+    python benchmark_analysis.py --sizes small medium --results benchmark_results.jsonl
+    python benchmark_analysis.py --sizes medium --results benchmark_results.jsonl --compare
+"""
+
+import argparse
+import copy
+import json
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import warnings
+from argparse import Namespace
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from generate_synthetic_data import (
+    get_layer_geometry,
+    get_synthetic_file_paths,
+    write_synthetic_file,
+)
+
+# bunch crossings, events per file and mean hits per event of the samples
+SIZE_CLASSES = {
+    "small": {"bunch_crossings": 1, "events_per_file": 20, "hits_per_event": 500},
+    "medium": {"bunch_crossings": 2, "events_per_file": 100, "hits_per_event": 2000},
+    "large": {"bunch_crossings": 4, "events_per_file": 250, "hits_per_event": 10000},
+}
+BENCHMARK_SCENARIO = "FCC240"
+BENCHMARK_BACKGROUND = "beamstrahlung"
+DEFAULT_TOLERANCE = 0.25
+# decoded by the cache_load_<codec> benchmarks, if their compressor is installed
+BENCHMARK_CACHE_CODECS = (
+    "pickle",
+    "float64+shuffle+zlib",
+    "float32+shuffle+zlib",
+    "float32+shuffle+lz4",
+    "float32+shuffle+zstd",
+    "float32+blosc-lz4",
+    "float32+shuffle+blosc-lz4",
+    "float32+shuffle+blosc-zstd",
+)
+DEFAULT_READ_BANDWIDTH = 100  # MB/s
+
+script_dir = Path(__file__).resolve().parent
+
+
+def get_git_commit() -> str:
+    result = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"], cwd=script_dir, capture_output=True, text=True
+    )
+    return result.stdout.strip() or "unknown"
+
+
+def count_hits(hits: Dict[str, Dict[str, np.ndarray]]) -> int:
+    return sum(len(observables["z"]) for observables in hits.values())
+
+
+def measure(function: Callable, repeats: int) -> Dict[str, float]:
+    """Median wall time of `function` over `repeats` runs and its peak traced memory."""
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+
+    # tracing slows down the allocations, so it gets a run of its own
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": statistics.median(durations), "peak_mb": peak / 2**20}
+
+
+def write_sample(sample_dir: Path, detector_model: str, size: Dict[str, int], seed: int) -> List[str]:
+    layers = get_layer_geometry(detector_model)
+    file_paths = []
+    for file_path, _ in get_synthetic_file_paths(
+        sample_dir,
+        [detector_model],
+        [BENCHMARK_SCENARIO],
+        size["bunch_crossings"],
+        1,
+        size["events_per_file"],
+    ):
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        write_synthetic_file(
+            file_path, detector_model, layers, size["events_per_file"], size["hits_per_event"], seed
+        )
+        file_paths.append(str(file_path))
+    return file_paths
+
+
+def get_benchmarks(file_paths, work_dir, detector_model, num_bX) -> Dict[str, Callable]:
+    """
+    Returns the benchmarked steps. Each step processes all hits of the sample;
+    the steps depending on the detector geometry are left out if it is not available.
+    """
+    from analyze_bs import get_hits
+    from caching import is_compressor_available, load_from_cache, save_to_cache
+    from hit_store import MEMORY_MAP_BACKEND, SharedHitStore, attach_hits, detach_hits
+    from utils import cartesian_to_spherical
+
+    hits = get_hits(file_paths, detector_model)
+    cache_file = work_dir / "cache.pkl"
+    save_to_cache(cache_file, hits)
+    positions = np.concatenate(
+        [np.column_stack([o["x"], o["y"], o["z"]]) for o in hits.values()]
+    )
+
+    benchmarks = {
+        "get_hits": lambda: get_hits(file_paths, detector_model),
+        "cache_save": lambda: save_to_cache(cache_file, hits),
+        "cache_load": lambda: load_from_cache(cache_file),
+        "cartesian_to_spherical": lambda: cartesian_to_spherical(positions),
+    }
+    # the mapped file of the attach benchmark is removed with the work directory
+    store_handle = SharedHitStore(hits, MEMORY_MAP_BACKEND, work_dir).handle
+
+    def attach_shared_hits():
+        attach_hits(store_handle)
+        detach_hits(store_handle)
+
+    benchmarks["hit_store_share"] = lambda: SharedHitStore(hits).close()
+    benchmarks["hit_store_attach"] = attach_shared_hits
+
+    for codec in BENCHMARK_CACHE_CODECS:
+        if codec != "pickle" and not is_compressor_available(codec.rsplit("+", 1)[-1]):
+            continue
+        codec_cache_file = work_dir / f"cache_{codec}.pkl"
+        save_to_cache(codec_cache_file, hits, codec)
+        benchmarks[f"cache_load_{codec}"] = lambda f=codec_cache_file: load_from_cache(f)
+
+    from create_table import create_table
+    from density_profiles import get_density_profiles
+    from get_hits_per_layer import divide_hits
+    from get_subdet_params import compile_geometry
+    from layer_summary import SUMMARY_SUBDIR_NAME
+    from plotting import plotting
+    from scale_hit_rate import scale_hits_dict
+
+    try:
+        compile_geometry(detector_model)
+    except OSError as e:
+        print(f"Skipping the geometry dependent benchmarks, k4geo not readable: {e}")
+        return benchmarks
+
+    import matplotlib
+    import matplotlib.pyplot as plt
+
+    matplotlib.use("Agg")
+    from combined_analysis import convert_to_serializable
+
+    divided_hits = divide_hits(hits, detector_model)
+    json_dir = work_dir / "json_data"
+    json_dir.mkdir(exist_ok=True)
+    with open(json_dir / f"{detector_model}_{BENCHMARK_SCENARIO}_pos.json", "w") as f:
+        json.dump(
+            {
+                "detector_model": detector_model,
+                "background": BENCHMARK_BACKGROUND,
+                "scenario": BENCHMARK_SCENARIO,
+                "num_bunch_crossings": num_bX,
+                "hits": convert_to_serializable(hits),
+            },
+            f,
+        )
+
+    table_args = Namespace(version=BENCHMARK_BACKGROUND, unit="occupancy")
+
+    def create_table_cold():
+        # without stored summaries the _pos.json files are summarized first
+        shutil.rmtree(work_dir / SUMMARY_SUBDIR_NAME, ignore_errors=True)
+        create_table(table_args, json_dir)
+
+    # an untimed run stores the summaries read by the warm benchmark
+    create_table(table_args, json_dir)
+
+    def run_plotting():
+        with warnings.catch_warnings():
+            # plt.show() of the non-interactive backend warns
+            warnings.simplefilter("ignore", UserWarning)
+            plotting(
+                copy.deepcopy(hits),
+                num_bX,
+                save_dir=work_dir / "plots",
+                make_theta_hist=True,
+                det_mod=detector_model,
+                scenario=BENCHMARK_SCENARIO,
+                background=BENCHMARK_BACKGROUND,
+            )
+        plt.close("all")
+
+    benchmarks.update(
+        {
+            "divide_hits": lambda: divide_hits(hits, detector_model),
+            "density_profiles": lambda: get_density_profiles(hits, detector_model),
+            "scale_hits_dict": lambda: scale_hits_dict(
+                divided_hits, BENCHMARK_SCENARIO, BENCHMARK_BACKGROUND, num_bX, detector_model
+            ),
+            "create_table_cold": create_table_cold,
+            "create_table_warm": lambda: create_table(table_args, json_dir),
+            "plotting": run_plotting,
+        }
+    )
+    return benchmarks
+
+
+def run_size_class(size_name, detector_model, repeats, seed, selected, read_bandwidth) -> List[Dict]:
+    size = SIZE_CLASSES[size_name]
+    results = []
+    with tempfile.TemporaryDirectory(prefix=f"bs_benchmark_{size_name}_") as tmp_dir:
+        work_dir = Path(tmp_dir)
+        file_paths = write_sample(work_dir / "sample", detector_model, size, seed)
+        benchmarks = get_benchmarks(file_paths, work_dir, detector_model, size["bunch_crossings"])
+
+        from analyze_bs import get_hits
+
+        n_hits = count_hits(get_hits(file_paths, detector_model))
+        for name, function in benchmarks.items():
+            if selected and name not in selected:
+                continue
+            result = {
+                "size": size_name,
+                "benchmark": name,
+                "hits": n_hits,
+                **measure(function, repeats),
+            }
+            result["hits_per_s"] = n_hits / result["seconds"] if result["seconds"] else float("inf")
+            cache_line = ""
+            if name.startswith("cache_load"):
+                result["file_mb"] = (work_dir / f"{name.replace('cache_load', 'cache')}.pkl").stat().st_size / 2**20
+                result["cold_load_s"] = result["seconds"] + result["file_mb"] / read_bandwidth
+                cache_line = f" {result['file_mb']:8.2f} MB file {result['cold_load_s'] * 1e3:9.1f} ms cold"
+            print(
+                f"{size_name:<7} {name:<37} {result['seconds'] * 1e3:9.1f} ms "
+                f"{result['hits_per_s']:12.3g} hits/s {result['peak_mb']:9.1f} MB{cache_line}"
+            )
+            results.append(result)
+    return results
+
+
+def load_results(results_file: Path) -> List[Dict]:
+    if not results_file.exists():
+        return []
+    with open(results_file, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def find_regressions(results, history, commit, tolerance) -> List[str]:
+    """Compares with the latest recorded result of another commit per size and benchmark."""
+    reference = {}
+    for record in history:
+        if record["commit"] != commit:
+            reference[(record["size"], record["benchmark"])] = record
+
+    regressions = []
+    for result in results:
+        previous = reference.get((result["size"], result["benchmark"]))
+        if previous and result["seconds"] > previous["seconds"] * (1 + tolerance):
+            regressions.append(
+                f"{result['size']} {result['benchmark']}: {result['seconds'] * 1e3:.1f} ms "
+                f"(commit {previous['commit']}: {previous['seconds'] * 1e3:.1f} ms)"
+            )
+    return regressions
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the analysis hot paths on synthetic samples"
+    )
+    parser.add_argument(
+        "--sizes", nargs="+", default=["small"], choices=SIZE_CLASSES.keys(), help="Size classes of the samples"
+    )
+    parser.add_argument(
+        "--benchmarks", nargs="+", help="Only run these benchmarks, e.g. get_hits divide_hits"
+    )
+    parser.add_argument("--detectorModel", default="ILD_FCCee_v01", help="Detector model of the sample")
+    parser.add_argument("--repeats", type=int, default=3, help="Number of timed runs, the median is reported")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic sample")
+    parser.add_argument(
+        "--readBandwidth",
+        type=float,
+        default=DEFAULT_READ_BANDWIDTH,
+        help="Read bandwidth of the cache storage in MB/s for the modelled cold cache loads",
+    )
+    parser.add_argument("--results", type=str, help="JSON lines file the results are appended to")
+    parser.add_argument(
+        "--compare",
+        action="store_true",
+        help="Fail if a benchmark is slower than the latest result of another commit in --results",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="Allowed relative increase of the wall time for --compare",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    commit = get_git_commit()
+    timestamp = datetime.now().isoformat(timespec="seconds")
+
+    results = []
+    for size_name in args.sizes:
+        results.extend(
+            run_size_class(
+                size_name, args.detectorModel, args.repeats, args.seed, args.benchmarks, args.readBandwidth
+            )
+        )
+    for result in results:
+        result.update({"commit": commit, "timestamp": timestamp, "detector_model": args.detectorModel})
+
+    if not args.results:
+        return
+
+    results_file = Path(args.results)
+    history = load_results(results_file)
+    with open(results_file, "a", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+
+    if args.compare:
+        regressions = find_regressions(results, history, commit, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Import-time benchmark of the command line entry points.
+
+For every entry point the cumulative import time reported by
+`python -X importtime` and the wall time of `<script> --help` are measured.
+The results can be stored as a JSON baseline; later runs compare against it
+and exit with a non-zero status if an entry point became noticeably slower,
+e.g. because a heavy module (uproot, matplotlib, pandas) is imported at
+module level again.
+
+Usage:
+    python benchmark_import_time.py --save import_times.json
+    python benchmark_import_time.py --baseline import_times.json
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ENTRY_POINTS = (
+    "simall",
+    "pipeline",
+    "combined_analysis",
+    "create_table",
+    "analyze_tracks",
+    "scan_geometry",
+    "field_map",
+)
+# --help has to return in well under a second on the login nodes
+DEFAULT_HELP_BUDGET = 1.0  # s
+DEFAULT_TOLERANCE = 0.5
+N_SLOWEST_IMPORTS = 5
+
+script_dir = Path(__file__).resolve().parent
+
+
+def parse_importtime(stderr: str, module: str):
+    """
+    Parses the `-X importtime` output into the cumulative import time of
+    `module` and the slowest imports below it (both in µs).
+    """
+    imports = []
+    cumulative = None
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if name.strip() == module and not name.startswith("  "):
+            cumulative = int(cumulative_us)
+        imports.append((name.strip(), int(self_us)))
+    slowest = sorted(imports, key=lambda item: item[1], reverse=True)[:N_SLOWEST_IMPORTS]
+    return cumulative, dict(slowest)
+
+
+def measure_entry_point(module: str, repeats: int):
+    """Returns the median import and --help times (s) and the slowest imports of a module."""
+    import_times = []
+    help_times = []
+    slowest = {}
+    for _ in range(repeats):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=script_dir,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+        cumulative, slowest = parse_importtime(result.stderr, module)
+        import_times.append(cumulative / 1e6)
+
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, f"{module}.py", "--help"],
+            cwd=script_dir,
+            capture_output=True,
+            check=True,
+        )
+        help_times.append(time.perf_counter() - start)
+
+    return {
+        "import_s": statistics.median(import_times),
+        "help_s": statistics.median(help_times),
+        "slowest_imports_us": slowest,
+    }
+
+
+def find_regressions(results, baseline, tolerance, help_budget):
+    regressions = []
+    for module, result in results.items():
+        if result["help_s"] > help_budget:
+            regressions.append(
+                f"{module}: --help took {result['help_s']:.2f} s (budget {help_budget:.2f} s)"
+            )
+        reference = baseline.get(module)
+        if reference and result["import_s"] > reference["import_s"] * (1 + tolerance):
+            regressions.append(
+                f"{module}: import took {result['import_s'] * 1e3:.0f} ms "
+                f"(baseline {reference['import_s'] * 1e3:.0f} ms)"
+            )
+    return regressions
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Measures the import and --help times of the command line entry points"
+    )
+    parser.add_argument(
+        "--entryPoints",
+        nargs="+",
+        default=ENTRY_POINTS,
+        choices=ENTRY_POINTS,
+        help="Entry points to benchmark",
+    )
+    parser.add_argument(
+        "--repeats", type=int, default=5, help="Number of runs, the median is reported"
+    )
+    parser.add_argument("--baseline", type=str, help="JSON file with earlier results to compare with")
+    parser.add_argument("--save", type=str, help="Store the results as JSON, e.g. as a new baseline")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="Allowed relative increase of the import time over the baseline",
+    )
+    parser.add_argument(
+        "--helpBudget",
+        type=float,
+        default=DEFAULT_HELP_BUDGET,
+        help="Maximum wall time of '<entry point> --help' in seconds",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+
+    results = {}
+    for module in args.entryPoints:
+        results[module] = measure_entry_point(module, args.repeats)
+        slowest = ", ".join(
+            f"{name} {us / 1e3:.0f} ms" for name, us in results[module]["slowest_imports_us"].items()
+        )
+        print(
+            f"{module:<20} import {results[module]['import_s'] * 1e3:6.0f} ms, "
+            f"--help {results[module]['help_s'] * 1e3:6.0f} ms  (slowest: {slowest})"
+        )
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    regressions = find_regressions(results, baseline, args.tolerance, args.helpBudget)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,341 @@
+"""
+Caching of the hits read by `get_hits`.
+
+The hits are stored column by column: each observable array is encoded
+with a column codec, e.g. "float32+shuffle+lz4":
+- it is converted to the stored dtype (optional, float32 halves the size at a
+  precision of ~1e-7 relative, i.e. < 1 µm on detector positions);
+- its bytes are shuffled (optional), which groups the slowly changing exponent
+  and high mantissa bytes and makes them compress well;
+- it is compressed (lz4, zstd, blosc-lz4, blosc-zstd, zlib, lzma or none).
+Decoding restores the original dtype, so the loaded hits look the same as
+the ones that were cached, apart from the precision of the stored dtype.
+
+The codec is chosen per deployment by the `bsCacheCodec` environment variable
+or the `codec` argument. It may differ per observable, e.g.
+"float32+shuffle+zstd,t=float64+shuffle+zstd" keeps the time in full
+precision. "pickle" writes the plain pickled arrays like before. Caches
+written with any codec, as well as older plain pickles, can always be loaded.
+"""
+
 import pickle
+import zlib
+from functools import lru_cache
+from os import getenv
 from pathlib import Path
-from typing import List, Tuple
+from typing import Callable, Dict, List, NamedTuple, Tuple
 
-from analyze_bs import get_hits, get_p_n_t
+import numpy as np
+
+from analyze_bs import HitSelection, get_hits, get_p_n_t
+from instrumentation import span
 from utils import split_pos_n_time
 
+CACHE_CODEC_ENV_VAR_NAME = "bsCacheCodec"
+CACHE_FORMAT = "bs_columns_v1"
+PICKLE_CODEC = "pickle"
+# the first codec whose compressor is installed is the default, all decode
+# faster than a float64 pickle of twice the size is read from the dust storage
+DEFAULT_CACHE_CODECS = (
+    "float32+shuffle+lz4",
+    "float32+shuffle+zstd",
+    "float32+shuffle+zlib",
+)
+ZSTD_LEVEL = 3
+ZLIB_LEVEL = 1
+
+
+def import_zstd():
+    import zstandard
+
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress, zstandard.ZstdDecompressor().decompress
+
+
+def import_lz4():
+    import lz4.frame
+
+    return lz4.frame.compress, lz4.frame.decompress
+
+
+def import_blosc(cname):
+    import blosc
+
+    # blosc shuffles by itself, the typesize is stored in its header
+    def compress(data, typesize=8):
+        return blosc.compress(data, typesize=typesize, clevel=5, shuffle=blosc.SHUFFLE, cname=cname)
+
+    return compress, blosc.decompress
+
+
+def import_zlib():
+    return (lambda data: zlib.compress(data, ZLIB_LEVEL)), zlib.decompress
+
+
+def import_lzma():
+    import lzma
+
+    return lzma.compress, lzma.decompress
+
+
+# compressor name: function importing its (compress, decompress) functions
+COMPRESSORS: Dict[str, Callable[[], Tuple[Callable, Callable]]] = {
+    "lz4": import_lz4,
+    "zstd": import_zstd,
+    "blosc-lz4": lambda: import_blosc("lz4"),
+    "blosc-zstd": lambda: import_blosc("zstd"),
+    "zlib": import_zlib,
+    "lzma": import_lzma,
+    "none": lambda: (bytes, bytes),
+}
+
+
+@lru_cache(maxsize=None)
+def get_compressor(name: str) -> Tuple[Callable, Callable]:
+    """
+    Returns the (compress, decompress) functions of a compressor.
+
+    Raises:
+        ValueError: If the compressor is unknown.
+        ImportError: If the package providing it is not installed.
+    """
+    if name not in COMPRESSORS:
+        raise ValueError(f"Unknown compressor '{name}', choose from {', '.join(COMPRESSORS)}")
+    return COMPRESSORS[name]()
+
+
+def is_compressor_available(name: str) -> bool:
+    try:
+        get_compressor(name)
+    except ImportError:
+        return False
+    return True
+
+
+class ColumnCodec(NamedTuple):
+    """Encoding of a single column: stored dtype (None keeps it), byte shuffle and compressor."""
+
+    dtype: str | None
+    shuffle: bool
+    compressor: str
+
+    @classmethod
+    def parse(cls, spec: str) -> "ColumnCodec":
+        """Parses e.g. "float32+shuffle+zstd", "shuffle+lz4" or "zlib"."""
+        *options, compressor = spec.strip().split("+")
+        dtype = None
+        if options and options[0] != "shuffle":
+            dtype = np.dtype(options.pop(0)).name
+        if options not in ([], ["shuffle"]):
+            raise ValueError(f"Invalid column codec '{spec}'")
+        get_compressor(compressor)
+        return cls(dtype, bool(options), compressor)
+
+    def __str__(self):
+        options = ([self.dtype] if self.dtype else []) + (["shuffle"] if self.shuffle else [])
+        return "+".join(options + [self.compressor])
+
+    def is_blosc(self) -> bool:
+        return self.compressor.startswith("blosc-")
+
+    def encode(self, array: np.ndarray) -> Dict:
+        array = np.ascontiguousarray(array)
+        stored = array.astype(self.dtype, copy=False) if self.dtype else array
+        compress, _ = get_compressor(self.compressor)
+        if self.is_blosc():
+            # a typesize of 1 disables the shuffle of blosc
+            data = compress(stored.tobytes(), stored.itemsize if self.shuffle else 1)
+        elif self.shuffle and stored.itemsize > 1:
+            data = compress(stored.view(np.uint8).reshape(-1, stored.itemsize).T.tobytes())
+        else:
+            data = compress(stored.tobytes())
+        return {
+            "codec": str(self),
+            "dtype": array.dtype.str,
+            "stored_dtype": stored.dtype.str,
+            "shape": array.shape,
+            "data": data,
+        }
+
+    @staticmethod
+    def decode(column: Dict) -> np.ndarray:
+        codec = ColumnCodec.parse(column["codec"])
+        _, decompress = get_compressor(codec.compressor)
+        stored_dtype = np.dtype(column["stored_dtype"])
+        buffer = decompress(column["data"])
+        if codec.shuffle and stored_dtype.itemsize > 1 and not codec.is_blosc():
+            stored = (
+                np.frombuffer(buffer, np.uint8).reshape(stored_dtype.itemsize, -1).T.copy().view(stored_dtype)
+            )
+        else:
+            stored = np.frombuffer(buffer, stored_dtype)
+        return stored.astype(column["dtype"], copy=False).reshape(column["shape"])
+
+
+class CacheCodec(NamedTuple):
+    """Column codecs of the cached hits: a default one and per observable overrides."""
+
+    default: ColumnCodec | None
+    observables: Dict[str, ColumnCodec]
+
+    @classmethod
+    def parse(cls, spec: str) -> "CacheCodec":
+        """Parses e.g. "float32+shuffle+zstd,t=float64+shuffle+zstd" or "pickle"."""
+        default, observables = None, {}
+        for part in spec.split(","):
+            observable, _, column_spec = part.rpartition("=")
+            if observable:
+                observables[observable.strip()] = ColumnCodec.parse(column_spec)
+            elif column_spec.strip() != PICKLE_CODEC:
+                default = ColumnCodec.parse(column_spec)
+        if default is None and observables:
+            raise ValueError(f"Codec '{spec}' has observable codecs but no default column codec")
+        return cls(default, observables)
+
+    def is_pickle(self) -> bool:
+        return self.default is None
+
+    def get_column_codec(self, observable: str) -> ColumnCodec:
+        return self.observables.get(observable, self.default)
+
+
+def get_cache_codec(spec: str | None = None) -> CacheCodec:
+    """
+    The codec given by `spec`, else by the `bsCacheCodec` environment variable,
+    else the first of `DEFAULT_CACHE_CODECS` whose compressor is installed.
+    """
+    spec = spec or getenv(CACHE_CODEC_ENV_VAR_NAME)
+    if spec:
+        return CacheCodec.parse(spec)
+    for default_spec in DEFAULT_CACHE_CODECS:
+        if is_compressor_available(default_spec.rsplit("+", 1)[-1]):
+            return CacheCodec.parse(default_spec)
+    return CacheCodec.parse(PICKLE_CODEC)
+
+
+def is_hits_dict(data) -> bool:
+    return isinstance(data, dict) and all(
+        isinstance(observables, dict)
+        and all(isinstance(array, np.ndarray) for array in observables.values())
+        for observables in data.values()
+    )
+
+
+def encode_hits(hits: Dict[str, Dict[str, np.ndarray]], codec: CacheCodec) -> Dict:
+    return {
+        "format": CACHE_FORMAT,
+        "hits": {
+            sub_det_key: {
+                observable: codec.get_column_codec(observable).encode(array)
+                for observable, array in observables.items()
+            }
+            for sub_det_key, observables in hits.items()
+        },
+    }
+
+
+def decode_hits(encoded: Dict) -> Dict[str, Dict[str, np.ndarray]]:
+    return {
+        sub_det_key: {
+            observable: ColumnCodec.decode(column) for observable, column in columns.items()
+        }
+        for sub_det_key, columns in encoded["hits"].items()
+    }
+
+
+def get_cache_filename(cache_dir, detector_model, scenario, num_bX, selection_tag=""):
+    """
+    Generate a unique cache filename based on the detector model, scenario, and number of bXs.
+    Hits read with a non-default `HitSelection` are cached under its tag.
+    """
+    return f"{cache_dir}/cache_{detector_model}_{scenario}_{num_bX}{selection_tag}.pkl"
 
-def get_cache_filename(cache_dir, detector_model, scenario, num_bX):
-    """Generate a unique cache filename based on the detector model, scenario, and number of bXs."""
-    return f"{cache_dir}/cache_{detector_model}_{scenario}_{num_bX}.pkl"
+
+def get_shard_cache_filename(cache_dir, detector_model, scenario, bX_identifier):
+    """Cache filename of the hits of a single bunch crossing."""
+    return f"{cache_dir}/shards/cache_{detector_model}_{scenario}_{bX_identifier}.pkl"
 
 
 def load_from_cache(cache_file):
-    """Load data from cache if it exists."""
+    """Load data from cache if it exists, column encoded hits are decoded."""
     if cache_file.exists():
         with cache_file.open("rb") as f:
-            return pickle.load(f)
+            data = pickle.load(f)
+        if isinstance(data, dict) and data.get("format") == CACHE_FORMAT:
+            return decode_hits(data)
+        return data
     return None
 
 
-def save_to_cache(cache_file, data):
-    """Save data to cache."""
+def save_to_cache(cache_file, data, codec: str | None = None):
+    """
+    Save data to cache. Hits are encoded column by column with the cache codec
+    (see `get_cache_codec`), other data, e.g. the legacy (pos, time) tuples, is pickled.
+    """
+    cache_codec = get_cache_codec(codec)
+    if not cache_codec.is_pickle() and is_hits_dict(data):
+        data = encode_hits(data, cache_codec)
     with cache_file.open("wb") as f:
-        pickle.dump(data, f)
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def ingest_shard(
+    cache_dir: str,
+    detector_model: str,
+    scenario: str,
+    bX_identifier: str,
+    file_paths: List[str],
+    codec: str | None = None,
+) -> None:
+    """
+    Reads the hits of a single bunch crossing and stores them in its cache
+    shard, so that it can be done as soon as the simulation of this bunch
+    crossing has finished. `codec` is the cache codec (see `get_cache_codec`).
+    A shard newer than all files of the bunch crossing is kept, so re-running
+    a pipeline only reads the bunch crossings that were (re-)simulated.
+    """
+    cache_file = Path(
+        get_shard_cache_filename(cache_dir, detector_model, scenario, bX_identifier)
+    )
+    if cache_file.exists() and cache_file.stat().st_mtime > max(
+        Path(file_path).stat().st_mtime for file_path in file_paths
+    ):
+        print(
+            f"Cache shard of Detector Model='{detector_model}', Scenario='{scenario}', {bX_identifier} is up to date."
+        )
+        return
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    save_to_cache(cache_file, get_hits(file_paths, detector_model), codec)
+
+    # combined caches of this combination are outdated now, including those of selections
+    prefix = f"cache_{detector_model}_{scenario}_"
+    for combined_cache in Path(cache_dir).glob(f"{prefix}*.pkl"):
+        if combined_cache.stem[len(prefix):].split("_sel")[0].isdigit():
+            combined_cache.unlink()
+
+    print(
+        f"Ingested {len(file_paths)} files of Detector Model='{detector_model}', Scenario='{scenario}', {bX_identifier}."
+    )
+
+
+def merge_shard_caches(
+    cache_dir: str, detector_model: str, scenario: str, bX_identifiers: List[str]
+) -> Dict[str, Dict[str, np.ndarray]] | None:
+    """Concatenates the cache shards of all bunch crossings, None if any shard is missing."""
+    shard_files = [
+        Path(get_shard_cache_filename(cache_dir, detector_model, scenario, bX))
+        for bX in bX_identifiers
+    ]
+    if not all(shard_file.exists() for shard_file in shard_files):
+        return None
+
+    shards = [load_from_cache(shard_file) for shard_file in shard_files]
+    return {
+        sub_det_key: {
+            observable_key: np.concatenate([shard[sub_det_key][observable_key] for shard in shards])
+            for observable_key in observables
+        }
+        for sub_det_key, observables in shards[0].items()
+    }
 
 
 def handle_cache_operations(
@@ -32,6 +345,9 @@ def handle_cache_operations(
     num_bX: int,
     file_paths: List[str],
     split_p_n_t: bool = False,
+    bX_identifiers: List[str] | None = None,
+    selection: HitSelection | None = None,
+    codec: str | None = None,
 ) -> Tuple:
     """
     Handles the loading of data from cache or computing and caching the data
@@ -43,6 +359,13 @@ def handle_cache_operations(
     - scenario (str): The scenario identifier.
     - num_bX (int): An integer representing number of something (e.g., positions).
     - file_paths (List[str]): List of file paths to process if cache is not available.
+    - bX_identifiers (List[str], optional): If the cache shards of all these bunch
+      crossings exist, they are merged instead of reading the files again.
+    - selection (HitSelection, optional): Reads only the selected observables,
+      events and hits; such hits are cached separately and never merged from
+      the (complete) cache shards.
+    - codec (str, optional): Cache codec of newly written caches, e.g.
+      "float32+shuffle+zstd"; defaults to the `bsCacheCodec` environment variable.
 
     Returns:
     - Tuple: A tuple containing the positions and time.
@@ -52,8 +375,12 @@ def handle_cache_operations(
     cache_dir_path = Path(cache_dir)
     cache_dir_path.mkdir(parents=True, exist_ok=True)
 
-    cache_file = Path(get_cache_filename(cache_dir, detector_model, scenario, num_bX))
-    cached_data = load_from_cache(cache_file)
+    selection = selection or HitSelection()
+    cache_file = Path(
+        get_cache_filename(cache_dir, detector_model, scenario, num_bX, selection.get_tag())
+    )
+    with span("load_cache"):
+        cached_data = load_from_cache(cache_file)
 
     if split_p_n_t:
         if cached_data is not None:
@@ -80,8 +407,17 @@ def handle_cache_operations(
         # TODO split_pos_n_time only because of legacy reasons, remove
         #pos, time = split_pos_n_time(get_p_n_t(file_paths, detector_model))
         #save_to_cache(cache_file, (pos, time))
-        hits = get_hits(file_paths, detector_model)
-        save_to_cache(cache_file, hits)
+        with span("merge_shards"):
+            hits = (
+                merge_shard_caches(cache_dir, detector_model, scenario, bX_identifiers)
+                if bX_identifiers and selection.is_default()
+                else None
+            )
+        if hits is None:
+            with span("read_files"):
+                hits = get_hits(file_paths, detector_model, selection)
+        with span("save_cache"):
+            save_to_cache(cache_file, hits, codec)
         print(
             f"Data loaded and cached for Detector Model='{detector_model}', Scenario='{scenario}'."
         )
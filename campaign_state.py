@@ -0,0 +1,157 @@
+"""
+Campaign state layer for resume-aware simall runs.
+
+Every planned shard of a campaign is recorded in a JSON state file in the
+campaign's output directory together with its input file and expected output.
+Re-running simall reuses the recorded plan, validates existing outputs (a
+readable `events` tree with the expected number of entries) and only the
+missing or corrupt shards are submitted again. Shards whose job is still
+queued or running according to its HTCondor log are not submitted twice;
+bsub jobs write no such log, their shards are submitted again with a warning.
+"""
+
+import json
+import os
+from dataclasses import asdict
+from pathlib import Path
+from typing import Dict, List
+
+from job_planner import PlannedJob, Shard
+
+CAMPAIGN_STATE_FILE_NAME = "campaign_state.json"
+# batch systems without a job log from which in-flight jobs can be detected
+BATCH_SYSTEMS_WITHOUT_JOB_LOG = ("bsub",)
+EDM4HEP_SUFFIX = ".edm4hep.root"
+
+
+def count_output_entries(output_file: Path) -> int | None:
+    """Returns the number of entries of the `events` tree or None if the file is unreadable."""
+    # only needed if outputs exist, keeps planning fast otherwise
+    import uproot
+
+    try:
+        with uproot.open(output_file) as f:
+            return f["events"].num_entries
+    # truncated or corrupt files fail in many different places of the deserialisation
+    except Exception:
+        return None
+
+
+def is_job_in_flight(log_path: Path) -> bool:
+    """
+    True if the HTCondor log of a job has more submit events than termination
+    and abort events, i.e. the job is still queued or running.
+    """
+    try:
+        text = Path(log_path).read_text(encoding="utf-8", errors="replace")
+    except OSError:
+        return False
+    submitted = text.count("Job submitted from host")
+    finished = text.count("Job terminated") + text.count("Job was aborted")
+    return submitted > finished
+
+
+class CampaignState:
+    """
+    Persistent record of the planned shards and validated outputs of a campaign.
+
+    The state is keyed by the bunch crossing output directory; the recorded
+    shards are reused as long as the set of input files and the planning
+    parameters (number of events, particles per event, target wall time) did
+    not change, so the output names stay stable even if the cost model is
+    recalibrated.
+    """
+
+    def __init__(self, state_file: Path):
+        self.state_file = Path(state_file)
+        self.state = {"directories": {}, "outputs": {}}
+        self.warned_undetectable_jobs = False
+        if self.state_file.exists():
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    def save(self) -> None:
+        tmp_file = self.state_file.with_suffix(".tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=4)
+        os.replace(tmp_file, self.state_file)
+
+    def get_planned_shards(
+        self, out_dir: Path, input_files: List[str], parameters: Dict
+    ) -> List[Shard] | None:
+        """The recorded shards, None if there are none or they were planned for other inputs or parameters."""
+        entry = self.state["directories"].get(str(out_dir))
+        if (
+            entry is None
+            or sorted(entry["input_files"]) != sorted(input_files)
+            or entry.get("parameters") != parameters
+        ):
+            return None
+        return [
+            Shard(**{**shard, "out_name": Path(shard["out_name"])})
+            for shard in entry["shards"]
+        ]
+
+    def record_planned_shards(
+        self, out_dir: Path, input_files: List[str], parameters: Dict, shards: List[Shard]
+    ) -> None:
+        self.state["directories"][str(out_dir)] = {
+            "input_files": list(input_files),
+            "parameters": parameters,
+            "shards": [{**asdict(s), "out_name": str(s.out_name)} for s in shards],
+        }
+
+    def record_submission(self, job: PlannedJob, batch_system: str) -> None:
+        """Remembers which job (and thus which log) of which batch system produces each output."""
+        for shard in job.shards:
+            record = self.state["outputs"].setdefault(self.get_output_file(shard), {})
+            record["job_name"] = str(job.name)
+            record["batch_system"] = batch_system
+
+    @staticmethod
+    def get_output_file(shard: Shard) -> str:
+        return str(shard.out_name.with_suffix(EDM4HEP_SUFFIX))
+
+    def is_output_complete(self, output_file: str, expected_entries: int) -> bool:
+        """
+        Validates an output file. The result is cached together with the
+        file's size and mtime so unchanged files are only opened once.
+        """
+        try:
+            stat = os.stat(output_file)
+        except FileNotFoundError:
+            return False
+
+        record: Dict = self.state["outputs"].setdefault(output_file, {})
+        if record.get("size") != stat.st_size or record.get("mtime") != stat.st_mtime:
+            record["size"] = stat.st_size
+            record["mtime"] = stat.st_mtime
+            record["entries"] = count_output_entries(Path(output_file))
+
+        return record["entries"] == expected_entries
+
+    def needs_submission(self, shard: Shard, max_events: int) -> bool:
+        """
+        False if the shard's output is complete or its job is still in flight
+        according to its HTCondor log. Jobs of the batch systems in
+        `BATCH_SYSTEMS_WITHOUT_JOB_LOG` (bsub) cannot be detected in flight,
+        their shards are submitted again until the output is complete.
+        """
+        output_file = self.get_output_file(shard)
+        expected_entries = min(shard.expected_events, max_events)
+        if self.is_output_complete(output_file, expected_entries):
+            return False
+
+        record = self.state["outputs"].get(output_file, {})
+        if "job_name" not in record:
+            return True
+        # records of campaigns before the batch system was recorded are from Condor jobs
+        if record.get("batch_system", "condor") in BATCH_SYSTEMS_WITHOUT_JOB_LOG:
+            if not self.warned_undetectable_jobs:
+                print(
+                    f"Warning: queued or running {record['batch_system']} jobs cannot be detected, "
+                    "their incomplete outputs are submitted again."
+                )
+                self.warned_undetectable_jobs = True
+            return True
+        return not is_job_in_flight(Path(f"{record['job_name']}.log"))
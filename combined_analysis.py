@@ -1,31 +1,33 @@
 import argparse
 from os import fspath, environ
 import json
+from datetime import datetime
 from pathlib import Path
-import numpy as np
-from tabulate import tabulate
 
 from analyze_available_data import parse_files, print_detector_info, sort_detector_data
-from caching import handle_cache_operations
+from data_inventory import DataInventory
 from det_mod_configs import (
     CHOICES_DETECTOR_MODELS,
     DEFAULT_DETECTOR_MODELS,
 )
+from instrumentation import RunReport, activate_report, span
 from platform_paths import (
     SIM_DATA_SUBDIR_NAME,
     get_home_directory,
     resolve_path_with_env,
 )
-from plotting import plotting
 from simall import CHOICES_SCENARIOS, DEFAULT_SCENARIOS, get_args
 
 show_plts = False
 SIM_DATA_SUBDIR_NAME = ""
+RUN_REPORT_SUBDIR_NAME = "run_reports"
 
+# The modes import their heavy dependencies (numpy, uproot via caching,
+# matplotlib via plotting) only when they run, so that the overview and
+# --help return quickly on the login nodes.
 
-def parse_arguments():
-    homeDir = get_home_directory()
 
+def parse_arguments():
     parser = argparse.ArgumentParser(
         description="Combined Analysis of Detector Model Files"
     )
@@ -39,8 +41,14 @@ def parse_arguments():
     parser.add_argument(
         "--mode",
         default="overview",
-        choices=["overview", "analysis", "ana_all"],
-        help="Mode of operation: overview, analysis, or ana_all",
+        choices=["overview", "analysis", "ana_all", "ingest"],
+        help="Mode of operation: overview, analysis, ana_all or ingest (reads the given bunch crossings into their cache shards)",
+    )
+    parser.add_argument(
+        "--bX",
+        nargs="+",
+        type=int,
+        help="Bunch crossing number(s) to ingest in the ingest mode",
     )
     parser.add_argument(
         "--detectorModel",
@@ -64,18 +72,69 @@ def parse_arguments():
     )
     parser.add_argument(
         "--cacheDir",
-        default=fspath(homeDir / "promotion/data/bs_cache_combined_analysis"),
         type=str,
-        help="Directory to store cache files",
+        help="Directory to store cache files (default: <home directory>/promotion/data/bs_cache_combined_analysis)",
+    )
+    parser.add_argument(
+        "--cacheCodec",
+        type=str,
+        help="Codec of newly written caches, e.g. 'float32+shuffle+zstd' or 'pickle' (default: $bsCacheCodec or the fastest installed)",
     )
     parser.add_argument(
         "--savePlots", action="store_true", help="If given, plots are stored."
     )
+    parser.add_argument(
+        "--tableOnly",
+        action="store_true",
+        help="Only read the observables needed for the hit rate tables and skip the density profiles and plots",
+    )
+    parser.add_argument(
+        "--cut",
+        nargs="+",
+        default=[],
+        help="Cuts applied while reading the hits, e.g. 't<10' '|z|<2200'",
+    )
+    parser.add_argument(
+        "--eventRange",
+        nargs=2,
+        type=int,
+        metavar=("START", "STOP"),
+        help="Only read the events START to STOP (exclusive) of each combination",
+    )
+    parser.add_argument(
+        "--timeSlices",
+        nargs="+",
+        type=float,
+        help="Edges of time slices (ns) the occupancy of the layers is resolved in, e.g. 0 5 20 100 inf",
+    )
+    parser.add_argument(
+        "--readoutWindows",
+        nargs="+",
+        type=float,
+        help="Lengths of readout windows (ns) the occupancy of the layers is computed for, including the pile-up of the bunch train",
+    )
+    parser.add_argument(
+        "--bunchSpacing",
+        type=float,
+        help="Bunch spacing (ns) of the readout windows (default: known spacing of the scenario, else single crossings)",
+    )
+    parser.add_argument(
+        "--runReport",
+        action="store_true",
+        help="Time the stages of each analysed combination and write a JSON/CSV run report",
+    )
+    parser.add_argument(
+        "--rescanInventory",
+        action="store_true",
+        help="Ignore the inventory manifest and list the whole data directory again",
+    )
 
     return parser.parse_args()
 
 def convert_to_serializable(obj):
     """Recursively convert NumPy arrays to lists for JSON serialization."""
+    import numpy as np
+
     if isinstance(obj, np.ndarray):
         return obj.tolist()
     elif isinstance(obj, dict):
@@ -85,8 +144,81 @@ def convert_to_serializable(obj):
     else:
         return obj
 
-def analyze_combination(directory, detector_model, scenario, detector_data, args):
+def get_bX_identifier(bX_number):
+    return f"bX_{str(bX_number).zfill(4)}"
+
+
+def get_bX_file_paths(directory, detector_model, scenario, bX_number):
+    """Simulated files of one bunch crossing, following the simall naming scheme."""
+    return [
+        fspath(p)
+        for p in directory.glob(
+            f"{detector_model}/{scenario}_{bX_number}/{detector_model}-{scenario}-{get_bX_identifier(bX_number)}-nEvts_*-part_*.edm4hep.root"
+        )
+    ]
+
+
+def ingest_bunch_crossings(directory, detector_model, scenario, bX_numbers, args):
+    """Ingests single bunch crossings into their cache shards, e.g. right after their simulation."""
+    from caching import ingest_shard
+
+    for bX_number in bX_numbers:
+        file_paths = get_bX_file_paths(directory, detector_model, scenario, bX_number)
+        if not file_paths:
+            raise ValueError(
+                f"No files found for Detector Model='{detector_model}', Scenario='{scenario}', bX={bX_number}"
+            )
+        ingest_shard(
+            args.cacheDir,
+            detector_model,
+            scenario,
+            get_bX_identifier(bX_number),
+            file_paths,
+            codec=args.cacheCodec,
+        )
+
+
+def get_hit_selection(args):
+    """The observables, cuts and events to read according to the arguments."""
+    from analyze_bs import ALL_OBSERVABLES, HitSelection, parse_cut
+
+    observables = ALL_OBSERVABLES
+    if args.tableOnly:
+        from get_hits_per_layer import TABLE_OBSERVABLES
+
+        observables = TABLE_OBSERVABLES
+        if args.timeSlices or args.readoutWindows:
+            observables = {key: values + ("t",) for key, values in TABLE_OBSERVABLES.items()}
+    entry_start, entry_stop = args.eventRange or (None, None)
+    return HitSelection(
+        observables, tuple(parse_cut(cut) for cut in args.cut), entry_start, entry_stop
+    )
+
+
+def analyze_time_occupancy(directory, detector_model, scenario, divided_hits, summary, args):
+    """Occupancy of the layers in the --timeSlices and --readoutWindows, printed and stored in `time_data`."""
+    import numpy as np
+
+    from layer_summary import write_summary
+    from time_occupancy import BUNCH_SPACINGS, get_time_file_path, get_time_occupancy, print_time_occupancy
+
+    bunch_spacing = args.bunchSpacing or BUNCH_SPACINGS.get(scenario, np.inf)
+    if args.readoutWindows:
+        print(f"Readout windows with a bunch spacing of {bunch_spacing:g} ns")
+    columns = get_time_occupancy(
+        divided_hits, summary, args.timeSlices or (), args.readoutWindows or (), bunch_spacing
+    )
+    print_time_occupancy(columns)
+    write_summary(get_time_file_path(directory, detector_model, scenario), columns)
+
+
+def analyze_combination(directory, detector_model, scenario, detector_data, inventory, args):
     """Analyze a specific combination of detector model and scenario."""
+    with span("import_modules"):
+        from tabulate import tabulate
+
+        from caching import handle_cache_operations
+        from plotting import plot_density_profiles, plotting
 
     if (
         detector_model not in detector_data
@@ -102,13 +234,11 @@ def analyze_combination(directory, detector_model, scenario, detector_data, args
     # Determine the number of bunch crossings
     num_bX = len(bX_identifiers)
 
-    # Prepare file paths
+    # Prepare file paths from the inventory instead of globbing the tree again
     file_paths = [
-        fspath(p)
-        for i, bX_identifier in enumerate(bX_identifiers)
-        for p in directory.glob(
-            f"{detector_model}/{scenario}_{i+1}/{detector_model}-{scenario}-{bX_identifier}-nEvts_*-part_*.edm4hep.root"
-        )
+        file_path
+        for bX_identifier in bX_identifiers
+        for file_path in inventory.get_file_paths(detector_model, scenario, bX_identifier)
     ]
 
     # Print current combination in a grid table format
@@ -121,10 +251,19 @@ def analyze_combination(directory, detector_model, scenario, detector_data, args
         )
     )
 
-    # Get the position and time arrays including caching operations
-    hits = handle_cache_operations(
-        args.cacheDir, detector_model, scenario, num_bX, file_paths
-    )
+    # Get the position and time arrays including caching operations,
+    # already ingested cache shards are merged instead of reading the files
+    with span("handle_cache_operations"):
+        hits = handle_cache_operations(
+            args.cacheDir,
+            detector_model,
+            scenario,
+            num_bX,
+            file_paths,
+            bX_identifiers=list(bX_identifiers),
+            selection=get_hit_selection(args),
+            codec=args.cacheCodec,
+        )
 
     # Ensure the json_data directory exists
     json_data_dir = directory / "json_data"
@@ -134,42 +273,115 @@ def analyze_combination(directory, detector_model, scenario, detector_data, args
     json_file_path = json_data_dir / f"{detector_model}_{scenario}_pos.json"
     dtDir = Path(environ["dtDir"])
 
-    data_to_save = {
-    "detector_model": detector_model,
-    "background": args.background,
-    "scenario": scenario,
-    "num_bunch_crossings": num_bX,
-    "hits": convert_to_serializable(hits),
-    }
+    with span("json_export"):
+        with span("convert_to_serializable"):
+            data_to_save = {
+            "detector_model": detector_model,
+            "background": args.background,
+            "scenario": scenario,
+            "num_bunch_crossings": num_bX,
+            "hits": convert_to_serializable(hits),
+            }
+
+        # Save the dictionary to a JSON file
+        with span("write_json"), open(json_file_path, "w") as json_file:
+            json.dump(data_to_save, json_file, indent=4)
+
+    # per-layer counts and rates, so the tables never need to read the hits again
+    with span("layer_summary"):
+        from get_hits_per_layer import divide_hits
+        from layer_summary import get_layer_summary, get_summary_file_path, write_summary
+
+        divided_hits = divide_hits(hits, detector_model)
+        summary = get_layer_summary(divided_hits, scenario, args.background, num_bX, detector_model)
+        write_summary(get_summary_file_path(directory, detector_model, scenario), summary)
 
-    # Save the dictionary to a JSON file
-    with open(json_file_path, "w") as json_file:
-        json.dump(data_to_save, json_file, indent=4)
+    if args.timeSlices or args.readoutWindows:
+        with span("time_occupancy"):
+            analyze_time_occupancy(directory, detector_model, scenario, divided_hits, summary, args)
 
+    if args.tableOnly:
+        return
 
-    plotting(
-        hits,
-        num_bX,  # Pass the number of bunch crossings
-        show_plts,
-        save_plots=args.savePlots,
-        save_dir=directory / "bp_plots",
-        make_theta_hist=True,
-        scenario=scenario,
-        det_mod=detector_model,
-        background=args.background,
+    # fine-grained hit density over r (barrels) and |z| (endcaps), e.g. to place layers
+    with span("density_profiles"):
+        from density_profiles import get_density_profiles, get_profiles_file_path, write_profiles
+        from scale_hit_rate import scale_sr_hits
+
+        scale_factor = scale_sr_hits(1, scenario, args.background)
+        profiles = get_density_profiles(hits, detector_model)
+        write_profiles(get_profiles_file_path(directory, detector_model, scenario), profiles, scale_factor, num_bX)
+
+    with span("plotting"):
+        plotting(
+            hits,
+            num_bX,  # Pass the number of bunch crossings
+            show_plts,
+            save_plots=args.savePlots,
+            save_dir=directory / "bp_plots",
+            make_theta_hist=True,
+            scenario=scenario,
+            det_mod=detector_model,
+            background=args.background,
+        )
+        plot_density_profiles(
+            profiles,
+            scale_factor,
+            num_bX,
+            show_plts,
+            save_plots=args.savePlots,
+            save_dir=directory / "bp_plots",
+            det_mod=detector_model,
+            scenario=scenario,
+        )
+
+
+def analyze_combination_with_report(directory, detector_model, scenario, detector_data, inventory, args):
+    """
+    Runs `analyze_combination`, with --runReport its stages are timed and the
+    report is written to `<directory>/run_reports`.
+    """
+    if not args.runReport:
+        analyze_combination(directory, detector_model, scenario, detector_data, inventory, args)
+        return
+
+    report = RunReport(
+        f"{detector_model}_{scenario}_{datetime.now():%Y%m%d_%H%M%S}",
+        {"detector_model": detector_model, "scenario": scenario, "version": args.version},
     )
+    activate_report(report)
+    try:
+        with span("analyze_combination"):
+            analyze_combination(directory, detector_model, scenario, detector_data, inventory, args)
+    finally:
+        activate_report(None)
+        report.print_summary()
+        print(f"Run report written to {report.write(directory / RUN_REPORT_SUBDIR_NAME)}")
 
 
 def main():
     args = get_args(parse_arguments)
+    # resolving the home directory identifies the machine, only done when needed
+    if args.cacheDir is None:
+        args.cacheDir = fspath(get_home_directory() / "promotion/data/bs_cache_combined_analysis")
     # if only version name provided, expanded the path based on 'dtDir' var
     directory = resolve_path_with_env(
         Path(SIM_DATA_SUBDIR_NAME) / args.version, "dtDir"
     )
     print(directory)
 
-    # Parse the files to gather detector data and sort the keys
-    parsed_data = parse_files(directory)
+    if args.mode == "ingest":
+        if not args.bX:
+            raise ValueError("The ingest mode needs the bunch crossing(s) given by --bX")
+        for detector_model in args.detectorModel:
+            for scenario in args.scenario:
+                ingest_bunch_crossings(directory, detector_model, scenario, args.bX, args)
+        return
+
+    # Parse the files to gather detector data and sort the keys,
+    # only directories changed since the last run are listed again
+    inventory = DataInventory(directory).refresh(force_rescan=args.rescanInventory)
+    parsed_data = parse_files(directory, inventory)
     detector_data = sort_detector_data(parsed_data)
 
     if args.mode == "overview":
@@ -184,16 +396,16 @@ def main():
             if detector_model in detector_data:
                 for scenario in scenarios:
                     if scenario in detector_data[detector_model]:
-                        analyze_combination(
-                            directory, detector_model, scenario, detector_data, args
+                        analyze_combination_with_report(
+                            directory, detector_model, scenario, detector_data, inventory, args
                         )
 
     elif args.mode == "ana_all":
         # Analyze all combinations of detector models and scenarios
         for detector_model, scenario_list in detector_data.items():
             for scenario in scenario_list.keys():
-                analyze_combination(
-                    directory, detector_model, scenario, detector_data, args
+                analyze_combination_with_report(
+                    directory, detector_model, scenario, detector_data, inventory, args
                 )
 
 
@@ -0,0 +1,344 @@
+"""
+Resolution of the `<constant>` definitions of DD4hep compact files (k4geo).
+
+A compact file and all files it includes are read into a `CompactTree`, every
+file is parsed only once per process. Its constants are resolved by a
+`ConstantTable`:
+- every expression is parsed once, into a number directly for the common
+  "<number>*<unit>" form, otherwise into postfix steps of numbers, names,
+  operators and math functions;
+- references to other constants are resolved in topological order, no matter
+  in which order or file the constants are defined, and each value is only
+  computed once;
+- units are the `g4units` symbols, so all lengths are given in mm, next to
+  the evaluator's constants pi, twopi, e, ...
+
+    constants = ConstantTable(read_compact_tree(compact_file).constants)
+    constants["VertexBarrel_r1"]                # 13.0
+    constants.evaluate("VertexBarrel_r1 + 2*mm")  # 15.0
+"""
+
+import math
+import operator
+import re
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Mapping, Tuple
+
+import numpy as np
+
+import g4units
+
+# the standard constants of the DD4hep (CLHEP) evaluator, e.g. for angles like 2*pi/N
+MATH_CONSTANTS = {
+    "pi": math.pi,
+    "twopi": 2 * math.pi,
+    "halfpi": math.pi / 2,
+    "pi2": math.pi**2,
+    "e": math.e,
+    "gamma": 0.577215664901532861,
+}
+UNIT_SYMBOLS = {
+    **MATH_CONSTANTS,
+    **{
+        name: value
+        for name, value in vars(g4units).items()
+        if not name.startswith("_") and isinstance(value, (int, float))
+    },
+}
+FUNCTIONS = {
+    name: getattr(math, name)
+    for name in ("sqrt", "sin", "cos", "tan", "asin", "acos", "atan", "atan2", "exp", "log", "pow", "fabs")
+}
+# operator: (precedence, right associative, function)
+BINARY_OPERATORS = {
+    "+": (1, False, operator.add),
+    "-": (1, False, operator.sub),
+    "*": (2, False, operator.mul),
+    "/": (2, False, operator.truediv),
+    "^": (4, True, operator.pow),
+}
+UNARY_OPERATORS = {"+": operator.pos, "-": operator.neg}
+UNARY_PRECEDENCE = 3
+TOKEN = re.compile(
+    r"\s*(?:(?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)"
+    r"|(?P<function>[A-Za-z_]\w*)(?=\s*\()|(?P<name>[A-Za-z_]\w*)"
+    r"|(?P<operator>\*\*|[-+*/^])|(?P<symbol>[(),]))"
+)
+# "<number>" or "<number>*<symbol>", most constants are of this form
+SIMPLE_EXPRESSION = re.compile(
+    r"^\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*(?:\*\s*([A-Za-z_]\w*))?\s*$"
+)
+# kinds of the steps of a compiled expression
+NUMBER, NAME, UNARY, BINARY, CALL = range(5)
+
+
+class ConstantResolutionError(ValueError):
+    """Raised if a constant is invalid, references an unknown name or depends on itself."""
+
+
+def compile_expression(text: str) -> Tuple[Tuple, frozenset]:
+    """
+    Compiles an expression of numbers, names, + - * / ^ (or **), parentheses
+    and the `FUNCTIONS` into postfix steps (shunting-yard), which are cheaper to
+    evaluate than Python code and can not do anything else.
+
+    Returns:
+    - Tuple: The steps for `evaluate_steps` and the names the expression references.
+
+    Raises:
+        ConstantResolutionError: If it is not a valid expression.
+    """
+    steps, pending, arg_counts, names = [], [], [], set()
+    expect_operand = True
+    position = 0
+    text = text.strip()
+
+    def pop_pending():
+        kind, value = pending.pop()
+        steps.append((kind, value) if kind != CALL else (CALL, (value, arg_counts.pop())))
+
+    while position < len(text):
+        match = TOKEN.match(text, position)
+        if not match or match.end() == position:
+            raise ConstantResolutionError(f"Invalid expression: {text}")
+        position = match.end()
+        token = match.lastgroup
+        value = match[token]
+
+        if token in ("number", "name") and expect_operand:
+            steps.append((NUMBER, float(value)) if token == "number" else (NAME, value))
+            if token == "name":
+                names.add(value)
+            expect_operand = False
+        elif token == "function" and expect_operand and value in FUNCTIONS:
+            pending.append((CALL, value))
+            arg_counts.append(1)
+        elif token == "operator" and expect_operand and value in UNARY_OPERATORS:
+            pending.append((UNARY, value))
+        elif token == "operator" and not expect_operand:
+            value = "^" if value == "**" else value
+            precedence, right_associative, _ = BINARY_OPERATORS[value]
+            while pending and pending[-1][0] in (UNARY, BINARY):
+                kind, top = pending[-1]
+                top_precedence = UNARY_PRECEDENCE if kind == UNARY else BINARY_OPERATORS[top][0]
+                if top_precedence < precedence or (top_precedence == precedence and right_associative):
+                    break
+                pop_pending()
+            pending.append((BINARY, value))
+            expect_operand = True
+        elif value == "(" and expect_operand:
+            pending.append(("(", None))
+        elif value in ",)" and not expect_operand:
+            while pending and pending[-1][0] != "(":
+                pop_pending()
+            if not pending:
+                raise ConstantResolutionError(f"Unbalanced parentheses: {text}")
+            if value == ",":
+                if len(pending) < 2 or pending[-2][0] != CALL:
+                    raise ConstantResolutionError(f"Invalid expression: {text}")
+                arg_counts[-1] += 1
+                expect_operand = True
+            else:
+                pending.pop()
+                if pending and pending[-1][0] == CALL:
+                    pop_pending()
+        else:
+            raise ConstantResolutionError(f"Invalid expression: {text}")
+
+    if expect_operand:
+        raise ConstantResolutionError(f"Invalid expression: {text}")
+    while pending:
+        if pending[-1][0] == "(":
+            raise ConstantResolutionError(f"Unbalanced parentheses: {text}")
+        pop_pending()
+    return tuple(steps), frozenset(names)
+
+
+def evaluate_steps(steps: Tuple, namespace: Dict[str, float]) -> float:
+    """Evaluates the postfix steps of `compile_expression` with the values of the names in `namespace`."""
+    stack = []
+    for kind, value in steps:
+        if kind == NUMBER:
+            stack.append(value)
+        elif kind == NAME:
+            stack.append(namespace[value])
+        elif kind == BINARY:
+            right = stack.pop()
+            stack.append(BINARY_OPERATORS[value][2](stack.pop(), right))
+        elif kind == UNARY:
+            stack.append(UNARY_OPERATORS[value](stack.pop()))
+        else:
+            function, arg_count = value
+            args = stack[-arg_count:]
+            del stack[-arg_count:]
+            stack.append(FUNCTIONS[function](*args))
+    return float(stack[0])
+
+
+class ConstantTable(Mapping):
+    """
+    Values of the constants (name: expression) of a compact tree, resolved on
+    first lookup together with the constants they depend on.
+
+    Parameters:
+    - expressions (Dict[str, str]): Expressions of the constants.
+    - symbols (Dict[str, float], optional): Predefined symbols, the `MATH_CONSTANTS` and `g4units` units by default.
+    """
+
+    def __init__(self, expressions: Dict[str, str], symbols: Dict[str, float] | None = None):
+        self._expressions = expressions
+        self._symbols = UNIT_SYMBOLS if symbols is None else symbols
+        self._values: Dict[str, float] = {}
+        # a number or the postfix steps of each parsed constant, and the names it references
+        self._compiled: Dict[str, Tuple[float | Tuple, frozenset]] = {}
+        # the values of the symbols and resolved constants the expressions reference
+        self._namespace = dict(self._symbols)
+
+    def __getitem__(self, name: str) -> float:
+        if name in self._values:
+            return self._values[name]
+        if name not in self._expressions:
+            raise KeyError(name)
+        self._resolve(name)
+        return self._values[name]
+
+    def __iter__(self):
+        return iter(self._expressions)
+
+    def __len__(self):
+        return len(self._expressions)
+
+    def __contains__(self, name) -> bool:
+        return name in self._expressions
+
+    def _parse(self, name: str) -> Tuple[float | Tuple, frozenset]:
+        if name not in self._compiled:
+            expression = self._expressions[name]
+            match = SIMPLE_EXPRESSION.match(expression)
+            if match and (match[2] is None or (match[2] in self._symbols and match[2] not in self._expressions)):
+                value = float(match[1]) * (self._symbols[match[2]] if match[2] else 1)
+                self._compiled[name] = (value, frozenset())
+            else:
+                try:
+                    self._compiled[name] = compile_expression(expression)
+                except ConstantResolutionError as e:
+                    raise ConstantResolutionError(f"Constant '{name}': {e}") from e
+        return self._compiled[name]
+
+    def _get_references(self, name: str) -> List[str]:
+        _, names = self._parse(name)
+        unknown = [n for n in names if n not in self._expressions and n not in self._symbols]
+        if unknown:
+            raise ConstantResolutionError(f"Constant '{name}' references unknown {', '.join(sorted(unknown))}")
+        return [n for n in names if n in self._expressions and n not in self._values]
+
+    def _resolve(self, name: str) -> None:
+        """Evaluates `name` after all unresolved constants it depends on (depth-first topological order)."""
+        in_progress = {name}
+        stack = [(name, iter(self._get_references(name)))]
+        while stack:
+            current, references = stack[-1]
+            reference = next(references, None)
+            if reference is None:
+                stack.pop()
+                in_progress.discard(current)
+                self._evaluate(current)
+            elif reference in in_progress:
+                cycle = [entry for entry, _ in stack] + [reference]
+                raise ConstantResolutionError(f"Circular constant definition: {' -> '.join(cycle)}")
+            elif reference not in self._values:
+                in_progress.add(reference)
+                stack.append((reference, iter(self._get_references(reference))))
+
+    def _evaluate(self, name: str) -> None:
+        value, _ = self._parse(name)
+        if not isinstance(value, float):
+            try:
+                value = evaluate_steps(value, self._namespace)
+            except (ArithmeticError, ValueError, TypeError) as e:
+                raise ConstantResolutionError(f"Constant '{name}' = {self._expressions[name]}: {e}") from e
+        self._values[name] = self._namespace[name] = value
+
+    def evaluate(self, expression: str) -> float:
+        """Evaluates an expression referencing the constants, e.g. an attribute of a detector element."""
+        steps, names = compile_expression(expression)
+        for name in names:
+            if name not in self._expressions and name not in self._symbols:
+                raise ConstantResolutionError(f"Expression '{expression}' references unknown {name}")
+            if name in self._expressions and name not in self._values:
+                self._resolve(name)
+        return evaluate_steps(steps, self._namespace)
+
+    def get_values(self, names: Iterable[str]) -> np.ndarray:
+        return np.array([self[name] for name in names], dtype=float)
+
+    def get_prefixed(self, prefix: str) -> np.ndarray:
+        """Values of the constants starting with `prefix`, in the order of the compact files."""
+        return self.get_values(name for name in self._expressions if name.startswith(prefix))
+
+    def resolve_all(self) -> Dict[str, float]:
+        """Values of all constants, those that can not be resolved are left out."""
+        for name in self._expressions:
+            if name in self._values:
+                continue
+            try:
+                self._resolve(name)
+            except ConstantResolutionError:
+                continue
+        return dict(self._values)
+
+
+@dataclass
+class CompactTree:
+    """Constants (name: expression, in file order) and detector elements of a compact file and its includes."""
+
+    constants: Dict[str, str] = field(default_factory=dict)
+    detectors: Dict[str, ET.Element] = field(default_factory=dict)
+    files: List[Path] = field(default_factory=list)
+
+
+@lru_cache(maxsize=None)
+def parse_compact_file(compact_file: Path) -> Tuple[Tuple, ...]:
+    """
+    The includes, constants and detectors of a single compact file in document order:
+    ("include", path), ("constant", name, expression) or ("detector", name, element).
+    """
+    entries = []
+    for element in ET.parse(compact_file).getroot().iter():
+        if element.tag == "include" and element.get("ref"):
+            entries.append(("include", (compact_file.parent / element.get("ref")).resolve()))
+        elif element.tag == "constant" and element.get("type", "number") == "number":
+            name, value = element.get("name"), element.get("value")
+            if name is not None and value is not None:
+                entries.append(("constant", name, value))
+        elif element.tag == "detector" and element.get("name"):
+            entries.append(("detector", element.get("name"), element))
+    return tuple(entries)
+
+
+def read_compact_tree(compact_file: Path, tree: CompactTree | None = None) -> CompactTree:
+    """
+    Reads a compact file and, in place, the files of its `<include ref=...>` elements,
+    which are relative to the including file.
+
+    Raises:
+        FileNotFoundError: If the compact file or an included file does not exist.
+    """
+    tree = tree or CompactTree()
+    compact_file = Path(compact_file).resolve()
+    if compact_file in tree.files:
+        return tree
+    tree.files.append(compact_file)
+
+    for kind, *entry in parse_compact_file(compact_file):
+        if kind == "include":
+            read_compact_tree(entry[0], tree)
+        elif kind == "constant":
+            # a constant defined twice keeps its first definition
+            tree.constants.setdefault(entry[0], entry[1])
+        else:
+            tree.detectors[entry[0]] = entry[1]
+    return tree
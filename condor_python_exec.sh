@@ -0,0 +1,6 @@
+#!/bin/bash
+# runs one of the analysis scripts of this repository as a Condor job
+source ${codeDir}/beamStrahlung/env_setup.sh
+cd ${codeDir}/beamStrahlung
+echo python "$@"
+python "$@"
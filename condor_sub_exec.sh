@@ -1,9 +1,24 @@
 #!/bin/bash
 source ${codeDir}/beamStrahlung/env_setup.sh
 n=90
-printf '*%.0s' $(seq 1 $n); printf '\n'
-echo ddsim "$@"
-printf '*%.0s' $(seq 1 $n); printf '\n'
-echo ${K4GEO}
-printf '*%.0s' $(seq 1 $n); printf '\n'
-ddsim "$@"
+
+run_ddsim() {
+    printf '*%.0s' $(seq 1 $n); printf '\n'
+    echo ddsim "$@"
+    printf '*%.0s' $(seq 1 $n); printf '\n'
+    echo ${K4GEO}
+    printf '*%.0s' $(seq 1 $n); printf '\n'
+    ddsim "$@" || exit $?
+}
+
+# several shards can be packed into one job, their arguments are separated by ':::'
+args=()
+for arg in "$@"; do
+    if [ "$arg" = ":::" ]; then
+        run_ddsim "${args[@]}"
+        args=()
+    else
+        args+=("$arg")
+    fi
+done
+run_ddsim "${args[@]}"
@@ -1,11 +1,13 @@
-import json
-from tabulate import tabulate
 import argparse
 import os
 from pathlib import Path
-import pandas as pd
-from get_hits_per_layer import divide_hits
-from scale_hit_rate import scale_hits_dict
+
+# pandas, tabulate and the geometry modules (which read the compact files on
+# import) are only imported once the arguments are parsed
+
+COMPARISON_KEYS = ["Detector Model", "Subdetector", "layer", "Scenario"]
+# format: file suffix
+COMPARISON_FORMATS = {"markdown": ".md", "latex": ".tex", "csv": ".csv"}
 
 def parse_arguments():
     parser = argparse.ArgumentParser(
@@ -22,58 +24,69 @@ def parse_arguments():
         "--unit",
         type=str,
         default="occupancy",
-        choices=("per_bx", "per_bx_per_mm", "occupancy"),
-        help="The units the values in the table will be given in. Occupancy values are given as percentages"
+        choices=("per_bx", "per_bx_per_mm", "occupancy", "module_occupancy"),
+        help="The units the values in the table will be given in. Occupancy values are given as percentages, module_occupancy is that of the hottest readout module of a layer"
+    )
+    parser.add_argument(
+        "--compareTo",
+        nargs="+",
+        type=str,
+        help="Versions / backgrounds compared to --version: their hit rates, ratios and differences to --version are tabulated",
+    )
+    parser.add_argument(
+        "--formats",
+        nargs="+",
+        default=list(COMPARISON_FORMATS),
+        choices=COMPARISON_FORMATS,
+        help="Formats of the comparison table files",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        help="Path of the comparison table files without suffix (default: $dtDir/comparison_<version>_<unit>)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of processes loading the summaries of the versions (default: number of CPUs)",
     )
     return parser.parse_args()
 
-args = parse_arguments()
-
-dt_dir = os.environ["dtDir"]  # Raises KeyError if not set — use .get() if you want a fallback
-
-# Construct the json_dir path
-json_dir = Path(dt_dir) / args.version / "json_data"
+def get_json_dir(version):
+    dt_dir = os.environ["dtDir"]  # Raises KeyError if not set — use .get() if you want a fallback
+    return Path(dt_dir) / version / "json_data"
 
-def extract_hits_per_bx(json_path):
-    with open(json_path) as f:
-        data = json.load(f)
+def get_table_columns(summaries, unit):
+    """Concatenates the layer summaries, keeping the key columns and the hit rates in `unit`."""
+    import numpy as np
 
-    num_bx = data["num_bunch_crossings"]
-    det_mod = data["detector_model"]
-    scenario = data["scenario"]
-    background = data["background"]
-    hits = data["hits"]
-    divided_hits = divide_hits(hits, det_mod)
-    results_dict = scale_hits_dict(divided_hits, scenario, background, num_bx, det_mod)[args.unit]
+    from layer_summary import KEY_COLUMNS
 
-    return det_mod, scenario, results_dict
+    return {key: np.concatenate([summary[key] for summary in summaries]) for key in KEY_COLUMNS + (unit,)}
 
-def create_table():
-    json_files = list(json_dir.glob("*.json"))
+def create_table(args, json_dir):
+    import pandas as pd
 
-    rows = []
+    from layer_summary import read_summaries
 
-    for json_file in json_files:
-        det_mod, scenario, hits = extract_hits_per_bx(json_file)
-        for subdet, subdet_hits in hits.items():
-            for layer, value in subdet_hits.items():
-                formated_value = f" {value:.2e}"
-                rows.append({
-                    "Detector Model": det_mod,
-                    "Subdetector": subdet,
-                    "layer": layer,
-                    "Background": args.version,
-                    scenario: formated_value
-                })
-
-    # Create a DataFrame
-    df = pd.DataFrame(rows)
+    # the summaries of the analysis runs, no hits are read
+    summaries = read_summaries(json_dir.parent)
+    if not summaries:
+        raise FileNotFoundError(f"No layer summaries or _pos.json files found for {json_dir.parent}")
+    df = pd.DataFrame(get_table_columns(summaries, args.unit))
 
     # Pivot so each scenario is a separate column
     df = df.pivot_table(
-        index=["Detector Model", "Subdetector", "layer", "Background"],
-        aggfunc="first"
-    ).reset_index()
+        index=["detector_model", "subdetector", "layer"],
+        columns="scenario",
+        values=args.unit,
+        aggfunc="first",
+    ).map(lambda value: f" {value:.2e}" if pd.notna(value) else value)
+    df.columns.name = None
+    df = df.reset_index().rename(
+        columns={"detector_model": "Detector Model", "subdetector": "Subdetector"}
+    )
+    df.insert(3, "Background", args.version)
 
     # Sort the table for clarity
     df = df.sort_values(by=["Detector Model", "Subdetector", "Background"])
@@ -88,14 +101,96 @@ def create_table():
     return df
 
 
+def load_version_rates(version, unit):
+    """Hit rates in `unit` of all combinations of a version, one row per layer and scenario."""
+    import pandas as pd
+
+    from layer_summary import read_summaries
+
+    summaries = read_summaries(get_json_dir(version).parent)
+    if not summaries:
+        raise FileNotFoundError(f"No layer summaries or _pos.json files found for version '{version}'")
+    return pd.DataFrame(get_table_columns(summaries, unit)).rename(
+        columns={
+            "detector_model": "Detector Model",
+            "subdetector": "Subdetector",
+            "scenario": "Scenario",
+            unit: version,
+        }
+    )[COMPARISON_KEYS + [version]]
+
+
+def create_comparison_table(reference, versions, unit, workers=None):
+    """
+    Aligns the hit rates of `versions` with those of `reference` by detector model,
+    subdetector, layer and scenario. The summaries of the versions are loaded in
+    parallel, e.g. for dozens of geometry variants.
+
+    Returns:
+    - pd.DataFrame: The rates of the reference, and of each version its rates,
+      their ratio to and their difference from the reference. Layers missing in
+      a version are left empty.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    all_versions = [reference] + [v for v in versions if v != reference]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        rates = list(executor.map(load_version_rates, all_versions, [unit] * len(all_versions)))
+
+    df = rates[0]
+    for version_rates in rates[1:]:
+        df = df.merge(version_rates, on=COMPARISON_KEYS, how="outer")
+    for version in all_versions[1:]:
+        df[f"{version} / {reference}"] = df[version] / df[reference]
+        df[f"{version} - {reference}"] = df[version] - df[reference]
+
+    ordered_columns = COMPARISON_KEYS + [reference] + [
+        column for version in all_versions[1:]
+        for column in (version, f"{version} / {reference}", f"{version} - {reference}")
+    ]
+    return df[ordered_columns].sort_values(COMPARISON_KEYS).reset_index(drop=True)
+
+
+def write_comparison_table(df, output, formats):
+    from tabulate import tabulate
+
+    for table_format in formats:
+        output_file = Path(f"{output}{COMPARISON_FORMATS[table_format]}")
+        if table_format == "csv":
+            df.to_csv(output_file, index=False)
+        else:
+            table = tabulate(
+                df,
+                headers="keys",
+                tablefmt="github" if table_format == "markdown" else "latex",
+                showindex=False,
+                floatfmt=".3g",
+            )
+            with open(output_file, "w") as f:
+                f.write(table + "\n")
+        print(f"Comparison table written to {output_file}")
+
+
 def main():
+    args = parse_arguments()
+
+    if args.compareTo:
+        df = create_comparison_table(args.version, args.compareTo, args.unit, args.workers)
+        output = args.output or Path(os.environ["dtDir"]) / f"comparison_{args.version}_{args.unit}"
+        write_comparison_table(df, output, args.formats)
+        return
 
-    df = create_table()
+    json_dir = get_json_dir(args.version)
+
+    df = create_table(args, json_dir)
 
     #print(tabulate(df, headers="keys", tablefmt="grid"))
 
+    from tabulate import tabulate
+
     latex_table = tabulate(df, headers='keys', tablefmt='latex')
-    with open(json_dir / "../background_table.tex", "w") as f:
+    # the version directory of a geometry scan has no json_data directory
+    with open(json_dir.parent / "background_table.tex", "w") as f:
         f.write(latex_table)
     markdown_table = tabulate(df, headers='keys', tablefmt='github')
     print(markdown_table)
@@ -0,0 +1,172 @@
+"""
+Incremental inventory of the simulated `.edm4hep.root` files of a data directory.
+
+The directory tree `<directory>/<detector model>/<scenario>_<bX>/` is scanned
+with `os.scandir`, the bunch crossing directories in parallel threads. The
+listing of every directory is persisted together with its mtime in a small
+JSON manifest, so repeated runs only list directories that changed since the
+last scan. The inventory also serves the file lists of the single
+combinations, which then no longer have to be globbed again.
+"""
+
+import json
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, NamedTuple
+
+from det_mod_configs import CHOICES_DETECTOR_MODELS
+
+MANIFEST_FILE_NAME = ".inventory_manifest.json"
+SIM_FILE_SUFFIX = ".edm4hep.root"
+DEFAULT_SCAN_THREADS = 16
+
+
+class SimFileName(NamedTuple):
+    detector_model: str
+    scenario: str
+    bX_number: str
+    e_number: str
+    part: str
+
+
+def parse_file_name(file_name: str) -> SimFileName | None:
+    """
+    Splits DETECTOR_MODEL-SCENARIO-bX_NUMBER-nEvts_ENUMBER-part_PART.edm4hep.root
+    into its components, None for files that do not match the format.
+    """
+    parts = file_name[: -len(SIM_FILE_SUFFIX)].split("-")
+    if len(parts) != 5:
+        return None
+    return SimFileName(
+        detector_model=parts[0],
+        scenario=parts[1],
+        bX_number=parts[2],
+        e_number=parts[3].split("_")[-1],
+        part=parts[4].split("_")[-1].split(".")[0],
+    )
+
+
+def scan_directory(path: str) -> Dict:
+    """Lists a single directory: its mtime, simulation files and subdirectories."""
+    files = []
+    subdirs = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.name)
+            elif entry.name.endswith(SIM_FILE_SUFFIX):
+                files.append(entry.name)
+    return {"mtime_ns": os.stat(path).st_mtime_ns, "files": files, "subdirs": subdirs}
+
+
+class DataInventory:
+    """
+    Persistent, incrementally refreshed listing of a data directory.
+
+    Parameters:
+    - directory (str | Path): The data directory of one version.
+    - manifest_file (str | Path, optional): Where the listing is persisted,
+      defaults to a hidden file inside `directory`.
+    """
+
+    def __init__(self, directory, manifest_file=None, max_workers=DEFAULT_SCAN_THREADS):
+        self.directory = Path(directory)
+        self.manifest_file = Path(manifest_file or self.directory / MANIFEST_FILE_NAME)
+        self.max_workers = max_workers
+        self.directories: Dict[str, Dict] = {}
+        self.n_rescanned = 0
+        self._file_index = None
+
+        try:
+            with open(self.manifest_file, "r", encoding="utf-8") as f:
+                self.directories = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            pass
+
+    def _refresh_tree(self, relative_dir: str, previous: Dict[str, Dict]) -> Dict[str, Dict]:
+        """Refreshes a directory and its subdirectories, listing only changed ones."""
+        path = os.path.join(self.directory, relative_dir)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return {}
+
+        entry = previous.get(relative_dir)
+        if entry is None or entry["mtime_ns"] != mtime_ns:
+            entry = scan_directory(path)
+            self.n_rescanned += 1
+
+        listing = {relative_dir: entry}
+        for subdir in entry["subdirs"]:
+            listing.update(self._refresh_tree(os.path.join(relative_dir, subdir), previous))
+        return listing
+
+    def refresh(self, force_rescan: bool = False) -> "DataInventory":
+        """Brings the inventory up to date and persists it."""
+        previous = {} if force_rescan else self.directories
+        self.n_rescanned = 0
+        self._file_index = None
+
+        # the top levels are small and always listed, the bX directories in parallel
+        top = scan_directory(self.directory)
+        bX_dirs = []
+        model_listings = {}
+        for detector_model in top["subdirs"]:
+            if detector_model not in CHOICES_DETECTOR_MODELS:
+                continue
+            model_listings[detector_model] = scan_directory(
+                self.directory / detector_model
+            )
+            bX_dirs.extend(
+                os.path.join(detector_model, bX_dir)
+                for bX_dir in model_listings[detector_model]["subdirs"]
+            )
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            listings = list(
+                pool.map(lambda bX_dir: self._refresh_tree(bX_dir, previous), bX_dirs)
+            )
+
+        self.directories = {k: v for listing in listings for k, v in listing.items()}
+        self.save()
+        print(
+            f"Inventory of {self.directory}: {len(self.directories)} directories, "
+            f"{self.n_rescanned} rescanned"
+        )
+        return self
+
+    def save(self) -> None:
+        try:
+            with open(self.manifest_file, "w", encoding="utf-8") as f:
+                json.dump(self.directories, f)
+        except OSError as e:
+            # a read-only data directory only costs the incremental rescans
+            print(f"Could not write inventory manifest {self.manifest_file}: {e}")
+
+    def get_file_index(self) -> Dict[tuple, List[str]]:
+        """Maps (detector model, scenario, bX_NUMBER) to the sorted paths of its files."""
+        if self._file_index is None:
+            index = defaultdict(list)
+            for relative_dir, entry in self.directories.items():
+                for file_name in entry["files"]:
+                    sim_file = parse_file_name(file_name)
+                    if sim_file is None:
+                        continue
+                    index[sim_file[:3]].append(
+                        os.path.join(self.directory, relative_dir, file_name)
+                    )
+            self._file_index = {k: sorted(v) for k, v in index.items()}
+        return self._file_index
+
+    def iter_sim_files(self):
+        """Yields the parsed names of all simulation files."""
+        for entry in self.directories.values():
+            for file_name in entry["files"]:
+                sim_file = parse_file_name(file_name)
+                if sim_file is not None:
+                    yield sim_file
+
+    def get_file_paths(self, detector_model: str, scenario: str, bX_number: str) -> List[str]:
+        return self.get_file_index().get((detector_model, scenario, bX_number), [])
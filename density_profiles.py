@@ -0,0 +1,189 @@
+"""
+Fine-grained hit density profiles of the vertex and TPC collections.
+
+`divide_hits` only counts the hits per existing layer. The profiles bin the
+hits of each collection continuously at sub-mm resolution, to see where layers
+could be placed:
+- barrels (vb, tpc) over the radius r, as dN/dr/dA with dA the surface
+  2π r · 2 z_half of a cylinder of the half length of the nearest layer;
+- endcaps (ve) over |z| (both endcaps folded), as dN/dz/dA with dA the area
+  2 · π r_max² of the nearest disc;
+normalised per bX and with the `scale_sr_hits` scaling.
+
+A profile is accumulated in a single vectorised pass per chunk of hits (an
+integer bin index and `np.bincount`), so the temporary arrays stay bounded for
+samples of 10^9 TPC hits and profiles of several chunks or samples can be
+added up. The counts are stored per combination in a small `.npz` file in
+`<version>/profile_data` and plotted by `plotting.plot_density_profiles`.
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Tuple
+
+import numpy as np
+
+PROFILE_SUBDIR_NAME = "profile_data"
+PROFILE_FILE_SUFFIX = "_profiles.npz"
+DEFAULT_BIN_WIDTH = 0.25  # mm
+# the profiles extend this far beyond the outermost layers
+PROFILE_MARGIN = 5  # mm
+# hits binned at once, bounds the temporary arrays
+CHUNK_SIZE = 2**22
+# sub-detector key: profiled coordinate
+PROFILE_COORDINATES = {"vb": "r", "tpc": "r", "ve": "z"}
+# observables a profile needs, hits read with fewer observables get no profile
+PROFILE_OBSERVABLES = {"vb": ("x", "y", "z"), "tpc": ("x", "y", "z"), "ve": ("z",)}
+
+
+@dataclass
+class DensityProfile:
+    """
+    Hit counts of a collection in bins of `bin_width` from `low` on, over r
+    (barrels) or |z| (endcaps), and the extent of the nearest layer of each bin:
+    its half length (barrels) or outer radius (endcaps) in mm.
+    """
+
+    coordinate: str
+    low: float
+    bin_width: float
+    extents: np.ndarray
+    counts: np.ndarray = None
+    # largest |z| of the hits of a barrel without a half length in the geometry
+    max_abs_z: float = 0.0
+    n_hits: int = 0
+
+    def __post_init__(self):
+        if self.counts is None:
+            self.counts = np.zeros(len(self.extents), dtype=np.int64)
+
+    @property
+    def edges(self) -> np.ndarray:
+        return self.low + self.bin_width * np.arange(len(self.counts) + 1)
+
+    @property
+    def centers(self) -> np.ndarray:
+        return self.low + self.bin_width * (np.arange(len(self.counts)) + 0.5)
+
+    def get_bin_areas(self) -> np.ndarray:
+        """Sensitive area (mm²) a hit of each bin is spread over."""
+        if self.coordinate == "r":
+            half_lengths = np.where(np.isnan(self.extents), self.max_abs_z, self.extents)
+            return 2 * np.pi * self.centers * 2 * half_lengths
+        # both endcaps
+        return 2 * np.pi * self.extents**2
+
+    def get_density(self, scale: float = 1.0, num_bx: int = 1) -> np.ndarray:
+        """Hits per bX, per mm of the coordinate and per mm², scaled by `scale` (see `scale_sr_hits`)."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.counts * scale / num_bx / self.bin_width / self.get_bin_areas()
+
+    def add(self, columns: Dict[str, np.ndarray], chunk_size: int = CHUNK_SIZE) -> None:
+        """Adds the hits of a collection (its x, y, z columns), binned chunk by chunk."""
+        n_bins = len(self.counts)
+        n_hits = len(columns["z"])
+        # the half length is only taken from the hits if the geometry has none
+        track_z = self.coordinate == "r" and np.isnan(self.extents).any()
+        for start in range(0, n_hits, chunk_size):
+            stop = start + chunk_size
+            if self.coordinate == "r":
+                values = np.hypot(columns["x"][start:stop], columns["y"][start:stop])
+                if track_z and len(values):
+                    self.max_abs_z = max(self.max_abs_z, float(np.abs(columns["z"][start:stop]).max()))
+            else:
+                values = np.abs(columns["z"][start:stop])
+            # fractional bin index, in place and in the precision of the hits
+            values -= self.low
+            values /= self.bin_width
+            index = values[(values >= 0) & (values < n_bins)].astype(np.int32)
+            self.counts += np.bincount(index, minlength=n_bins)
+        self.n_hits += n_hits
+
+
+def get_nearest_extents(centers: np.ndarray, positions: np.ndarray, extents: np.ndarray) -> np.ndarray:
+    """Extent of the layer nearest to each bin center."""
+    midpoints = (positions[:-1] + positions[1:]) / 2
+    return extents[np.searchsorted(midpoints, centers)]
+
+
+def make_profiles(detector_model: str, bin_width: float = DEFAULT_BIN_WIDTH) -> Dict[str, DensityProfile]:
+    """Empty profiles of the collections of `PROFILE_COORDINATES` the model has layers of."""
+    from get_subdet_params import compile_geometry
+
+    profiles = {}
+    for sub_det_key, table in compile_geometry(detector_model).items():
+        if sub_det_key not in PROFILE_COORDINATES or not len(table):
+            continue
+        coordinate = PROFILE_COORDINATES[sub_det_key]
+        if coordinate == "r":
+            low, high = table.r_min.min() - PROFILE_MARGIN, table.r_max.max() + PROFILE_MARGIN
+            positions, extents = (table.r_min + table.r_max) / 2, table.z_max
+        else:
+            low, high = table.z_min.min() - PROFILE_MARGIN, table.z_max.max() + PROFILE_MARGIN
+            positions, extents = table.z_min, table.r_max
+        low = max(low, 0.0)
+        n_bins = int(np.ceil((high - low) / bin_width))
+        centers = low + bin_width * (np.arange(n_bins) + 0.5)
+        profiles[sub_det_key] = DensityProfile(
+            coordinate, low, bin_width, get_nearest_extents(centers, positions, extents)
+        )
+    return profiles
+
+
+def get_density_profiles(hits, detector_model: str, bin_width: float = DEFAULT_BIN_WIDTH) -> Dict[str, DensityProfile]:
+    """
+    Profiles of the hits of a (detector model, scenario) combination, of the
+    collections whose hits have the `PROFILE_OBSERVABLES`.
+    """
+    profiles = {}
+    for sub_det_key, profile in make_profiles(detector_model, bin_width).items():
+        if sub_det_key in hits and all(o in hits[sub_det_key] for o in PROFILE_OBSERVABLES[sub_det_key]):
+            profile.add(hits[sub_det_key])
+            profiles[sub_det_key] = profile
+    return profiles
+
+
+def get_profiles_file_path(directory: Path, detector_model: str, scenario: str) -> Path:
+    return Path(directory) / PROFILE_SUBDIR_NAME / f"{detector_model}_{scenario}{PROFILE_FILE_SUFFIX}"
+
+
+def write_profiles(profiles_file: Path, profiles: Dict[str, DensityProfile], scale: float, num_bx: int) -> None:
+    """Stores the counts of the profiles with the hit rate scaling and number of bX of the combination."""
+    profiles_file = Path(profiles_file)
+    profiles_file.parent.mkdir(parents=True, exist_ok=True)
+    columns = {"scale": np.float64(scale), "num_bunch_crossings": np.int64(num_bx)}
+    for sub_det_key, profile in profiles.items():
+        columns.update(
+            {
+                f"{sub_det_key}_coordinate": np.str_(profile.coordinate),
+                f"{sub_det_key}_low": np.float64(profile.low),
+                f"{sub_det_key}_bin_width": np.float64(profile.bin_width),
+                f"{sub_det_key}_extents": profile.extents,
+                f"{sub_det_key}_counts": profile.counts,
+                f"{sub_det_key}_max_abs_z": np.float64(profile.max_abs_z),
+                f"{sub_det_key}_n_hits": np.int64(profile.n_hits),
+            }
+        )
+    np.savez_compressed(profiles_file, **columns)
+
+
+def read_profiles(profiles_file: Path) -> Tuple[Dict[str, DensityProfile], float, int]:
+    """
+    Returns:
+    - Tuple: The profiles, the hit rate scaling and the number of bX of the combination.
+    """
+    with np.load(profiles_file, allow_pickle=False) as data:
+        profiles = {
+            name[: -len("_counts")]: None for name in data.files if name.endswith("_counts")
+        }
+        for sub_det_key in profiles:
+            profiles[sub_det_key] = DensityProfile(
+                str(data[f"{sub_det_key}_coordinate"]),
+                float(data[f"{sub_det_key}_low"]),
+                float(data[f"{sub_det_key}_bin_width"]),
+                data[f"{sub_det_key}_extents"],
+                data[f"{sub_det_key}_counts"],
+                float(data[f"{sub_det_key}_max_abs_z"]),
+                int(data[f"{sub_det_key}_n_hits"]),
+            )
+        return profiles, float(data["scale"]), int(data["num_bunch_crossings"])
@@ -0,0 +1,529 @@
+"""
+Slices of the magnetic field maps of the detector models, in batch.
+
+A field map file holds per slice `Slice<i>` the TH2 histograms
+`slice<i>_Bx`, `slice<i>_By`, `slice<i>_Bz` (T) and `slice<i>_X0` (the
+material map), as drawn by the ROOT macro `drawMagneticFieldMap.c`. Instead of
+an interactive ROOT session per file and slice, the histograms of a file are
+read with uproot once and cached as NumPy arrays (`<cache dir>/*.field.npz`,
+rewritten when the ROOT file changes), and all requested plots of all files
+are rendered headless, in parallel worker processes:
+- arrows: the material map with arrows of the in-plane field;
+- fieldLines: the material map with field lines started along the centre of
+  the slice;
+- difference: a field component of each model minus the first model, e.g. to
+  compare the anti-DID configurations of ILD_l5_v03 and ILD_l5_v05;
+- profiles: a field component of all models along a line of the slice.
+
+The horizontal axis of a slice is the x axis of its histograms, i.e. z in the
+ILD maps, the vertical axis their y axis (x).
+
+Usage:
+    python field_map.py --fieldMaps ILD_l5_v03=ILD_l5_v03_field.root ILD_l5_v05=ILD_l5_v05_field.root \
+        --plots arrows difference profiles --profiles x=0
+"""
+
+import argparse
+import re
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from os import fspath
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Tuple
+
+import numpy as np
+
+# uproot and matplotlib are only imported once the arguments are parsed
+QUANTITIES = ("Bx", "By", "Bz", "X0")
+FIELD_QUANTITIES = ("Bx", "By", "Bz")
+# "Slice0/slice0_Bx"
+SLICE_HIST_NAME = re.compile(r"^(Slice\d+)/slice\d+_(Bx|By|Bz|X0)$")
+# axis labels if the histograms have no axis titles, those of the ILD maps
+DEFAULT_AXIS_LABELS = ("z", "x")
+CACHE_FORMAT = "field_map_v1"
+FIELD_CACHE_SUFFIX = ".field.npz"
+PLOT_KINDS = ("arrows", "fieldLines", "difference", "profiles")
+DEFAULT_QUANTITIES = ("Bx", "Bz")
+X0_MINIMUM = 1e-6
+# every n-th bin gets an arrow, the first at the fifth bin like in the ROOT macro
+DEFAULT_ARROW_SKIP = 10
+ARROW_OFFSET = 4
+# bins between the start points of the field lines
+DEFAULT_LINE_STEP = 20
+
+
+@dataclass
+class FieldSlice:
+    """
+    A slice of a field map: the bin edges of its horizontal (u) and vertical (v)
+    axis, their labels and the values of the `QUANTITIES` in the file, each of
+    shape (n_u, n_v).
+    """
+
+    u_edges: np.ndarray
+    v_edges: np.ndarray
+    values: Dict[str, np.ndarray]
+    u_label: str = DEFAULT_AXIS_LABELS[0]
+    v_label: str = DEFAULT_AXIS_LABELS[1]
+
+    @property
+    def u_centers(self) -> np.ndarray:
+        return (self.u_edges[:-1] + self.u_edges[1:]) / 2
+
+    @property
+    def v_centers(self) -> np.ndarray:
+        return (self.v_edges[:-1] + self.v_edges[1:]) / 2
+
+    def get_in_plane_components(self) -> Tuple[np.ndarray, np.ndarray] | None:
+        """The field components along u and v, e.g. Bz and Bx, None if the axes are not x, y or z."""
+        names = (f"B{self.u_label.lower()}", f"B{self.v_label.lower()}")
+        if not all(name in self.values for name in names):
+            return None
+        return self.values[names[0]], self.values[names[1]]
+
+    def get_profile(self, quantity: str, axis: str, position: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Values of `quantity` along the line of the bins containing `position` on
+        `axis` (the label of u or v), e.g. along z at x = 0 for axis "x".
+
+        Returns:
+        - Tuple: The bin centers along the line and the values.
+
+        Raises:
+            ValueError: If `axis` is no axis of the slice or `position` lies outside of it.
+        """
+        if axis == self.v_label:
+            edges, centers, values = self.v_edges, self.u_centers, self.values[quantity]
+        elif axis == self.u_label:
+            edges, centers, values = self.u_edges, self.v_centers, self.values[quantity].T
+        else:
+            raise ValueError(f"The slice has the axes {self.u_label} and {self.v_label}, not {axis}")
+        index = np.searchsorted(edges, position, side="right") - 1
+        if not 0 <= index < len(edges) - 1:
+            raise ValueError(f"{axis} = {position} is outside of the slice [{edges[0]}, {edges[-1]}]")
+        return centers, values[:, index]
+
+
+def get_axis_label(hist, axis_name: str, default: str) -> str:
+    title = hist.member(axis_name).member("fTitle")
+    return title.strip() if title and title.strip() else default
+
+
+def read_field_map(root_file: Path) -> Dict[str, FieldSlice]:
+    """
+    Reads the slice histograms of a field map file with uproot.
+
+    Returns:
+    - Dict[str, FieldSlice]: Slices by name ("Slice0", ...), with the quantities the file has.
+
+    Raises:
+        ValueError: If the file has no slice histograms or the histograms of a slice differ in binning.
+    """
+    import uproot
+
+    slices = {}
+    with uproot.open(root_file) as f:
+        for name in sorted(f.keys(cycle=False, recursive=True, filter_classname="TH2*")):
+            match = SLICE_HIST_NAME.match(name)
+            if not match:
+                continue
+            slice_name, quantity = match.groups()
+            hist = f[name]
+            values, u_edges, v_edges = hist.to_numpy(flow=False)
+            if slice_name not in slices:
+                slices[slice_name] = FieldSlice(
+                    u_edges,
+                    v_edges,
+                    {},
+                    get_axis_label(hist, "fXaxis", DEFAULT_AXIS_LABELS[0]),
+                    get_axis_label(hist, "fYaxis", DEFAULT_AXIS_LABELS[1]),
+                )
+            field_slice = slices[slice_name]
+            if not (np.array_equal(u_edges, field_slice.u_edges) and np.array_equal(v_edges, field_slice.v_edges)):
+                raise ValueError(f"{root_file}: {name} is binned differently than the other histograms of {slice_name}")
+            field_slice.values[quantity] = values
+    if not slices:
+        raise ValueError(f"{root_file} has no slice histograms Slice<i>/slice<i>_<{'|'.join(QUANTITIES)}>")
+    return slices
+
+
+def get_cache_file_path(cache_dir: Path, root_file: Path) -> Path:
+    """The cache of a field map, named after the file and a checksum of its absolute path."""
+    root_file = Path(root_file).resolve()
+    return Path(cache_dir) / f"{root_file.stem}_{zlib.crc32(fspath(root_file).encode()):08x}{FIELD_CACHE_SUFFIX}"
+
+
+def write_field_map_cache(cache_file: Path, slices: Dict[str, FieldSlice], root_file: Path) -> None:
+    """Stores the slices with the size and modification time of the ROOT file they were read from."""
+    cache_file = Path(cache_file)
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    stat = Path(root_file).stat()
+    columns = {
+        "format": np.str_(CACHE_FORMAT),
+        "source_size": np.int64(stat.st_size),
+        "source_mtime_ns": np.int64(stat.st_mtime_ns),
+    }
+    for slice_name, field_slice in slices.items():
+        columns.update(
+            {
+                f"{slice_name}__u_edges": field_slice.u_edges,
+                f"{slice_name}__v_edges": field_slice.v_edges,
+                f"{slice_name}__u_label": np.str_(field_slice.u_label),
+                f"{slice_name}__v_label": np.str_(field_slice.v_label),
+            }
+        )
+        columns.update({f"{slice_name}__{quantity}": values for quantity, values in field_slice.values.items()})
+    # written under a temporary name and renamed, so a concurrent reader never sees a partial file
+    temporary_file = cache_file.with_name(cache_file.name + ".tmp")
+    with open(temporary_file, "wb") as f:
+        np.savez(f, **columns)
+    temporary_file.replace(cache_file)
+
+
+def read_field_map_cache(cache_file: Path, root_file: Path) -> Dict[str, FieldSlice] | None:
+    """The cached slices, None if there is no cache or the ROOT file changed since it was written."""
+    if not Path(cache_file).exists():
+        return None
+    stat = Path(root_file).stat()
+    with np.load(cache_file, allow_pickle=False) as data:
+        if (
+            str(data["format"]) != CACHE_FORMAT
+            or int(data["source_size"]) != stat.st_size
+            or int(data["source_mtime_ns"]) != stat.st_mtime_ns
+        ):
+            return None
+        slice_names = [name[: -len("__u_edges")] for name in data.files if name.endswith("__u_edges")]
+        return {
+            slice_name: FieldSlice(
+                data[f"{slice_name}__u_edges"],
+                data[f"{slice_name}__v_edges"],
+                {
+                    quantity: data[f"{slice_name}__{quantity}"]
+                    for quantity in QUANTITIES
+                    if f"{slice_name}__{quantity}" in data.files
+                },
+                str(data[f"{slice_name}__u_label"]),
+                str(data[f"{slice_name}__v_label"]),
+            )
+            for slice_name in slice_names
+        }
+
+
+def load_field_map(root_file: Path, cache_dir: Path | None = None) -> Dict[str, FieldSlice]:
+    """
+    The slices of a field map file, from the cache in `cache_dir` if it is up
+    to date, otherwise read with uproot and cached. Without `cache_dir` the file
+    is always read.
+    """
+    if cache_dir is None:
+        return read_field_map(root_file)
+    cache_file = get_cache_file_path(cache_dir, root_file)
+    slices = read_field_map_cache(cache_file, root_file)
+    if slices is None:
+        slices = read_field_map(root_file)
+        write_field_map_cache(cache_file, slices, root_file)
+    return slices
+
+
+def parse_field_maps(specs: List[str]) -> Dict[str, Path]:
+    """
+    Parses "<label>=<file>" or "<file>" (labelled by the file name) into label: file.
+
+    Raises:
+        ValueError: If two field maps have the same label.
+    """
+    field_maps = {}
+    for spec in specs:
+        label, separator, file_name = spec.partition("=")
+        if not separator:
+            label, file_name = Path(spec).stem, spec
+        if label in field_maps:
+            raise ValueError(f"Field map label {label} given twice")
+        field_maps[label] = Path(file_name)
+    return field_maps
+
+
+def parse_profile(spec: str) -> Tuple[str, float]:
+    """Parses "<axis>=<position>", e.g. "x=0" for the profile along z at x = 0."""
+    axis, separator, position = spec.partition("=")
+    if not separator:
+        raise ValueError(f"Profile {spec} is not of the form <axis>=<position>")
+    return axis.strip(), float(position)
+
+
+def print_field_maps(field_maps: Dict[str, Dict[str, FieldSlice]]) -> None:
+    from tabulate import tabulate
+
+    table_data = []
+    for label, slices in field_maps.items():
+        for slice_name, field_slice in slices.items():
+            fields = [field_slice.values[q] for q in FIELD_QUANTITIES if q in field_slice.values]
+            table_data.append(
+                [
+                    label,
+                    slice_name,
+                    f"{field_slice.u_label} [{field_slice.u_edges[0]:g}, {field_slice.u_edges[-1]:g}] / {len(field_slice.u_centers)}",
+                    f"{field_slice.v_label} [{field_slice.v_edges[0]:g}, {field_slice.v_edges[-1]:g}] / {len(field_slice.v_centers)}",
+                    " ".join(q for q in QUANTITIES if q in field_slice.values),
+                    np.sqrt(sum(f**2 for f in fields)).max() if fields else np.nan,
+                ]
+            )
+    print(
+        tabulate(
+            table_data,
+            headers=["Field Map", "Slice", "Horizontal / Bins", "Vertical / Bins", "Quantities", "Max |B| (T)"],
+            tablefmt="grid",
+            floatfmt=".3f",
+        )
+    )
+
+
+class PlotJob(NamedTuple):
+    """A plot of a slice: its kind, the slices by field map label, and the quantity or profile it shows."""
+
+    kind: str
+    slice_name: str
+    slices: Dict[str, FieldSlice]
+    quantity: str = ""
+    profile: Tuple[str, float] | None = None
+
+
+def draw_material(ax, field_slice: FieldSlice) -> None:
+    from matplotlib.colors import LogNorm
+
+    if "X0" not in field_slice.values:
+        return
+    x0 = np.clip(field_slice.values["X0"], X0_MINIMUM, None)
+    mesh = ax.pcolormesh(field_slice.u_edges, field_slice.v_edges, x0.T, norm=LogNorm(), cmap="viridis")
+    ax.figure.colorbar(mesh, ax=ax, label="X0")
+
+
+def draw_arrows(ax, field_slice: FieldSlice, skip: int = DEFAULT_ARROW_SKIP) -> None:
+    """Arrows of the in-plane field at every `skip`-th bin."""
+    components = field_slice.get_in_plane_components()
+    if components is None:
+        return
+    selection = (slice(ARROW_OFFSET, None, skip), slice(ARROW_OFFSET, None, skip))
+    u, v = np.meshgrid(field_slice.u_centers, field_slice.v_centers, indexing="ij")
+    b_u, b_v = components
+    ax.quiver(u[selection], v[selection], b_u[selection], b_v[selection], color="tab:blue", angles="xy")
+
+
+def draw_field_lines(ax, field_slice: FieldSlice, step: int = DEFAULT_LINE_STEP) -> None:
+    """Field lines through every `step`-th bin along v at the centre of u, traced in both directions."""
+    components = field_slice.get_in_plane_components()
+    if components is None:
+        return
+    u_centers, v_centers = field_slice.u_centers, field_slice.v_centers
+    u_start = u_centers[np.argmin(np.abs(u_centers))]
+    v_starts = v_centers[len(v_centers) // 2 % step :: step]
+    b_u, b_v = components
+    ax.streamplot(
+        u_centers,
+        v_centers,
+        b_u.T,
+        b_v.T,
+        start_points=np.column_stack([np.full(len(v_starts), u_start), v_starts]),
+        color="tab:blue",
+        linewidth=0.8,
+        broken_streamlines=False,
+    )
+
+
+def get_difference(reference: FieldSlice, other: FieldSlice, quantity: str) -> np.ndarray:
+    """
+    Raises:
+        ValueError: If the slices are binned differently.
+    """
+    if not (np.array_equal(reference.u_edges, other.u_edges) and np.array_equal(reference.v_edges, other.v_edges)):
+        raise ValueError("The slices are binned differently")
+    return other.values[quantity] - reference.values[quantity]
+
+
+def render_plot(job: PlotJob, output_dir: Path, file_format: str = "pdf") -> List[Path]:
+    """Renders a plot job into `output_dir`, one file per field map (difference: per compared model)."""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    from vicbib import BasePlotter
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    written = []
+    labels = list(job.slices)
+
+    def save(plotter: BasePlotter) -> None:
+        plotter.finish()
+        plt.close("all")
+        written.append(plotter.save_path)
+
+    if job.kind in ("arrows", "fieldLines"):
+        for label, field_slice in job.slices.items():
+            plotter = BasePlotter(True, output_dir / f"{job.kind}_{label}_{job.slice_name}.{file_format}")
+            _, ax = plotter.plot()
+            draw_material(ax, field_slice)
+            if job.kind == "arrows":
+                draw_arrows(ax, field_slice)
+            else:
+                draw_field_lines(ax, field_slice)
+            ax.set_title(f"{label} {job.slice_name}")
+            ax.set_xlabel(field_slice.u_label)
+            ax.set_ylabel(field_slice.v_label)
+            save(plotter)
+
+    elif job.kind == "difference":
+        reference = job.slices[labels[0]]
+        for label in labels[1:]:
+            difference = get_difference(reference, job.slices[label], job.quantity)
+            plotter = BasePlotter(
+                True, output_dir / f"difference_{job.quantity}_{label}_{labels[0]}_{job.slice_name}.{file_format}"
+            )
+            _, ax = plotter.plot()
+            limit = np.abs(difference).max() or 1.0
+            mesh = ax.pcolormesh(
+                reference.u_edges, reference.v_edges, difference.T, cmap="RdBu_r", vmin=-limit, vmax=limit
+            )
+            ax.figure.colorbar(mesh, ax=ax, label=f"Δ{job.quantity} (T)")
+            ax.set_title(f"{label} - {labels[0]} {job.slice_name}")
+            ax.set_xlabel(reference.u_label)
+            ax.set_ylabel(reference.v_label)
+            save(plotter)
+
+    elif job.kind == "profiles":
+        axis, position = job.profile
+        plotter = BasePlotter(
+            True, output_dir / f"profile_{job.quantity}_{axis}_{position:g}_{job.slice_name}.{file_format}"
+        )
+        _, ax = plotter.plot()
+        for label, field_slice in job.slices.items():
+            centers, values = field_slice.get_profile(job.quantity, axis, position)
+            ax.plot(centers, values, label=label)
+            along = field_slice.u_label if axis == field_slice.v_label else field_slice.v_label
+        ax.set_title(f"{job.slice_name} at {axis} = {position:g}")
+        ax.set_xlabel(along)
+        ax.set_ylabel(job.quantity if job.quantity == "X0" else f"{job.quantity} (T)")
+        ax.legend()
+        save(plotter)
+
+    else:
+        raise ValueError(f"Unknown plot kind {job.kind}, choose from {', '.join(PLOT_KINDS)}")
+    return written
+
+
+def get_plot_jobs(
+    field_maps: Dict[str, Dict[str, FieldSlice]],
+    kinds: List[str],
+    slice_names: List[str] | None = None,
+    quantities: List[str] = DEFAULT_QUANTITIES,
+    profiles: List[Tuple[str, float]] = (),
+) -> List[PlotJob]:
+    """
+    The plot jobs of the slices all field maps have (or `slice_names`), the
+    comparisons need the slices of all field maps.
+
+    Raises:
+        ValueError: If a requested slice is missing in a field map.
+    """
+    common = [name for name in next(iter(field_maps.values())) if all(name in s for s in field_maps.values())]
+    if slice_names:
+        missing = [name for name in slice_names if name not in common]
+        if missing:
+            raise ValueError(f"Slices {', '.join(missing)} are not in all field maps, common are {', '.join(common)}")
+        common = slice_names
+
+    jobs = []
+    for slice_name in common:
+        slices = {label: maps[slice_name] for label, maps in field_maps.items()}
+        available = [q for q in quantities if all(q in s.values for s in slices.values())]
+        for kind in kinds:
+            if kind in ("arrows", "fieldLines"):
+                jobs.append(PlotJob(kind, slice_name, slices))
+            elif kind == "difference" and len(slices) > 1:
+                jobs.extend(PlotJob(kind, slice_name, slices, quantity) for quantity in available)
+            elif kind == "profiles":
+                jobs.extend(
+                    PlotJob(kind, slice_name, slices, quantity, profile)
+                    for quantity in available
+                    for profile in profiles
+                )
+    return jobs
+
+
+def render_plots(jobs: List[PlotJob], output_dir: Path, file_format: str = "pdf", workers: int | None = None) -> List[Path]:
+    """Renders the jobs in parallel worker processes, a single worker renders them in this process."""
+    if workers == 1 or len(jobs) <= 1:
+        return [path for job in jobs for path in render_plot(job, output_dir, file_format)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        written = pool.map(render_plot, jobs, [output_dir] * len(jobs), [file_format] * len(jobs))
+        return [path for paths in written for path in paths]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render slices of magnetic field maps in batch.")
+    parser.add_argument(
+        "--fieldMaps",
+        nargs="+",
+        required=True,
+        help="Field map ROOT files as <label>=<file> or <file>, the first is the reference of the differences",
+    )
+    parser.add_argument(
+        "--plots",
+        nargs="+",
+        choices=PLOT_KINDS,
+        default=["arrows"],
+        help="Plots to render per slice",
+    )
+    parser.add_argument("--slices", nargs="+", help="Slices to render, e.g. Slice0, defaults to all")
+    parser.add_argument(
+        "--quantities",
+        nargs="+",
+        choices=QUANTITIES,
+        default=list(DEFAULT_QUANTITIES),
+        help="Quantities of the differences and profiles",
+    )
+    parser.add_argument(
+        "--profiles",
+        nargs="+",
+        default=[],
+        help="Lines of the profiles as <axis>=<position>, e.g. x=0 for the profile along z at x = 0",
+    )
+    parser.add_argument("--outputDir", type=str, default="field_maps", help="Directory of the plots")
+    parser.add_argument("--format", choices=["pdf", "png", "svg"], default="pdf", help="File format of the plots")
+    parser.add_argument(
+        "--cacheDir",
+        type=str,
+        help="Directory of the cached slice arrays, defaults to ~/promotion/data/field_map_cache",
+    )
+    parser.add_argument("--noCache", action="store_true", help="Always read the ROOT files")
+    parser.add_argument("--workers", type=int, help="Number of plots rendered in parallel, defaults to the number of cores")
+    args = parser.parse_args()
+
+    if "profiles" in args.plots and not args.profiles:
+        parser.error("The profiles need their lines given by --profiles")
+    try:
+        field_map_files = parse_field_maps(args.fieldMaps)
+        profiles = [parse_profile(spec) for spec in args.profiles]
+    except ValueError as e:
+        parser.error(str(e))
+
+    cache_dir = None
+    if not args.noCache:
+        if args.cacheDir is None:
+            from platform_paths import get_home_directory
+
+            args.cacheDir = fspath(get_home_directory() / "promotion/data/field_map_cache")
+        cache_dir = Path(args.cacheDir)
+
+    field_maps = {label: load_field_map(root_file, cache_dir) for label, root_file in field_map_files.items()}
+    print_field_maps(field_maps)
+
+    jobs = get_plot_jobs(field_maps, args.plots, args.slices, args.quantities, profiles)
+    written = render_plots(jobs, Path(args.outputDir), args.format, args.workers)
+    print(f"{len(written)} plots written to {args.outputDir}")
+
+
+if __name__ == "__main__":
+    main()
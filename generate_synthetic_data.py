@@ -0,0 +1,312 @@
+"""
+Generator of synthetic `.edm4hep.root` files for reproducible offline benchmarks.
+
+The files contain an `events` tree with the SimTrackerHit branches
+(`<collection>.position.x`, `<collection>.time`, ...) of the hit collections
+configured per detector model in `det_mod_configs`. They are laid out in the
+simall directory naming scheme:
+
+    <version>/<detector model>/<scenario>_<bX>/
+        <detector model>-<scenario>-bX_<bX>-nEvts_<events>-part_<part>.edm4hep.root
+
+so that `combined_analysis.py`, `get_hits`, `divide_hits`, `scale_hits_dict`
+and `plotting` run on them unchanged.
+
+The hits are placed on the layers of `get_subdet_params.get_model_params`, or on an
+approximate built-in geometry if the k4geo compact files are not available.
+Their distributions follow the shape of pair background:
+- the rate on the barrel layers falls with 1/r^2;
+- z is uniform along the layers;
+- the radius on the endcap discs falls with 1/r;
+- the radius in the TPC falls with 1/r^2;
+- the times are exponential.
+All random numbers derive from `--seed` and the file name, so a generated
+sample is reproducible.
+
+Usage:
+    python generate_synthetic_data.py --version synthetic --bunchCrossings 4 --hitsPerEvent 2000
+"""
+
+import argparse
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from det_mod_configs import (
+    CHOICES_DETECTOR_MODELS,
+    DEFAULT_DETECTOR_MODELS,
+    detector_model_configurations,
+)
+from platform_paths import resolve_path_with_env
+
+DEFAULT_EVENTS_PER_FILE = 100
+DEFAULT_HITS_PER_EVENT = 1000
+DEFAULT_CHUNK_SIZE = 1000  # events held in memory per write
+
+# share of the hits of an event per sub-detector key of det_mod_configs
+HIT_FRACTIONS = {"vb": 0.55, "ve": 0.15, "f": 0.15, "tpc": 0.30}
+# mean of the exponential hit times in ns
+MEAN_HIT_TIME = {"vb": 2.0, "ve": 2.0, "f": 2.0, "tpc": 50.0}
+
+TPC_HALF_LENGTH = 2350.0  # mm, if the compact files have none
+ENDCAP_INNER_RADIUS = 15.0  # mm
+FTD_INNER_RADIUS = 30.0  # mm
+SENSOR_THICKNESS = 0.05  # mm
+
+# Approximate layer geometry (mm) used if the k4geo compact files can not be
+# read, keeps the generator usable on machines without a k4geo checkout
+BUILTIN_GEOMETRY = {
+    "FCCee": {
+        "vb": {"r": [13.0, 15.0, 35.0, 37.0, 57.0, 59.0], "z": [125.0] * 6},
+        "ve": {"r": [102.0] * 6, "z": [160.0, 162.0, 230.0, 232.0, 300.0, 302.0]},
+        "tpc": {"r_inner": 329.0, "r_outer": 1770.0, "z": TPC_HALF_LENGTH},
+    },
+    "ILC": {
+        "vb": {"r": [16.0, 18.0, 37.0, 39.0, 58.0, 60.0], "z": [62.5, 62.5, 125.0, 125.0, 125.0, 125.0]},
+        "f": {"r": [153.0, 153.0, 300.0, 300.0, 300.0], "z": [220.0, 371.0, 645.0, 1046.0, 1448.0]},
+        "tpc": {"r_inner": 329.0, "r_outer": 1770.0, "z": TPC_HALF_LENGTH},
+    },
+}
+
+
+def get_layer_geometry(detector_model: str) -> Dict[str, Dict]:
+    """
+    Layers per sub-detector key: barrel radii and half lengths, endcap disc
+    positions and outer radii, TPC radii and half length (all in mm).
+    """
+    accelerator = detector_model_configurations[detector_model].accelerator.name
+    geometry = {k: dict(v) for k, v in BUILTIN_GEOMETRY[accelerator].items()}
+
+    try:
+        # compiled from the compact files of the k4geo checkout in $codeDir
+        from get_subdet_params import get_model_params
+
+        det_params = get_model_params(detector_model)
+    except OSError as e:
+        print(f"Using the built-in approximate geometry, k4geo not readable: {e}")
+        return geometry
+
+    geometry["vb"] = {k: det_params["Vertex"]["vb"][k] for k in ("r", "z")}
+    if "ve" in geometry:
+        geometry["ve"] = {k: det_params["Vertex"]["ve"][k] for k in ("r", "z")}
+    geometry["tpc"] = {
+        "r_inner": det_params["TPC"]["TPC"]["r_inner"][0],
+        "r_outer": det_params["TPC"]["TPC"]["r_outer"][0],
+        "z": (det_params["TPC"]["TPC"]["z"] or [TPC_HALF_LENGTH])[0],
+    }
+    return geometry
+
+
+def sample_inverse_power(rng, n, r_min, r_max, power):
+    """Samples n radii in [r_min, r_max] with a density proportional to r^-power (power 1 or 2)."""
+    u = rng.random(n)
+    if power == 1:
+        return r_min * (r_max / r_min) ** u
+    return 1 / (1 / r_min - u * (1 / r_min - 1 / r_max))
+
+
+def generate_positions(rng, sub_det_key, layers, n):
+    """Positions (x, y, z) in mm of n hits on the layers of a sub-detector."""
+    phi = rng.uniform(-np.pi, np.pi, n)
+    if sub_det_key == "tpc":
+        r = sample_inverse_power(rng, n, layers["r_inner"], layers["r_outer"], 2)
+        z = rng.uniform(-layers["z"], layers["z"], n)
+    elif sub_det_key == "vb":
+        radii = np.asarray(layers["r"], dtype=float)
+        weights = radii**-2
+        layer = rng.choice(len(radii), n, p=weights / weights.sum())
+        r = radii[layer] + rng.uniform(0, SENSOR_THICKNESS, n)
+        half_length = np.asarray(layers["z"], dtype=float)[layer]
+        z = rng.uniform(-half_length, half_length)
+    else:
+        # endcap discs on both sides, inner discs are hit more often
+        positions = np.asarray(layers["z"], dtype=float)
+        weights = positions**-2
+        layer = rng.choice(len(positions), n, p=weights / weights.sum())
+        r_min = ENDCAP_INNER_RADIUS if sub_det_key == "ve" else FTD_INNER_RADIUS
+        r = sample_inverse_power(rng, n, r_min, np.asarray(layers["r"], dtype=float)[layer], 1)
+        z = rng.choice([-1.0, 1.0], n) * (positions[layer] + rng.uniform(0, SENSOR_THICKNESS, n))
+    return r * np.cos(phi), r * np.sin(phi), z
+
+
+def generate_collection(rng, sub_det_key, layers, n_events, mean_hits):
+    """One chunk of events of a SimTrackerHit collection as awkward record array."""
+    import awkward as ak
+
+    counts = rng.poisson(mean_hits, n_events)
+    n = int(counts.sum())
+    x, y, z = generate_positions(rng, sub_det_key, layers, n)
+    columns = {
+        "cellID": rng.integers(0, 2**32, n, dtype=np.uint64),
+        "eDep": rng.exponential(2e-5, n).astype(np.float32),  # GeV
+        "time": rng.exponential(MEAN_HIT_TIME[sub_det_key], n).astype(np.float32),
+        "pathLength": rng.uniform(0.05, 0.5, n).astype(np.float32),
+        "quality": np.zeros(n, dtype=np.int32),
+        "position.x": x,
+        "position.y": y,
+        "position.z": z,
+        "momentum.x": rng.normal(0, 0.005, n).astype(np.float32),
+        "momentum.y": rng.normal(0, 0.005, n).astype(np.float32),
+        "momentum.z": rng.normal(0, 0.02, n).astype(np.float32),
+    }
+    # a jagged array of hit records, one list of hits per event
+    return ak.zip({key: ak.unflatten(values, counts) for key, values in columns.items()})
+
+
+def write_synthetic_file(
+    file_path: Path,
+    detector_model: str,
+    layers: Dict[str, Dict],
+    n_events: int,
+    hits_per_event: float,
+    seed: int,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> int:
+    """
+    Writes one synthetic file on the `layers` of `get_layer_geometry` and
+    returns its number of hits.
+
+    The random stream is derived from `seed` and the file name, so a file is
+    identical no matter in which order or process it is generated.
+    """
+    import awkward as ak
+    import uproot
+
+    rng = np.random.default_rng([seed, zlib.crc32(file_path.name.encode())])
+    sub_det_cols = detector_model_configurations[detector_model].get_sub_detector_collection_info()
+    fraction_sum = sum(HIT_FRACTIONS[key] for key in sub_det_cols)
+
+    n_hits = 0
+    with uproot.recreate(file_path) as f:
+        for first_event in range(0, n_events, chunk_size):
+            n_chunk = min(chunk_size, n_events - first_event)
+            chunk = {
+                hit_col.root_tree_branch_name: generate_collection(
+                    rng,
+                    sub_det_key,
+                    layers[sub_det_key],
+                    n_chunk,
+                    hits_per_event * HIT_FRACTIONS[sub_det_key] / fraction_sum,
+                )
+                for sub_det_key, hit_col in sub_det_cols.items()
+            }
+            if "events" not in f:
+                f.mktree(
+                    "events",
+                    {name: collection.type.content for name, collection in chunk.items()},
+                    field_name=lambda outer, inner: f"{outer}.{inner}",
+                )
+            f["events"].extend(chunk)
+            n_hits += sum(len(ak.flatten(collection.time)) for collection in chunk.values())
+    return n_hits
+
+
+def get_synthetic_file_paths(
+    directory: Path,
+    detector_models: List[str],
+    scenarios: List[str],
+    n_bunch_crossings: int,
+    files_per_bX: int,
+    events_per_file: int,
+) -> List[tuple]:
+    """(file path, detector model) of all files of a sample in the simall naming scheme."""
+    file_paths = []
+    for detector_model in detector_models:
+        for scenario in scenarios:
+            for bunchcrossing in range(1, n_bunch_crossings + 1):
+                out_dir = directory / detector_model / f"{scenario}_{bunchcrossing}"
+                for part in range(files_per_bX):
+                    file_name = (
+                        f"{detector_model}-{scenario}-bX_{str(bunchcrossing).zfill(4)}"
+                        f"-nEvts_{events_per_file}-part_{part}.edm4hep.root"
+                    )
+                    file_paths.append((out_dir / file_name, detector_model))
+    return file_paths
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Generates synthetic .edm4hep.root files in the simall directory layout"
+    )
+    parser.add_argument(
+        "--version",
+        "--directory",
+        required=True,
+        type=str,
+        help="Version name / Directory the sample is written to; can be relative to the 'dtDir' env var",
+    )
+    parser.add_argument(
+        "--detectorModel",
+        choices=CHOICES_DETECTOR_MODELS,
+        nargs="+",
+        default=DEFAULT_DETECTOR_MODELS,
+        help="Detector model(s) whose hit collections are generated",
+    )
+    parser.add_argument(
+        "--scenario", nargs="+", default=["FCC240"], help="Scenario name(s) used in the file names"
+    )
+    parser.add_argument(
+        "--bunchCrossings", type=int, default=2, help="Number of bunch crossings per scenario"
+    )
+    parser.add_argument("--filesPerBX", type=int, default=1, help="Number of files (parts) per bunch crossing")
+    parser.add_argument(
+        "--eventsPerFile", type=int, default=DEFAULT_EVENTS_PER_FILE, help="Number of events per file"
+    )
+    parser.add_argument(
+        "--hitsPerEvent",
+        type=float,
+        default=DEFAULT_HITS_PER_EVENT,
+        help="Mean number of hits per event summed over all hit collections",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random numbers")
+    parser.add_argument(
+        "--chunkSize",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help="Number of events generated and written at once, bounds the memory for huge files",
+    )
+    parser.add_argument(
+        "--workers", type=int, help="Number of files generated in parallel, defaults to the number of cores"
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    directory = resolve_path_with_env(args.version, "dtDir")
+
+    file_paths = get_synthetic_file_paths(
+        directory,
+        args.detectorModel,
+        args.scenario,
+        args.bunchCrossings,
+        args.filesPerBX,
+        args.eventsPerFile,
+    )
+    for file_path, _ in file_paths:
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+
+    layers = {detector_model: get_layer_geometry(detector_model) for detector_model in args.detectorModel}
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        n_hits = list(
+            pool.map(
+                write_synthetic_file,
+                [file_path for file_path, _ in file_paths],
+                [detector_model for _, detector_model in file_paths],
+                [layers[detector_model] for _, detector_model in file_paths],
+                [args.eventsPerFile] * len(file_paths),
+                [args.hitsPerEvent] * len(file_paths),
+                [args.seed] * len(file_paths),
+                [args.chunkSize] * len(file_paths),
+            )
+        )
+
+    print(f"{len(file_paths)} files with {sum(n_hits)} hits written to {directory}")
+
+
+if __name__ == "__main__":
+    main()
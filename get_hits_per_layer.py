@@ -1,12 +1,27 @@
 import numpy as np
-from get_subdet_params import get_params
+from get_subdet_params import get_model_params
+
+# observables divide_hits and scale_hits_dict need, e.g. for table-only runs
+TABLE_OBSERVABLES = {
+    "vb": ("x", "y", "z"),
+    # x and y for the module occupancy
+    "ve": ("x", "y", "z"),
+    "f": ("z",),
+    "tpc": ("x", "y", "z"),
+}
+
+
+def get_layer_index(layer):
+    """Index of a layer of `divide_hits` in the layer parameters of its sub-detector, e.g. 2 for "vb_3", 0 for "TPC"."""
+    _, _, number = layer.partition("_")
+    return int(number) - 1 if number else 0
 
 
 def divide_hits(hits, det_mod):
 
     vb_hits = {k: np.array(v) for k, v in hits["vb"].items()}
 
-    vertex_params = get_params()[det_mod]["Vertex"]
+    vertex_params = get_model_params(det_mod)["Vertex"]
 
     vb_hit_radii = np.sqrt(np.array(vb_hits["x"])**2 + np.array(vb_hits["y"])**2)
 
@@ -23,12 +38,8 @@ def divide_hits(hits, det_mod):
 
         hit_indices = np.where((vb_hit_radii > vb_layer_midpoints[i-1]) & (vb_hit_radii < midpoint))[0]
 
-        vertex_hits[f"vb_{i}"] = {
-            "x": vb_hits["x"][hit_indices],
-            "y": vb_hits["y"][hit_indices],
-            "z": vb_hits["z"][hit_indices],
-            "t": vb_hits["t"][hit_indices],
-        }
+        # only the observables that were read are divided
+        vertex_hits[f"vb_{i}"] = {k: v[hit_indices] for k, v in vb_hits.items()}
 
     if det_mod.split("_")[1] == "FCCee":
         ve_hits = {k: np.array(v) for k, v in hits["ve"].items()}
@@ -44,12 +55,7 @@ def divide_hits(hits, det_mod):
 
             hit_indices = np.where((ve_hit_z > ve_layer_midpoints[i-1]) & (ve_hit_z < midpoint))[0]
 
-            vertex_hits[f"ve_{i}"] = {
-                "x": ve_hits["x"][hit_indices],
-                "y": ve_hits["y"][hit_indices],
-                "z": ve_hits["z"][hit_indices],
-                "t": ve_hits["t"][hit_indices],
-            }
+            vertex_hits[f"ve_{i}"] = {k: v[hit_indices] for k, v in ve_hits.items()}
     divided_hits = {
         "Vertex": vertex_hits,
         "TPC": {
@@ -1,247 +1,210 @@
-import re
-import xml.etree.ElementTree as ET
-from numpy import pi
-from det_mod_configs import sub_det_cols_fcc, sub_det_cols_ilc
-
-vertex_xml = "../k4geo/FCCee/CLD/compact/CLD_o2_v07/Vertex_o4_v07_smallBP.xml"
-large_TPC_xml = "../k4geo/FCCee/ILD_FCCee/compact/ILD_FCCee_v01/top_defs_ILD_FCCee_v01.xml"
-small_TPC_xml = "../k4geo/FCCee/ILD_FCCee/compact/ILD_FCCee_v02/top_defs_ILD_FCCee_v02.xml"
-TPC_pixel_xml = "../k4geo/FCCee/ILD_FCCee/compact/ILD_common_v02/tpc10_01.xml"
+"""
+Layer geometry of the detector models, compiled from their k4geo compact files.
+
+For every model of `detector_model_configurations` the compact file given by
+`get_compact_file_path` is read together with all files it includes, its
+constants are resolved by a `ConstantTable` (in mm, see compact_constants.py),
+the vertex layers of the FCC-ee models are taken from `FCC_VERTEX_COMPACT_FILE`,
+and a `LayerTable` is built per sub-detector collection of the model:
+radii, z extents, areas and pixel counts of all layers as numpy arrays.
+The `make_*_table` functions build the tables of hypothetical layers, e.g. of
+the geometry variants of scan_geometry.py.
+The compiled geometry is cached per model and the compact files are only
+read on first use.
+
+`get_params` returns the nested dict of lists used by `divide_hits` and
+`scale_hits_dict`, derived from the layer tables.
+"""
+
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+
+from compact_constants import CompactTree, ConstantTable, read_compact_tree
+from det_mod_configs import detector_model_configurations
 
 # vertex_pixel_size taken from 'CLD - A Detector Concept for the FCC-ee'. Could not locate in k4Geo (potential violation of single source of truth)
 vertex_pixel_size = 0.025 # mm
+# distance of the two sensor layers of a double layer
+DOUBLE_LAYER_DISTANCE = 2 # mm
 
-KEYWORDS = {
-    "Vertex": ["VertexEndcap_z", "VertexEndcap_rmax", "VertexBarrel_r", "VertexBarrel_zmax"],
-    "TPC": ["top_TPC_inner_radius", "top_TPC_outer_radius"],
-}
+# CLD vertex detector of the FCC-ee models, relative to k4geo. Its layers are used
+# whichever vertex the compact file of a model includes, as the hit rates always were.
+FCC_VERTEX_COMPACT_FILE = Path("FCCee") / "CLD" / "compact" / "CLD_o2_v07" / "Vertex_o4_v07_smallBP.xml"
+VERTEX_CONSTANT_PREFIXES = ("VertexBarrel_", "VertexEndcap_")
+
+TPC_DETECTOR_NAME = "TPC"
+TPC_HALF_LENGTH_CONSTANT = "TPC_Ecal_Hcal_barrel_halfZ"
 # Cannot find values stored in xml file for ILC model. This should be changed for single source of truth
+# Used if the compact files of an ILC model have no VertexBarrel_r constants.
 ILC_vb_params = {
     "r": [16, 37, 58], # radii mm
     "z": [62.5, 125, 125], # half lengths mm
-    "a": [],
-}
-
-SUB_DET_COLS = {
-    "ILD_FCCee_v01": sub_det_cols_fcc,
-    "ILD_FCCee_v02": sub_det_cols_fcc,
-    "ILD_l5_v02": sub_det_cols_ilc,
 }
 
-def extract_value_in_mm(text):
-    match = re.search(r"([-+]?\d*\.?\d+)\s*\*?\s*(cm|mm)", text.lower())
-    if not match:
-        raise ValueError(f"Invalid format: {text}")
-    
-    value, unit = match.groups()
-    value = float(value)
-
-    if unit == "cm":
-        return value * 10  # Convert to mm
-    elif unit == "mm":
-        return value
-    
-def get_tpc_pixel_size(xml_path=TPC_pixel_xml):
-    tree = ET.parse(xml_path) 
-    root = tree.getroot()
-
-    # Find the <global> element inside the TPC detector
-    for detector in root.findall(".//detector"):
-        if detector.get("name") == "TPC":
-            global_elem = detector.find("global")
-            if global_elem is not None:
-                pad_height_str = global_elem.get("TPC_pad_height")
-                pad_width_str  = global_elem.get("TPC_pad_width")
-
-                # strip "*mm" and convert to float
-                pad_height = float(pad_height_str.replace("*mm", ""))
-                pad_width  = float(pad_width_str.replace("*mm", ""))
-
-                area_mm2 = pad_height * pad_width
-                return area_mm2
-            
-pixel_areas = {
-    "TPC": get_tpc_pixel_size(),
-    "Vertex": vertex_pixel_size**2,
+# group and key of the sub-detector collections in the `get_params` dicts
+PARAM_KEYS = {
+    "vb": ("Vertex", "vb"),
+    "ve": ("Vertex", "ve"),
+    "f": ("Forward", "f"),
+    "tpc": ("TPC", "TPC"),
 }
 
-def split_double_layers(parameters):
-
-    for det_mod, det_params in parameters.items():
-        if SUB_DET_COLS[det_mod]["vb"].only_double_layers:
-            parameters[det_mod]["Vertex"]["vb"]["r"] = [radius for r in det_params["Vertex"]["vb"]["r"] for radius in (r, r + 2)]
-            parameters[det_mod]["Vertex"]["vb"]["z"] = [half_length for z in det_params["Vertex"]["vb"]["z"] for half_length in (z, z)]
-        if det_mod.split("_")[1] != "FCCee":
-            continue
-        if SUB_DET_COLS[det_mod]["ve"].only_double_layers:
-            parameters[det_mod]["Vertex"]["ve"]["r"] = [radius for r in det_params["Vertex"]["ve"]["r"] for radius in (r, r)]
-            parameters[det_mod]["Vertex"]["ve"]["z"] = [pos for z in det_params["Vertex"]["ve"]["z"] for pos in (z, z + 2)]
-
-    return parameters
-
-def extract_constants(xml_path, keywords):
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
-
-    subdet_params = {}
-
-    for const in root.findall(".//constant"):
-        name = const.get("name")
-        value = const.get("value")
-
-        if name is None or value is None:
-            continue
-
-        # Check if the name matches one of the keywords
-        for k in keywords:
-            if name.startswith(k):
-                if k not in subdet_params:
-                    subdet_params[k] = []
-                subdet_params[k].append(extract_value_in_mm(value))
-    
-    return subdet_params
-
-def calculate_barrel_area(subdet_params, sub_det_cols, layer):
-
-    radius = subdet_params["vb"]["r"][layer]
-    half_length = subdet_params["vb"]["z"][layer]
-
-    area = 2 * pi * radius * 2 * half_length
-    if not sub_det_cols["vb"].only_double_layers:
-        return area
-    area += 2 * pi * (radius + 2) * 2 * half_length
-    return area
+@dataclass(frozen=True)
+class LayerTable:
+    """
+    Layers of a sub-detector collection, one array entry per layer (mm, mm²).
+    Barrel layers have r_min == r_max, endcap discs z_min == z_max at positive z.
+    """
+
+    r_min: np.ndarray
+    r_max: np.ndarray
+    z_min: np.ndarray
+    z_max: np.ndarray
+    area: np.ndarray
+    n_pixels: np.ndarray
+
+    def __len__(self):
+        return len(self.area)
+
+    @classmethod
+    def empty(cls) -> "LayerTable":
+        return cls(*(np.empty(0) for _ in range(6)))
+
+
+def make_barrel_table(r: np.ndarray, z: np.ndarray, double_layers: bool) -> LayerTable:
+    """Barrel layers of radii `r` and half lengths `z`, a double layer is given by its inner radius."""
+    r, z = np.asarray(r, dtype=float), np.asarray(z, dtype=float)
+    if double_layers:
+        r = np.column_stack([r, r + DOUBLE_LAYER_DISTANCE]).ravel()
+        z = np.repeat(z, 2)
+
+    area = 2 * np.pi * r * 2 * z
+    if double_layers:
+        # the area of a (sensor) layer of a double layer includes its partner layer
+        area += 2 * np.pi * (r + DOUBLE_LAYER_DISTANCE) * 2 * z
+    return LayerTable(r, r, -z, z, area, area / vertex_pixel_size**2)
+
+
+def make_endcap_table(z: np.ndarray, r: np.ndarray, double_layers: bool) -> LayerTable:
+    """Endcap discs at `z` with outer radii `r`, a double disc is given by its inner z."""
+    z, r = np.asarray(z, dtype=float), np.asarray(r, dtype=float)
+    if double_layers:
+        z = np.column_stack([z, z + DOUBLE_LAYER_DISTANCE]).ravel()
+        r = np.repeat(r, 2)
 
-def calculate_endcap_area(subdet_params, sub_det_cols, layer):
-    radius = subdet_params["ve"]["r"][layer]
-    
     # factor of 2 to include both endcaps
-    area = 2 * pi * radius**2 
-    return area
-
-def calculate_TPC_area(tpc_params):
-    return 2 * pi * (tpc_params["r_outer"][0]**2 - tpc_params["r_inner"][0]**2)
-
-def get_area(parameters):
-
-    parameters = split_double_layers(parameters)
-
-    new_params = {}
-    for det_mod, det_params in parameters.items():
-        # --- Vertex ---
-        vb_areas = [
-            calculate_barrel_area(det_params["Vertex"], SUB_DET_COLS[det_mod], i)
-            for i in range(len(det_params["Vertex"]["vb"]["r"]))
-        ]
-        ve_areas = [
-            calculate_endcap_area(det_params["Vertex"], SUB_DET_COLS[det_mod], i)
-            for i in range(len(det_params["Vertex"]["ve"]["z"]))
-        ]
-        vb_pixels = [a / pixel_areas["Vertex"] for a in vb_areas]
-        ve_pixels = [a / pixel_areas["Vertex"] for a in ve_areas]
-
-        # --- TPC ---
-        tpc_area = calculate_TPC_area(det_params["TPC"]["TPC"])
-        tpc_pixels = tpc_area / pixel_areas["TPC"]
-
-        # --- Assemble ---
-        new_params[det_mod] = {
-            **det_params,
-            "Vertex": {
-                **det_params["Vertex"],
-                "vb": {**det_params["Vertex"]["vb"], "a": vb_areas, "n_pixels": vb_pixels},
-                "ve": {**det_params["Vertex"]["ve"], "a": ve_areas, "n_pixels": ve_pixels},
-            },
-            "TPC": {
-                **det_params["TPC"],
-                "TPC": {**det_params["TPC"]["TPC"], "a": [tpc_area], "n_pixels": [tpc_pixels]},
-            },
-        }
-
-    return new_params
-
-def get_params():
-
-    fcc_vertex_params = extract_constants(vertex_xml, KEYWORDS["Vertex"])
-    large_TPC_params = extract_constants(large_TPC_xml, KEYWORDS["TPC"])
-    small_TPC_params = extract_constants(small_TPC_xml, KEYWORDS["TPC"])
-
-    parameters = {
-        "ILD_FCCee_v01": {
-            "Vertex": {
-                "vb": {
-                    "r": fcc_vertex_params["VertexBarrel_r"],
-                    "z": fcc_vertex_params["VertexBarrel_zmax"] * len(fcc_vertex_params["VertexBarrel_r"]),
-                    "a": [],
-                    "n_pixels": [],
-                },
-                "ve": {
-                    "r": fcc_vertex_params["VertexEndcap_rmax"] * len(fcc_vertex_params["VertexEndcap_z"]),
-                    "z": fcc_vertex_params["VertexEndcap_z"],
-                    "a": [],
-                    "n_pixels": [],
-                }
-            },
-            "TPC": {
-                "TPC": {
-                    "r_inner": large_TPC_params["top_TPC_inner_radius"],
-                    "r_outer": large_TPC_params["top_TPC_outer_radius"],
-                    "z": [],
-                    "a": [],
-                    "n_pixels": [],
-                }
-            },
-        },
-        "ILD_FCCee_v02": {
-            "Vertex": {
-                "vb": {
-                    "r": fcc_vertex_params["VertexBarrel_r"],
-                    "z": fcc_vertex_params["VertexBarrel_zmax"] * len(fcc_vertex_params["VertexBarrel_r"]),
-                    "a": [],
-                    "n_pixels": [],
-                },
-                "ve": {
-                    "r": fcc_vertex_params["VertexEndcap_rmax"] * len(fcc_vertex_params["VertexEndcap_z"]),
-                    "z": fcc_vertex_params["VertexEndcap_z"],
-                    "a": [],
-                    "n_pixels": [],
-                }
-            },
-            "TPC": {
-                "TPC": {
-                    "r_inner": small_TPC_params["top_TPC_inner_radius"],
-                    "r_outer": small_TPC_params["top_TPC_outer_radius"],
-                    "z": [],
-                    "a": [],
-                    "n_pixels": [],
-                }
-            },
-        },
-        "ILD_l5_v02": {
-            "Vertex": {
-                "vb": {
-                    "r": ILC_vb_params["r"],
-                    "z": ILC_vb_params["z"],
-                    "a": [],
-                    "n_pixels": [],
-                },
-                "ve": {
-                    "r": [],
-                    "z": [],
-                    "a": [],
-                    "n_pixels": [],
-                },
-            },
-            "TPC": {
-                "TPC": {
-                    "r_inner": large_TPC_params["top_TPC_inner_radius"],
-                    "r_outer": large_TPC_params["top_TPC_outer_radius"],
-                    "z": [],
-                    "a": [],
-                    "n_pixels": [],
-                }
-            },
-        },
-    }
-
-    return get_area(parameters)
\ No newline at end of file
+    area = 2 * np.pi * r**2
+    return LayerTable(np.zeros_like(r), r, z, z, area, area / vertex_pixel_size**2)
+
+
+def make_tpc_table(r_inner: float, r_outer: float, half_length: float, pad_area: float) -> LayerTable:
+    area = 2 * np.pi * (r_outer**2 - r_inner**2)
+    values = (r_inner, r_outer, -half_length, half_length, area, area / pad_area)
+    return LayerTable(*(np.array([value], dtype=float) for value in values))
+
+
+def compile_barrel(constants: ConstantTable, config, tree: CompactTree) -> LayerTable:
+    """
+    Raises:
+        KeyError: If the compact files of a non-ILC model have no vertex barrel radii.
+    """
+    r = constants.get_prefixed("VertexBarrel_r")
+    z = np.resize(constants.get_prefixed("VertexBarrel_zmax"), len(r))
+    if not len(r):
+        if not config.is_accelerator_ilc():
+            raise KeyError(f"Vertex barrel radii not found in the compact files {[str(f) for f in tree.files[:1]]}")
+        r, z = np.array(ILC_vb_params["r"], dtype=float), np.array(ILC_vb_params["z"], dtype=float)
+    double_layers = config.get_sub_detector_collection_info()["vb"].only_double_layers
+    return make_barrel_table(r, z, double_layers)
+
+
+def compile_endcap(constants: ConstantTable, double_layers: bool) -> LayerTable:
+    z = constants.get_prefixed("VertexEndcap_z")
+    r = np.resize(constants.get_prefixed("VertexEndcap_rmax"), len(z))
+    return make_endcap_table(z, r, double_layers)
+
+
+def get_tpc_pad_area(tree: CompactTree, constants: ConstantTable) -> float:
+    """Area of a TPC pad in mm² from the <global> element of the TPC detector."""
+    global_element = tree.detectors[TPC_DETECTOR_NAME].find("global")
+    return constants.evaluate(global_element.get("TPC_pad_height")) * constants.evaluate(
+        global_element.get("TPC_pad_width")
+    )
+
+
+def compile_tpc(constants: ConstantTable, tree: CompactTree) -> LayerTable:
+    if "top_TPC_inner_radius" not in constants or "top_TPC_outer_radius" not in constants:
+        raise KeyError(f"TPC radii not found in the compact files {[str(f) for f in tree.files[:1]]}")
+    r_inner = constants["top_TPC_inner_radius"]
+    r_outer = constants["top_TPC_outer_radius"]
+    half_length = constants.get(TPC_HALF_LENGTH_CONSTANT, np.nan)
+    return make_tpc_table(r_inner, r_outer, half_length, get_tpc_pad_area(tree, constants))
+
+
+@lru_cache(maxsize=None)
+def compile_geometry(detector_model: str) -> Dict[str, LayerTable]:
+    """
+    Compiles the layer tables of all sub-detector collections of a model.
+    The forward discs (f) have no layer constants yet and get an empty table.
+
+    Raises:
+        FileNotFoundError: If the compact files of the model are not available.
+        KeyError: If the compact files lack the layers of a sub-detector, e.g. the vertex of an FCC-ee model.
+    """
+    from platform_paths import get_code_dir
+
+    config = detector_model_configurations[detector_model]
+    k4geo_dir = get_code_dir() / "k4geo"
+    tree = read_compact_tree(k4geo_dir / config.get_compact_file_path())
+    expressions = dict(tree.constants)
+    if config.is_accelerator_fccee():
+        vertex_tree = read_compact_tree(k4geo_dir / FCC_VERTEX_COMPACT_FILE)
+        expressions.update(
+            (name, expression)
+            for name, expression in vertex_tree.constants.items()
+            if name.startswith(VERTEX_CONSTANT_PREFIXES)
+        )
+    constants = ConstantTable(expressions)
+
+    tables = {}
+    for sub_det_key, collection in config.get_sub_detector_collection_info().items():
+        if sub_det_key == "vb":
+            tables[sub_det_key] = compile_barrel(constants, config, tree)
+        elif sub_det_key == "ve":
+            tables[sub_det_key] = compile_endcap(constants, collection.only_double_layers)
+        elif sub_det_key == "tpc":
+            tables[sub_det_key] = compile_tpc(constants, tree)
+        else:
+            tables[sub_det_key] = LayerTable.empty()
+    return tables
+
+
+def get_model_params(detector_model: str) -> Dict:
+    """The layers of a model as nested dicts of lists, e.g. ["Vertex"]["vb"]["r"]."""
+    tables = compile_geometry(detector_model)
+    params = {}
+    for sub_det_key, table in tables.items():
+        group, key = PARAM_KEYS[sub_det_key]
+        if sub_det_key == "tpc":
+            layer_params = {
+                "r_inner": table.r_min.tolist(),
+                "r_outer": table.r_max.tolist(),
+                "z": table.z_max[~np.isnan(table.z_max)].tolist(),
+            }
+        else:
+            layer_params = {
+                "r": table.r_max.tolist(),
+                "z": (table.z_min if sub_det_key in ("ve", "f") else table.z_max).tolist(),
+            }
+        layer_params.update(a=table.area.tolist(), n_pixels=table.n_pixels.tolist())
+        params.setdefault(group, {})[key] = layer_params
+    return params
+
+
+def get_params() -> Dict[str, Dict]:
+    """The layers of all models of `detector_model_configurations`, see `get_model_params`."""
+    return {detector_model: get_model_params(detector_model) for detector_model in detector_model_configurations}
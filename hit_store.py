@@ -0,0 +1,201 @@
+"""
+Sharing of the hits between analysis worker processes.
+
+The hit dict returned by `handle_cache_operations` is copied once into a single
+buffer, either a `multiprocessing.shared_memory` block ("shm") or a file that
+is memory-mapped read-only ("mmap", e.g. on a local scratch disk if /dev/shm
+is small). Workers get a lightweight, picklable `HitStoreHandle` and attach
+to it, which gives them read-only numpy views of the shared columns. N workers
+analysing the same sample thus share one copy of the hits instead of each
+unpickling its own.
+
+    with load_shared_hits(cache_dir, detector_model, scenario, num_bX, file_paths) as store:
+        results = run_with_shared_hits(store.handle, make_table, scenarios, workers=4)
+
+The owner of the `SharedHitStore` frees the buffer on `close`. The arrays handed
+to the workers are read-only, functions modifying them in place need a copy.
+"""
+
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, NamedTuple, Tuple
+
+import numpy as np
+
+SHARED_MEMORY_BACKEND = "shm"
+MEMORY_MAP_BACKEND = "mmap"
+# columns start at cache line boundaries
+ALIGNMENT = 64
+
+# the shared buffers attached by this process, keeping its views valid
+_attached: Dict[str, Tuple[object, Dict[str, Dict[str, np.ndarray]]]] = {}
+
+
+class HitStoreHandle(NamedTuple):
+    """
+    Picklable reference to shared hits: the backend, the name of the shared
+    memory block or the path of the mapped file, and the offset, dtype and
+    shape of every column.
+    """
+
+    backend: str
+    name: str
+    layout: Dict[str, Dict[str, Tuple[int, str, Tuple[int, ...]]]]
+
+
+def get_layout(hits: Dict[str, Dict[str, np.ndarray]]) -> Tuple[Dict, int]:
+    """Offsets of the columns in the shared buffer and its total size in bytes."""
+    layout = {}
+    offset = 0
+    for sub_det_key, observables in hits.items():
+        layout[sub_det_key] = {}
+        for observable, array in observables.items():
+            layout[sub_det_key][observable] = (offset, array.dtype.str, array.shape)
+            offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    return layout, offset
+
+
+def get_views(buffer, layout: Dict) -> Dict[str, Dict[str, np.ndarray]]:
+    hits = {}
+    for sub_det_key, columns in layout.items():
+        hits[sub_det_key] = {}
+        for observable, (offset, dtype, shape) in columns.items():
+            array = np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+            array.flags.writeable = False
+            hits[sub_det_key][observable] = array
+    return hits
+
+
+def close_shared_memory(block: shared_memory.SharedMemory) -> None:
+    try:
+        block.close()
+    except BufferError:
+        # views of the block are still alive, it is unmapped once they are gone
+        pass
+
+
+class SharedHitStore:
+    """
+    Owner of a shared copy of the hits.
+
+    Parameters:
+    - hits (Dict[str, Dict[str, np.ndarray]]): Hits as returned by `get_hits`.
+    - backend (str, optional): "shm" for shared memory or "mmap" for a memory-mapped file.
+    - directory (Path | str, optional): Directory of the mapped file of the "mmap"
+      backend, defaults to the current directory.
+    """
+
+    def __init__(self, hits, backend: str = SHARED_MEMORY_BACKEND, directory: Path | str | None = None):
+        layout, size = get_layout(hits)
+        # zero sized blocks are not allowed
+        size = max(size, 1)
+        if backend == SHARED_MEMORY_BACKEND:
+            self._block = shared_memory.SharedMemory(create=True, size=size)
+            buffer = self._block.buf
+            name = self._block.name
+        elif backend == MEMORY_MAP_BACKEND:
+            name = os.fspath(Path(directory or ".") / f"hit_store_{uuid.uuid4().hex}.bin")
+            self._block = np.memmap(name, dtype=np.uint8, mode="w+", shape=(size,))
+            buffer = self._block
+        else:
+            raise ValueError(
+                f"Unknown backend '{backend}', choose {SHARED_MEMORY_BACKEND} or {MEMORY_MAP_BACKEND}"
+            )
+
+        for sub_det_key, columns in layout.items():
+            for observable, (offset, dtype, shape) in columns.items():
+                target = np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+                target[...] = hits[sub_det_key][observable]
+        if backend == MEMORY_MAP_BACKEND:
+            self._block.flush()
+        self.handle = HitStoreHandle(backend, name, layout)
+
+    def close(self) -> None:
+        """Frees the shared buffer, the workers must not use their views anymore."""
+        detach_hits(self.handle)
+        if self.handle.backend == SHARED_MEMORY_BACKEND:
+            close_shared_memory(self._block)
+            self._block.unlink()
+        else:
+            del self._block
+            Path(self.handle.name).unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def attach_hits(handle: HitStoreHandle) -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    Returns read-only views of the shared hits. The buffer is attached once per
+    process, later calls return the same views.
+    """
+    if handle.name not in _attached:
+        if handle.backend == SHARED_MEMORY_BACKEND:
+            # the workers of a process pool share the resource tracker of the owner,
+            # so the block stays registered once and is unlinked by the owner only
+            block = shared_memory.SharedMemory(name=handle.name)
+            buffer = block.buf
+        else:
+            block = buffer = np.memmap(handle.name, dtype=np.uint8, mode="r")
+        _attached[handle.name] = (block, get_views(buffer, handle.layout))
+    # a new dict, so callers can add columns without affecting the other callers
+    return {
+        sub_det_key: dict(observables)
+        for sub_det_key, observables in _attached[handle.name][1].items()
+    }
+
+
+def detach_hits(handle: HitStoreHandle) -> None:
+    """Releases the buffer attached by this process, the views must not be used anymore."""
+    block, hits = _attached.pop(handle.name, (None, None))
+    if block is None:
+        return
+    hits.clear()
+    if handle.backend == SHARED_MEMORY_BACKEND:
+        close_shared_memory(block)
+
+
+def load_shared_hits(
+    cache_dir: str,
+    detector_model: str,
+    scenario: str,
+    num_bX: int,
+    file_paths: List[str],
+    backend: str = SHARED_MEMORY_BACKEND,
+    directory: Path | str | None = None,
+    **kwargs,
+) -> SharedHitStore:
+    """
+    Loads the hits with `handle_cache_operations` (further keyword arguments are
+    passed on) and puts them into a `SharedHitStore` for the workers.
+    """
+    from caching import handle_cache_operations
+
+    hits = handle_cache_operations(cache_dir, detector_model, scenario, num_bX, file_paths, **kwargs)
+    return SharedHitStore(hits, backend, directory)
+
+
+def call_with_shared_hits(handle: HitStoreHandle, function: Callable, task):
+    return function(attach_hits(handle), task)
+
+
+def run_with_shared_hits(
+    handle: HitStoreHandle, function: Callable, tasks: Iterable, workers: int | None = None
+) -> List:
+    """
+    Calls `function(hits, task)` for every task in worker processes, which all
+    attach to the same shared hits. `function` must be picklable, i.e. defined
+    at the top level of a module.
+
+    Returns:
+    - List: The results in the order of the tasks.
+    """
+    tasks = list(tasks)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(call_with_shared_hits, [handle] * len(tasks), [function] * len(tasks), tasks))
@@ -0,0 +1,170 @@
+"""
+Lightweight stage instrumentation of analysis runs.
+
+Stages are wrapped in `span` context managers:
+
+    with span("read_files"):
+        hits = get_hits(file_paths, detector_model)
+
+Each span records the following:
+- wall time;
+- CPU time;
+- bytes read by the process, from `rchar` of /proc/self/io, so page cache
+  hits count as well;
+- peak RSS of the process up to the end of the span (`peak_rss_mb`) and how
+  much the span raised it (`peak_rss_mb_increase`). The peak RSS never
+  decreases, so a span whose allocations stay below the peak of an earlier
+  stage has no increase.
+Spans nest, and a span's name is prefixed by the names of its enclosing spans.
+
+Other per-item measurements, e.g. the telemetry of every input file, are
+added to the active report with `record`.
+
+Spans only record if a `RunReport` is active (see `activate_report`).
+Otherwise `span` returns a shared no-op context manager, so the
+instrumentation costs a function call per stage when disabled.
+"""
+
+import csv
+import json
+import resource
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Dict, List
+
+_NULL_SPAN = nullcontext()
+_active_report = None
+
+PROC_IO_FILE = "/proc/self/io"
+SPAN_FIELDS = ("stage", "depth", "wall_s", "cpu_s", "bytes_read", "peak_rss_mb", "peak_rss_mb_increase")
+
+
+def get_bytes_read() -> int:
+    """Bytes read by the process so far, 0 where /proc is not available."""
+    try:
+        with open(PROC_IO_FILE, "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("rchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def get_peak_rss_mb() -> float:
+    """Peak RSS of the process since its start, not of the current stage."""
+    # ru_maxrss is given in kB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class RunReport:
+    """
+    Collects the spans and records of one run, e.g. of one (detector model,
+    scenario) combination, and writes them as JSON and CSV.
+
+    Parameters:
+    - name (str): Name of the run, stored in the report.
+    - metadata (Dict, optional): Additional information stored in the report.
+    """
+
+    def __init__(self, name: str, metadata: Dict | None = None):
+        self.name = name
+        self.metadata = metadata or {}
+        self.spans: List[Dict] = []
+        self.records: Dict[str, List[Dict]] = {}
+        self._stack: List[str] = []
+
+    @contextmanager
+    def span(self, stage: str):
+        self._stack.append(stage)
+        record = {"stage": "/".join(self._stack), "depth": len(self._stack) - 1}
+        # reserve the position, so enclosing spans are listed before the nested ones
+        self.spans.append(record)
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        start_bytes = get_bytes_read()
+        start_peak_rss_mb = get_peak_rss_mb()
+        try:
+            yield record
+        finally:
+            record["wall_s"] = time.perf_counter() - start_wall
+            record["cpu_s"] = time.process_time() - start_cpu
+            record["bytes_read"] = get_bytes_read() - start_bytes
+            record["peak_rss_mb"] = get_peak_rss_mb()
+            record["peak_rss_mb_increase"] = record["peak_rss_mb"] - start_peak_rss_mb
+            self._stack.pop()
+
+    def add_record(self, kind: str, data: Dict) -> None:
+        self.records.setdefault(kind, []).append(data)
+
+    def to_dict(self) -> Dict:
+        return {"name": self.name, **self.metadata, "spans": self.spans, **self.records}
+
+    def write(self, report_dir: Path) -> Path:
+        """Writes `<name>.json` and `<name>.csv` to `report_dir` and returns the JSON path."""
+        report_dir = Path(report_dir)
+        report_dir.mkdir(parents=True, exist_ok=True)
+        json_file = report_dir / f"{self.name}.json"
+        with open(json_file, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=4)
+        with open(report_dir / f"{self.name}.csv", "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=SPAN_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(self.spans)
+        for kind, records in self.records.items():
+            write_records_csv(report_dir / f"{self.name}_{kind}.csv", records)
+        return json_file
+
+    def print_summary(self) -> None:
+        for record in self.spans:
+            indent = "  " * record["depth"]
+            stage = record["stage"].rsplit("/", 1)[-1]
+            print(
+                f"{indent}{stage:<{32 - len(indent)}} {record['wall_s']:9.2f} s wall "
+                f"{record['cpu_s']:9.2f} s CPU {record['bytes_read'] / 2**20:10.1f} MB read "
+                f"{record['peak_rss_mb']:9.0f} MB peak RSS (+{record['peak_rss_mb_increase']:.0f})"
+            )
+
+
+def flatten_record(data: Dict) -> Dict:
+    """Expands nested dicts into `<key>_<subkey>` columns."""
+    flat = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            flat.update({f"{key}_{k}": v for k, v in value.items()})
+        else:
+            flat[key] = value
+    return flat
+
+
+def write_records_csv(csv_file: Path, records: List[Dict]) -> None:
+    rows = [flatten_record(data) for data in records]
+    fieldnames = list(dict.fromkeys(key for row in rows for key in row))
+    with open(csv_file, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def activate_report(report: RunReport | None) -> None:
+    """Makes `report` the target of `span`, None disables the instrumentation."""
+    global _active_report
+    _active_report = report
+
+
+def get_active_report() -> RunReport | None:
+    return _active_report
+
+
+def span(stage: str):
+    """Context manager timing a stage in the active report, a no-op if there is none."""
+    if _active_report is None:
+        return _NULL_SPAN
+    return _active_report.span(stage)
+
+
+def record(kind: str, data: Dict) -> None:
+    """Adds a measurement to the active report, a no-op if there is none."""
+    if _active_report is not None:
+        _active_report.add_record(kind, data)
@@ -0,0 +1,388 @@
+"""
+Cost-model-based job sizing for simall submissions.
+
+Every input file (shard) is scanned once for its particle count and total
+energy. Together with a per detector model cost model, which is calibrated
+from the logs of past jobs when available, this gives an estimate of the CPU
+time and memory of simulating the shard. Heavy shards are split into event
+ranges, light shards are packed into a common job until the target wall time
+is reached, and each job requests the resources it is expected to need.
+
+A small `<job name>.plan.json` sidecar is written next to every planned job.
+Once the job has finished, the sidecar and the HTCondor job log are used to
+calibrate the cost model of later campaigns.
+"""
+
+import json
+import math
+import re
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List
+
+from local_executor import load_usage_report
+
+PLAN_SIDECAR_SUFFIX = ".plan.json"
+
+DEFAULT_TARGET_WALL_TIME = 4 * 3600  # s
+MIN_REQUEST_MEMORY = 2048  # MB
+MEMORY_GRANULARITY = 512  # MB
+RESOURCE_SAFETY_FACTOR = 1.5
+MIN_CALIBRATION_JOBS = 3
+
+
+@dataclass
+class CostModel:
+    """Linear estimate of the CPU time and memory of a ddsim job."""
+
+    cpu_s_overhead: float  # geometry construction, physics list, ...
+    cpu_s_per_gev: float
+    mem_mb_base: float
+    mem_mb_per_particle: float  # per particle of the largest event
+
+    def cpu_time(self, energy_gev: float) -> float:
+        return self.cpu_s_overhead + self.cpu_s_per_gev * energy_gev
+
+    def memory(self, max_particles_per_event: int) -> float:
+        return self.mem_mb_base + self.mem_mb_per_particle * max_particles_per_event
+
+
+# conservative starting values, replaced as soon as enough job logs exist
+DEFAULT_COST_MODELS = {
+    "FCCee": CostModel(
+        cpu_s_overhead=300.0,
+        cpu_s_per_gev=2.0,
+        mem_mb_base=1500.0,
+        mem_mb_per_particle=0.5,
+    ),
+    "ILC": CostModel(
+        cpu_s_overhead=400.0,
+        cpu_s_per_gev=4.0,
+        mem_mb_base=2500.0,
+        mem_mb_per_particle=2.0,
+    ),
+}
+
+
+@dataclass
+class InputStats:
+    n_particles: int
+    n_events: int
+    energy_gev: float
+
+
+@dataclass
+class Shard:
+    """A contiguous event range of a single input file."""
+
+    input_file: str
+    out_name: Path
+    skip_events: int
+    n_events: int  # -1: all remaining events
+    expected_events: int  # events actually contained in the range
+    n_particles: int
+    energy_gev: float
+    max_particles_per_event: int
+    cpu_s: float = 0.0
+    mem_mb: float = 0.0
+
+
+@dataclass
+class PlannedJob:
+    shards: List[Shard] = field(default_factory=list)
+    request_runtime: int = 0
+    request_memory: int = 0
+
+    @property
+    def name(self) -> Path:
+        """Base name of the job files (log, out, err, condor, plan)."""
+        return self.shards[0].out_name
+
+    @property
+    def cpu_s(self) -> float:
+        return sum(shard.cpu_s for shard in self.shards)
+
+
+def _hepevt_energy(columns: List[str]) -> float:
+    # long format: ISTHEP IDHEP JMO1 JMO2 JDA1 JDA2 PX PY PZ E M VX VY VZ T
+    if len(columns) >= 10:
+        return abs(float(columns[9]))
+    # short format: ISTHEP IDHEP JDA1 JDA2 PX PY PZ M
+    px, py, pz, mass = (float(c) for c in columns[4:8])
+    return math.sqrt(px * px + py * py + pz * pz + mass * mass)
+
+
+@lru_cache(maxsize=None)
+def scan_input_file(input_file: str) -> InputStats:
+    """
+    Fast single pass over a GuineaPig `.pairs` or a `.hepevt` file counting
+    particles, events and the summed particle energy in GeV.
+
+    The result is memoised as the same input file is simulated with every
+    detector model.
+    """
+    n_particles = 0
+    n_events = 0
+    energy = 0.0
+    is_hepevt = input_file.endswith(".hepevt")
+
+    with open(input_file, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            columns = line.split()
+            if not columns:
+                continue
+            if is_hepevt:
+                # event headers only carry the particle count (and event number)
+                if len(columns) <= 2:
+                    n_events += 1
+                    continue
+                energy += _hepevt_energy(columns)
+            else:
+                # GuineaPig: E vx vy vz x y z ..., E signed by the charge
+                energy += abs(float(columns[0]))
+            n_particles += 1
+
+    return InputStats(n_particles, max(n_events, 1), energy)
+
+
+def parse_condor_log(log_path: Path) -> Dict[str, float] | None:
+    """
+    Extracts the used CPU time in seconds and the memory usage in MB from the
+    termination event of an HTCondor job log. Returns None for jobs that did
+    not terminate normally.
+    """
+    try:
+        text = Path(log_path).read_text(encoding="utf-8", errors="replace")
+    except OSError:
+        return None
+
+    if "Normal termination (return value 0)" not in text:
+        return None
+
+    usage = re.search(
+        r"Usr (\d+) (\d+):(\d+):(\d+), Sys (\d+) (\d+):(\d+):(\d+)\s+-\s+Run Remote Usage",
+        text,
+    )
+    memory = re.search(r"Memory \(MB\)\s*:\s*(\d+)", text)
+    if usage is None or memory is None:
+        return None
+
+    values = [int(v) for v in usage.groups()]
+    cpu_s = sum(
+        d * 86400 + h * 3600 + m * 60 + s
+        for d, h, m, s in (values[:4], values[4:])
+    )
+    return {"cpu_s": float(cpu_s), "mem_mb": float(memory.group(1))}
+
+
+def load_job_history(history_dir: Path, detector_model: str) -> List[Dict[str, float]]:
+    """Collects plan sidecars of finished jobs of `detector_model` with their resource usage."""
+    history = []
+    for sidecar in Path(history_dir).glob(
+        f"*/{detector_model}/*/*{PLAN_SIDECAR_SUFFIX}"
+    ):
+        job_name = str(sidecar)[: -len(PLAN_SIDECAR_SUFFIX)]
+        # jobs of the local backend leave a usage report instead of a Condor log
+        usage = parse_condor_log(Path(f"{job_name}.log")) or load_usage_report(job_name)
+        if usage is None:
+            continue
+        with open(sidecar, "r", encoding="utf-8") as f:
+            plan = json.load(f)
+        history.append({**usage, **plan})
+    return history
+
+
+def calibrate_cost_model(default: CostModel, history: List[Dict[str, float]]) -> CostModel:
+    """
+    Fits the linear CPU time and memory terms to the job history. Coefficients
+    are kept non-negative and the default model is returned if there are too few
+    jobs to fit.
+    """
+    if len(history) < MIN_CALIBRATION_JOBS:
+        return default
+
+    # only needed with a job history, keeps the import of simall light
+    import numpy as np
+
+    energy = np.array([job["energy_gev"] for job in history])
+    cpu_s = np.array([job["cpu_s"] for job in history])
+    max_particles = np.array([job["max_particles_per_event"] for job in history])
+    mem_mb = np.array([job["mem_mb"] for job in history])
+
+    def linear_fit(x, y, default_slope, default_offset):
+        if np.ptp(x) == 0:
+            return default_slope, default_offset
+        slope, offset = np.polyfit(x, y, 1)
+        return max(slope, 0.0), max(offset, 0.0)
+
+    cpu_s_per_gev, cpu_s_overhead = linear_fit(
+        energy, cpu_s, default.cpu_s_per_gev, default.cpu_s_overhead
+    )
+    mem_mb_per_particle, mem_mb_base = linear_fit(
+        max_particles, mem_mb, default.mem_mb_per_particle, default.mem_mb_base
+    )
+    return CostModel(cpu_s_overhead, cpu_s_per_gev, mem_mb_base, mem_mb_per_particle)
+
+
+def get_cost_model(accelerator_name: str, detector_model: str, history_dir: Path | None) -> CostModel:
+    default = DEFAULT_COST_MODELS[accelerator_name]
+    if history_dir is None:
+        return default
+    return calibrate_cost_model(default, load_job_history(history_dir, detector_model))
+
+
+def split_into_shards(
+    input_file: str,
+    out_name: Path,
+    particles_per_event: int,
+    cost_model: CostModel,
+    target_wall_time: float,
+    max_events: int | None = None,
+) -> List[Shard]:
+    """
+    Splits the first `max_events` events (all if None) of an input file into
+    event ranges whose estimated CPU time fits the target.
+    """
+    stats = scan_input_file(input_file)
+
+    if particles_per_event > 0:
+        n_file_events = max(math.ceil(stats.n_particles / particles_per_event), 1)
+        particles_per_event = min(particles_per_event, stats.n_particles)
+    else:
+        # GuineaPig input with -1: everything in one event
+        n_file_events = stats.n_events
+        particles_per_event = math.ceil(stats.n_particles / n_file_events)
+    # ddsim only simulates --nEvents events of the file, like an unsplit job
+    n_events = min(n_file_events, max_events) if max_events and max_events > 0 else n_file_events
+
+    per_event_cpu = cost_model.cpu_s_per_gev * stats.energy_gev / n_file_events
+    events_per_shard = (
+        max(int((target_wall_time - cost_model.cpu_s_overhead) // per_event_cpu), 1)
+        if per_event_cpu > 0
+        else n_events
+    )
+    n_shards = math.ceil(n_events / events_per_shard)
+
+    shards = []
+    for k in range(n_shards):
+        skip = k * events_per_shard
+        n = min(events_per_shard, n_events - skip)
+        fraction = n / n_file_events
+        shard = Shard(
+            input_file=input_file,
+            out_name=(
+                out_name if n_shards == 1 else out_name.with_name(f"{out_name.name}s{k}")
+            ),
+            skip_events=skip,
+            n_events=-1 if n_shards == 1 else n,
+            expected_events=n,
+            n_particles=round(stats.n_particles * fraction),
+            energy_gev=stats.energy_gev * fraction,
+            max_particles_per_event=particles_per_event,
+        )
+        shard.cpu_s = cost_model.cpu_time(shard.energy_gev)
+        shard.mem_mb = cost_model.memory(shard.max_particles_per_event)
+        shards.append(shard)
+
+    return shards
+
+
+def _round_up(value: float, granularity: int) -> int:
+    return int(math.ceil(value / granularity) * granularity)
+
+
+def pack_shards(shards: List[Shard], target_wall_time: float) -> List[PlannedJob]:
+    """
+    First-fit-decreasing packing of shards into jobs. condor_sub_exec.sh runs a
+    separate ddsim per shard of a job, so every shard pays the full setup
+    overhead and is charged its full CPU time.
+    """
+    jobs: List[PlannedJob] = []
+    for shard in sorted(shards, key=lambda s: s.cpu_s, reverse=True):
+        for job in jobs:
+            if job.cpu_s + shard.cpu_s <= target_wall_time:
+                job.shards.append(shard)
+                break
+        else:
+            jobs.append(PlannedJob(shards=[shard]))
+
+    for job in jobs:
+        job.request_runtime = _round_up(job.cpu_s * RESOURCE_SAFETY_FACTOR, 600)
+        job.request_memory = max(
+            _round_up(
+                max(s.mem_mb for s in job.shards) * RESOURCE_SAFETY_FACTOR,
+                MEMORY_GRANULARITY,
+            ),
+            MIN_REQUEST_MEMORY,
+        )
+    return jobs
+
+
+def plan_shards(
+    input_files: List[str],
+    out_dir: Path,
+    out_name_prefix: str,
+    particles_per_event: int,
+    cost_model: CostModel,
+    target_wall_time: float = DEFAULT_TARGET_WALL_TIME,
+    max_events: int | None = None,
+) -> List[Shard]:
+    """
+    Plans the shards for all input files of one bunch crossing directory, of
+    at most `max_events` events per file. The output of input file `i` is
+    named `<out_name_prefix>-part_<i>`, with an additional `s<k>` suffix if the
+    file had to be split.
+    """
+    return [
+        shard
+        for i, input_file in enumerate(input_files)
+        for shard in split_into_shards(
+            input_file,
+            out_dir / f"{out_name_prefix}-part_{i}",
+            particles_per_event,
+            cost_model,
+            target_wall_time,
+            max_events,
+        )
+    ]
+
+
+def plan_jobs(
+    input_files: List[str],
+    out_dir: Path,
+    out_name_prefix: str,
+    particles_per_event: int,
+    cost_model: CostModel,
+    target_wall_time: float = DEFAULT_TARGET_WALL_TIME,
+    max_events: int | None = None,
+) -> List[PlannedJob]:
+    """Plans the shards of one bunch crossing directory and packs them into jobs."""
+    shards = plan_shards(
+        input_files,
+        out_dir,
+        out_name_prefix,
+        particles_per_event,
+        cost_model,
+        target_wall_time,
+        max_events,
+    )
+    return pack_shards(shards, target_wall_time)
+
+
+def write_plan_sidecar(job: PlannedJob) -> None:
+    """Stores the job's input summary so that its log can calibrate later plans."""
+    plan = {
+        "n_particles": sum(s.n_particles for s in job.shards),
+        "energy_gev": sum(s.energy_gev for s in job.shards),
+        "max_particles_per_event": max(s.max_particles_per_event for s in job.shards),
+        "estimated_cpu_s": job.cpu_s,
+        "request_runtime": job.request_runtime,
+        "request_memory": job.request_memory,
+        "shards": [
+            {**asdict(s), "out_name": str(s.out_name)} for s in job.shards
+        ],
+    }
+    sidecar = Path(f"{job.name}{PLAN_SIDECAR_SUFFIX}")
+    with open(sidecar, "w", encoding="utf-8") as f:
+        json.dump(plan, f, indent=4)
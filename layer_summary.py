@@ -0,0 +1,158 @@
+"""
+Per-layer summary of the hits of one (detector model, scenario) combination.
+
+The analysis stage divides the hits into layers once and stores one tidy record
+per layer in a small columnar `.npz` file in `<version>/summary_data`:
+the raw hit counts, the raw counts per bX, the area and number of pixels of the
+layer and the scaled hit rates in all units of `UNITS`. Tables are then a
+concatenate-and-pivot over these files and never read any hits again.
+A new unit only needs a new entry in `UNITS`, summaries without it are rebuilt
+once from the `_pos.json` files (see `read_summaries`).
+
+Only writing a summary needs the detector geometry; reading it does not.
+"""
+
+import json
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+
+SUMMARY_SUBDIR_NAME = "summary_data"
+SUMMARY_FILE_SUFFIX = "_summary.npz"
+KEY_COLUMNS = ("detector_model", "background", "scenario", "subdetector", "layer")
+COUNT_COLUMNS = ("num_bunch_crossings", "n_hits", "n_hits_per_bx", "area", "n_pixels")
+# summaries of an older format, e.g. with the area and pixels of the first layer for all layers, are rebuilt
+SUMMARY_FORMAT = 2
+
+# unit: hit rate in this unit, from the scaled hit rate per bX and the other summary columns
+UNITS: Dict[str, Callable[[Dict[str, np.ndarray]], np.ndarray]] = {
+    "per_bx": lambda columns: columns["per_bx"],
+    "per_bx_per_mm": lambda columns: columns["per_bx"] / columns["area"],
+    # given as percentages
+    "occupancy": lambda columns: 100 * columns["per_bx"] / columns["n_pixels"],
+    # of the hottest readout module, see module_occupancy.py
+    "module_occupancy": lambda columns: 100 * columns["module_per_bx_per_mm"] * columns["area"] / columns["n_pixels"],
+}
+
+
+def get_summary_file_path(directory: Path, detector_model: str, scenario: str) -> Path:
+    return Path(directory) / SUMMARY_SUBDIR_NAME / f"{detector_model}_{scenario}{SUMMARY_FILE_SUFFIX}"
+
+
+def get_layer_summary(divided_hits, scenario, background, num_bx, det_mod) -> Dict[str, np.ndarray]:
+    """
+    Summary columns of hits divided into layers by `divide_hits`, the rates
+    are the same as those of `scale_hits_dict`.
+
+    Returns:
+    - Dict[str, np.ndarray]: Columns of `KEY_COLUMNS`, `COUNT_COLUMNS` and `UNITS`, one row per layer.
+    """
+    from get_hits_per_layer import get_layer_index
+    from get_subdet_params import get_model_params
+    from module_occupancy import get_layer_module_density
+    from scale_hit_rate import scale_sr_hits
+
+    det_params = get_model_params(det_mod)
+    records = []
+    for subdet, subdet_hits in divided_hits.items():
+        for layer, hits in subdet_hits.items():
+            layer_params = det_params[subdet][layer.split("_")[0]]
+            index = get_layer_index(layer)
+            n_hits = len(hits["z"])
+            records.append(
+                {
+                    "subdetector": subdet,
+                    "layer": layer,
+                    "n_hits": n_hits,
+                    "n_hits_per_bx": n_hits / num_bx,
+                    "area": layer_params["a"][index],
+                    "n_pixels": layer_params["n_pixels"][index],
+                    "per_bx": scale_sr_hits(n_hits, scenario, background, num_bx),
+                    "module_per_bx_per_mm": scale_sr_hits(
+                        get_layer_module_density(layer, hits, det_mod), scenario, background, num_bx
+                    ),
+                }
+            )
+
+    columns = {
+        "summary_format": np.int64(SUMMARY_FORMAT),
+        "detector_model": np.full(len(records), det_mod),
+        "background": np.full(len(records), str(background)),
+        "scenario": np.full(len(records), scenario),
+        "subdetector": np.array([r["subdetector"] for r in records], dtype=str),
+        "layer": np.array([r["layer"] for r in records], dtype=str),
+        "num_bunch_crossings": np.full(len(records), num_bx),
+        "n_hits": np.array([r["n_hits"] for r in records], dtype=np.int64),
+        **{
+            key: np.array([r[key] for r in records], dtype=float)
+            for key in ("n_hits_per_bx", "area", "n_pixels", "per_bx", "module_per_bx_per_mm")
+        },
+    }
+    for unit, get_rate in UNITS.items():
+        columns[unit] = get_rate(columns)
+    return columns
+
+
+def summarize_hits(hits, detector_model, scenario, background, num_bx) -> Dict[str, np.ndarray]:
+    from get_hits_per_layer import divide_hits
+
+    return get_layer_summary(divide_hits(hits, detector_model), scenario, background, num_bx, detector_model)
+
+
+def summarize_json(json_path: Path) -> Dict[str, np.ndarray]:
+    """Summary of the hits of a `_pos.json` file written by `combined_analysis`."""
+    with open(json_path) as f:
+        data = json.load(f)
+    return summarize_hits(
+        data["hits"],
+        data["detector_model"],
+        data["scenario"],
+        data["background"],
+        data["num_bunch_crossings"],
+    )
+
+
+def write_summary(summary_file: Path, columns: Dict[str, np.ndarray]) -> None:
+    summary_file = Path(summary_file)
+    summary_file.parent.mkdir(parents=True, exist_ok=True)
+    np.savez(summary_file, **columns)
+
+
+def read_summary(summary_file: Path) -> Dict[str, np.ndarray]:
+    with np.load(summary_file, allow_pickle=False) as data:
+        return {key: data[key] for key in data.files}
+
+
+def is_current_summary(summary_file: Path) -> bool:
+    """Whether a summary is of the `SUMMARY_FORMAT` and has the columns of all `UNITS`, older summaries lack the newer units."""
+    with np.load(summary_file, allow_pickle=False) as data:
+        return (
+            "summary_format" in data.files
+            and int(data["summary_format"]) == SUMMARY_FORMAT
+            and set(UNITS) <= set(data.files)
+        )
+
+
+def read_summaries(directory: Path) -> List[Dict[str, np.ndarray]]:
+    """
+    Reads the summaries of all combinations of a version directory. `_pos.json`
+    files in `json_data` without a current summary (of an older format, without
+    all units or older than the json file) are summarized once and their
+    summary is stored.
+    """
+    directory = Path(directory)
+    for json_path in sorted((directory / "json_data").glob("*_pos.json")):
+        summary_file = directory / SUMMARY_SUBDIR_NAME / json_path.name.replace("_pos.json", SUMMARY_FILE_SUFFIX)
+        if (
+            not summary_file.exists()
+            or summary_file.stat().st_mtime < json_path.stat().st_mtime
+            or not is_current_summary(summary_file)
+        ):
+            print(f"Summarizing {json_path.name}")
+            write_summary(summary_file, summarize_json(json_path))
+
+    return [
+        read_summary(summary_file)
+        for summary_file in sorted((directory / SUMMARY_SUBDIR_NAME).glob(f"*{SUMMARY_FILE_SUFFIX}"))
+    ]
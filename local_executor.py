@@ -0,0 +1,174 @@
+"""
+Local process-pool executor, the third batch backend of simall next to
+HTCondor and bsub.
+
+Jobs are run on the current machine with the same command lines and output
+naming as the cluster backends: `<job name>.out` and `<job name>.err` hold the
+job's stdout and stderr. The number of concurrent jobs is bounded by the number
+of cores and by the memory requested by the running jobs. For every job the
+wall time, CPU time and peak RSS are written to `<job name>.usage.json`, which
+the job planner uses to calibrate the resource requests of cluster jobs.
+"""
+
+import json
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List
+
+from submit_utils_4_simall import JOB_SEPARATOR
+
+USAGE_REPORT_SUFFIX = ".usage.json"
+DEFAULT_JOB_MEMORY = 4096  # MB
+# return code of a job whose executable could not be started, like a shell's "command not found"
+NOT_STARTED_RETURN_CODE = 127
+
+
+def get_total_memory_mb() -> int:
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2**20
+
+
+@dataclass
+class LocalJob:
+    executable: str
+    arguments: List[str]
+    output_file_base_name: Path
+    request_memory: int = DEFAULT_JOB_MEMORY
+
+    def get_command_lines(self) -> List[List[str]]:
+        """One command line per shard packed into the job."""
+        command_lines = [[self.executable]]
+        for arg in self.arguments:
+            if arg == JOB_SEPARATOR:
+                command_lines.append([self.executable])
+            else:
+                command_lines[-1].append(arg)
+        return command_lines
+
+
+class LocalExecutor:
+    """
+    Runs the collected jobs in a bounded pool of worker threads, each driving
+    one child process at a time.
+
+    Parameters:
+    - max_workers (int): Upper limit of concurrent jobs, defaults to the number of cores.
+    - memory_budget (int): Memory in MB shared by the running jobs, defaults to
+      the physical memory of the machine.
+    - executable (str): If given, replaces the executable of every job, e.g. by
+      a stub for testing.
+    """
+
+    def __init__(self, max_workers=None, memory_budget=None, executable=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.memory_budget = memory_budget or get_total_memory_mb()
+        self.executable = executable
+        self.jobs: List[LocalJob] = []
+        self._available_memory = self.memory_budget
+        self._memory_condition = threading.Condition()
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def add_job(self, executable, arguments, output_file_base_name, request_memory=None):
+        self.jobs.append(
+            LocalJob(
+                self.executable or executable,
+                list(arguments),
+                Path(output_file_base_name),
+                request_memory or DEFAULT_JOB_MEMORY,
+            )
+        )
+
+    def _reserve_memory(self, job: LocalJob) -> int:
+        # a single job may use the whole budget, but not more
+        reservation = min(job.request_memory, self.memory_budget)
+        with self._memory_condition:
+            self._memory_condition.wait_for(
+                lambda: self._available_memory >= reservation
+            )
+            self._available_memory -= reservation
+        return reservation
+
+    def _release_memory(self, reservation: int) -> None:
+        with self._memory_condition:
+            self._available_memory += reservation
+            self._memory_condition.notify_all()
+
+    def run_job(self, job: LocalJob) -> Dict:
+        """Runs the shards of a job one after the other and writes its usage report."""
+        reservation = self._reserve_memory(job)
+        usage = {"wall_s": 0.0, "cpu_s": 0.0, "mem_mb": 0.0, "return_code": 0}
+        base_name = str(job.output_file_base_name)
+        try:
+            with open(f"{base_name}.out", "w", encoding="utf-8") as out, open(
+                f"{base_name}.err", "w", encoding="utf-8"
+            ) as err:
+                for command_line in job.get_command_lines():
+                    out.write(f"{' '.join(command_line)}\n")
+                    out.flush()
+                    start = time.perf_counter()
+                    try:
+                        process = subprocess.Popen(command_line, stdout=out, stderr=err)
+                    except OSError as e:
+                        # e.g. the executable is not on PATH, the other jobs still run
+                        err.write(f"Could not start {command_line[0]}: {e}\n")
+                        usage["return_code"] = NOT_STARTED_RETURN_CODE
+                        break
+                    # wait4 gives the resource usage of this child (and its waited for children)
+                    _, status, rusage = os.wait4(process.pid, 0)
+                    process.returncode = os.waitstatus_to_exitcode(status)
+                    usage["wall_s"] += time.perf_counter() - start
+                    usage["cpu_s"] += rusage.ru_utime + rusage.ru_stime
+                    # ru_maxrss is given in kB on Linux
+                    usage["mem_mb"] = max(usage["mem_mb"], rusage.ru_maxrss / 1024)
+                    usage["return_code"] = process.returncode
+                    if process.returncode != 0:
+                        break
+        finally:
+            self._release_memory(reservation)
+
+        with open(f"{base_name}{USAGE_REPORT_SUFFIX}", "w", encoding="utf-8") as f:
+            json.dump(usage, f, indent=4)
+        status = "done" if usage["return_code"] == 0 else f"failed ({usage['return_code']})"
+        print(
+            f"{job.output_file_base_name.name}: {status} after {usage['wall_s']:.1f} s, "
+            f"peak RSS {usage['mem_mb']:.0f} MB"
+        )
+        return usage
+
+    def run(self, sub_jobs=True) -> List[Dict]:
+        """Runs all collected jobs, or only prints their command lines if `sub_jobs` is False."""
+        if not sub_jobs:
+            for job in self.jobs:
+                for command_line in job.get_command_lines():
+                    print(" ".join(command_line), end="\n\n")
+            return []
+
+        print(
+            f"Running {len(self.jobs)} jobs locally with up to {self.max_workers} "
+            f"workers and {self.memory_budget} MB memory"
+        )
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            usages = list(pool.map(self.run_job, self.jobs))
+
+        n_failed = sum(usage["return_code"] != 0 for usage in usages)
+        if n_failed:
+            print(f"{n_failed} of {len(usages)} jobs failed")
+        return usages
+
+
+def load_usage_report(output_file_base_name: Path) -> Dict[str, float] | None:
+    """Reads the usage report of a local job, None if it is missing or the job failed."""
+    try:
+        with open(f"{output_file_base_name}{USAGE_REPORT_SUFFIX}", "r", encoding="utf-8") as f:
+            usage = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if usage["return_code"] != 0:
+        return None
+    return {"cpu_s": usage["cpu_s"], "mem_mb": usage["mem_mb"]}
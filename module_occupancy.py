@@ -0,0 +1,100 @@
+"""
+Occupancy of the hottest readout module of each layer.
+
+The occupancy of a full layer averages out the phi and z asymmetry of the
+background, e.g. due to the crossing angle, while the readout bandwidth is
+given per module. Each layer is therefore tiled into modules from its geometry
+(see get_subdet_params.py) and `MODULE_SIZES`:
+- barrel layers (vb) in phi and z;
+- endcap discs (ve) and the TPC in phi and r, the TPC per endplate side.
+Every hit gets an integer tile id, the hits per tile are a single `np.bincount`,
+and the hottest module is the tile with the most hits per mm².
+"""
+
+from typing import Dict, NamedTuple
+
+import numpy as np
+
+# r·phi width and z (barrels) or r (endcaps, TPC) length of a module in mm.
+# The compact files do not define the module segmentation, the vertex modules
+# are taken as ALPIDE-sized MAPS sensors and the TPC modules as LCTPC endplate modules.
+MODULE_SIZES = {
+    "vb": (15.0, 30.0),
+    "ve": (15.0, 30.0),
+    "tpc": (170.0, 220.0),
+}
+# layer name prefix of `divide_hits`: sub-detector key
+LAYER_SUB_DET_KEYS = {"vb": "vb", "ve": "ve", "TPC": "tpc"}
+
+
+class ModuleTiles(NamedTuple):
+    """Tiling of a layer: n_phi x n_u tiles per side, u is z (barrels) or r, and the area of every tile in mm²."""
+
+    coordinate: str
+    n_phi: int
+    n_u: int
+    u_low: float
+    u_high: float
+    n_sides: int
+    areas: np.ndarray
+
+
+def get_module_tiles(sub_det_key: str, table, index: int) -> ModuleTiles:
+    """
+    The module tiles of layer `index` of the layer table of a collection. The
+    tiles share the area the occupancy of the layer refers to (e.g. including
+    the partner of a double layer), so the module occupancy of a uniformly hit
+    layer equals its occupancy.
+    """
+    width, length = MODULE_SIZES[sub_det_key]
+    r_min, r_max = table.r_min[index], table.r_max[index]
+    n_phi = max(1, round(2 * np.pi * r_max / width))
+    if sub_det_key == "vb":
+        z_low, z_high = table.z_min[index], table.z_max[index]
+        n_z = max(1, round((z_high - z_low) / length))
+        return ModuleTiles("z", n_phi, n_z, z_low, z_high, 1, np.full(n_phi * n_z, table.area[index] / (n_phi * n_z)))
+
+    # the divided endcap hits are those at positive z, the TPC has two endplates
+    n_sides = 2 if sub_det_key == "tpc" else 1
+    n_r = max(1, round((r_max - r_min) / length))
+    ring_areas = np.diff(np.linspace(r_min, r_max, n_r + 1) ** 2)
+    areas = np.tile(np.repeat(ring_areas, n_phi), n_sides)
+    return ModuleTiles("r", n_phi, n_r, r_min, r_max, n_sides, areas * table.area[index] / areas.sum())
+
+
+def get_tile_ids(hits: Dict[str, np.ndarray], tiles: ModuleTiles) -> np.ndarray:
+    """Tile id (side * n_u + u_index) * n_phi + phi_index of every hit, hits beyond the layer go to its edge tiles."""
+    phi = np.arctan2(hits["y"], hits["x"])
+    phi_index = np.minimum(((phi + np.pi) * (tiles.n_phi / (2 * np.pi))).astype(np.int64), tiles.n_phi - 1)
+    u = hits["z"] if tiles.coordinate == "z" else np.hypot(hits["x"], hits["y"])
+    u_index = np.clip(
+        ((u - tiles.u_low) * (tiles.n_u / (tiles.u_high - tiles.u_low))).astype(np.int64), 0, tiles.n_u - 1
+    )
+    tile_ids = u_index * tiles.n_phi + phi_index
+    if tiles.n_sides == 2:
+        tile_ids += (hits["z"] > 0) * (tiles.n_u * tiles.n_phi)
+    return tile_ids
+
+
+def get_hottest_module_density(hits: Dict[str, np.ndarray], tiles: ModuleTiles) -> float:
+    """Hits per mm² of the module with the highest hit density (of all hits, not per bX)."""
+    if not len(hits["x"]):
+        return 0.0
+    counts = np.bincount(get_tile_ids(hits, tiles), minlength=len(tiles.areas))
+    return float((counts / tiles.areas).max())
+
+
+def get_layer_module_density(layer: str, hits: Dict[str, np.ndarray], det_mod: str) -> float:
+    """
+    Hits per mm² of the hottest module of a layer of `divide_hits`, NaN if the
+    layer has no geometry or its hits have no x and y.
+    """
+    from get_hits_per_layer import get_layer_index
+    from get_subdet_params import compile_geometry
+
+    prefix = layer.partition("_")[0]
+    sub_det_key = LAYER_SUB_DET_KEYS.get(prefix)
+    tables = compile_geometry(det_mod)
+    if sub_det_key not in tables or not len(tables[sub_det_key]) or "x" not in hits or "y" not in hits:
+        return np.nan
+    return get_hottest_module_density(hits, get_module_tiles(sub_det_key, tables[sub_det_key], get_layer_index(layer)))
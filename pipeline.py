@@ -0,0 +1,304 @@
+"""
+Pipeline driver chaining simulation, ingestion and table creation.
+
+Every (detector model, scenario, bX) is modelled as a chain of steps:
+
+    simulate (simall jobs) -> ingest into the cache shard of the bX
+        -> analysis of the (detector model, scenario) -> table
+
+The ingestion of a bunch crossing starts as soon as all of its simulation jobs
+have finished and the analysis only merges the already ingested cache shards,
+so the time from launching a campaign to the table follows the slowest chain
+instead of the sum of all phases. The pipeline is either written as an
+HTCondor DAGMan file or run by a local dependency-driven scheduler.
+
+Usage:
+    python pipeline.py --version test --scenario FCC240 --backend dagman --submit_jobs
+"""
+
+import subprocess
+import sys
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List
+
+from campaign_state import CAMPAIGN_STATE_FILE_NAME, CampaignState
+from local_executor import LocalExecutor, LocalJob
+from platform_paths import get_platform_config
+from simall import (
+    DDSIM_EXECUTABLE,
+    get_argument_parser,
+    get_args,
+    get_parent_out_dir,
+    iterate_planned_jobs,
+)
+from submit_utils_4_simall import (
+    CONDOR_EXEC_NAME,
+    CONDOR_PYTHON_EXEC_NAME,
+    write_condor_submit_file,
+)
+
+ANALYSIS_REQUEST_MEMORY = 16384  # MB
+INGEST_REQUEST_MEMORY = 8192  # MB
+CONDOR_SUBMIT_DAG_COMMAND = "condor_submit_dag"
+
+
+@dataclass
+class PipelineNode:
+    name: str
+    job: LocalJob
+    condor_exec_name: str
+    request_runtime: int | None = None
+    parents: List[str] = field(default_factory=list)
+
+
+class Pipeline:
+    """A directed acyclic graph of jobs, executed by DAGMan or locally."""
+
+    def __init__(self):
+        self.nodes: Dict[str, PipelineNode] = {}
+
+    def add_node(self, node: PipelineNode) -> None:
+        missing_parents = [p for p in node.parents if p not in self.nodes]
+        if missing_parents:
+            raise ValueError(f"Unknown parents of node {node.name}: {missing_parents}")
+        self.nodes[node.name] = node
+
+    def write_dagman(self, dag_file: Path, bs_code_dir: Path) -> Path:
+        """Writes one submit file per node and the DAG description linking them."""
+        lines = []
+        for node in self.nodes.values():
+            condor_submit_file = write_condor_submit_file(
+                node.job.arguments,
+                node.job.output_file_base_name,
+                bs_code_dir,
+                request_memory=node.job.request_memory,
+                request_runtime=node.request_runtime,
+                exec_name=node.condor_exec_name,
+            )
+            # the executables are resolved relative to the code directory
+            lines.append(f"JOB {node.name} {condor_submit_file} DIR {bs_code_dir}")
+        for node in self.nodes.values():
+            if node.parents:
+                lines.append(f"PARENT {' '.join(node.parents)} CHILD {node.name}")
+
+        with open(dag_file, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return dag_file
+
+    def run_local(self, local_executor: LocalExecutor) -> bool:
+        """
+        Runs every node as soon as all of its parents succeeded. Descendants of
+        failed nodes are skipped. Returns True if all nodes succeeded.
+        """
+        open_parents = {name: set(node.parents) for name, node in self.nodes.items()}
+        children = defaultdict(list)
+        for node in self.nodes.values():
+            for parent in node.parents:
+                children[parent].append(node.name)
+
+        n_succeeded = 0
+        with ThreadPoolExecutor(max_workers=local_executor.max_workers) as pool:
+            futures = {
+                pool.submit(local_executor.run_job, node.job): name
+                for name, node in self.nodes.items()
+                if not node.parents
+            }
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = futures.pop(future)
+                    if future.result()["return_code"] != 0:
+                        print(f"Node {name} failed, skipping its descendants")
+                        continue
+                    n_succeeded += 1
+                    for child in children[name]:
+                        open_parents[child].discard(name)
+                        if not open_parents[child]:
+                            futures[
+                                pool.submit(local_executor.run_job, self.nodes[child].job)
+                            ] = child
+
+        print(f"{n_succeeded} of {len(self.nodes)} pipeline nodes succeeded")
+        return n_succeeded == len(self.nodes)
+
+
+def get_python_job(script, arguments, output_file_base_name, request_memory, executable):
+    return LocalJob(
+        executable,
+        [script, *arguments],
+        output_file_base_name,
+        request_memory,
+    )
+
+
+def build_pipeline(args, parent_out_dir, campaign, batch_system, python_executable, script_dir) -> Pipeline:
+    """
+    Plans the simulation jobs like simall and adds the ingestion, analysis and
+    table nodes downstream of them. The simulation jobs are recorded in the
+    campaign as run by `batch_system` ("condor" for DAGMan, "local").
+    """
+    pipeline = Pipeline()
+    node_dir = parent_out_dir / "pipeline"
+    node_dir.mkdir(parents=True, exist_ok=True)
+    common_arguments = ["--version", args.version, "--background", args.background]
+
+    sim_nodes = defaultdict(list)
+    ingest_nodes = defaultdict(set)
+    for det_mod_name, scenario, bunchcrossing, job, arguments in iterate_planned_jobs(
+        args, parent_out_dir, campaign, batch_system
+    ):
+        name = f"sim_{job.name.name}".replace("-", "_")
+        pipeline.add_node(
+            PipelineNode(
+                name,
+                LocalJob(
+                    args.localExecutable or DDSIM_EXECUTABLE,
+                    arguments,
+                    job.name,
+                    job.request_memory,
+                ),
+                CONDOR_EXEC_NAME,
+                job.request_runtime,
+            )
+        )
+        sim_nodes[(det_mod_name, scenario, bunchcrossing)].append(name)
+        ingest_nodes[(det_mod_name, scenario)].add(bunchcrossing)
+
+    # bunch crossings without outstanding simulation jobs are ingested right away,
+    # their ingestion keeps cache shards that are newer than the simulated files
+    for out_dir in map(Path, campaign.state["directories"]):
+        if out_dir.parent.parent != parent_out_dir:
+            continue
+        det_mod_name = out_dir.parent.name
+        scenario, bunchcrossing = out_dir.name.rsplit("_", 1)
+        if (
+            det_mod_name in args.detectorModel
+            and scenario in args.scenario
+            and int(bunchcrossing) <= args.bunchCrossingEnd
+        ):
+            ingest_nodes[(det_mod_name, scenario)].add(int(bunchcrossing))
+
+    analysis_nodes = []
+    for (det_mod_name, scenario), bunchcrossings in ingest_nodes.items():
+        ingest_names = []
+        for bunchcrossing in sorted(bunchcrossings):
+            name = f"ingest_{det_mod_name}_{scenario}_{bunchcrossing}"
+            pipeline.add_node(
+                PipelineNode(
+                    name,
+                    get_python_job(
+                        script_dir / "combined_analysis.py",
+                        [
+                            *common_arguments,
+                            "--mode", "ingest",
+                            "--detectorModel", det_mod_name,
+                            "--scenario", scenario,
+                            "--bX", str(bunchcrossing),
+                        ],
+                        node_dir / name,
+                        INGEST_REQUEST_MEMORY,
+                        python_executable,
+                    ),
+                    CONDOR_PYTHON_EXEC_NAME,
+                    parents=sim_nodes[(det_mod_name, scenario, bunchcrossing)],
+                )
+            )
+            ingest_names.append(name)
+
+        name = f"analysis_{det_mod_name}_{scenario}"
+        pipeline.add_node(
+            PipelineNode(
+                name,
+                get_python_job(
+                    script_dir / "combined_analysis.py",
+                    [
+                        *common_arguments,
+                        "--mode", "analysis",
+                        "--detectorModel", det_mod_name,
+                        "--scenario", scenario,
+                        "--savePlots",
+                    ],
+                    node_dir / name,
+                    ANALYSIS_REQUEST_MEMORY,
+                    python_executable,
+                ),
+                CONDOR_PYTHON_EXEC_NAME,
+                parents=ingest_names,
+            )
+        )
+        analysis_nodes.append(name)
+
+    if analysis_nodes:
+        pipeline.add_node(
+            PipelineNode(
+                "table",
+                get_python_job(
+                    script_dir / "create_table.py",
+                    ["--version", args.version],
+                    node_dir / "table",
+                    INGEST_REQUEST_MEMORY,
+                    python_executable,
+                ),
+                CONDOR_PYTHON_EXEC_NAME,
+                parents=analysis_nodes,
+            )
+        )
+
+    return pipeline
+
+
+def parse_arguments():
+    parser = get_argument_parser(
+        description="Chains simulation, ingestion, analysis and table creation of a campaign."
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["dagman", "local"],
+        help="Write an HTCondor DAGMan file or run the pipeline locally; defaults to dagman on DESY NAF",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = get_args(parse_arguments)
+    parent_out_dir = get_parent_out_dir(args.version)
+    parent_out_dir.mkdir(parents=True, exist_ok=True)
+    campaign = CampaignState(parent_out_dir / CAMPAIGN_STATE_FILE_NAME)
+
+    platform_config = get_platform_config()
+    backend = args.backend or ("dagman" if platform_config.is_executed_on_desy_naf else "local")
+
+    if backend == "dagman":
+        # the Condor wrapper changes into the code directory, scripts are given relative to it
+        pipeline = build_pipeline(args, parent_out_dir, campaign, "condor", "python", Path("."))
+        dag_file = pipeline.write_dagman(
+            parent_out_dir / f"{args.version}_pipeline.dag",
+            platform_config.beamstrahlung_code_dir,
+        )
+        dag_command = [CONDOR_SUBMIT_DAG_COMMAND, str(dag_file)]
+        if args.submit_jobs:
+            subprocess.run(dag_command, check=True)
+        else:
+            print(" ".join(dag_command), end="\n\n")
+        return
+
+    pipeline = build_pipeline(
+        args,
+        parent_out_dir,
+        campaign,
+        "local",
+        sys.executable,
+        platform_config.beamstrahlung_code_dir,
+    )
+    if args.submit_jobs:
+        pipeline.run_local(LocalExecutor(args.maxLocalJobs))
+    else:
+        for node in pipeline.nodes.values():
+            print(f"{node.name} <- {', '.join(node.parents) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,8 @@ And further path utilities.
 """
 
 import json
+from dataclasses import dataclass
+from functools import lru_cache
 from os import getenv
 from pathlib import Path
 from typing import Dict
@@ -17,13 +19,6 @@ SPECTRE_MACHINE_IDENTIFIER = "spectre"
 SIM_DATA_SUBDIR_NAME = "sim"
 MY_CODE_DIR_ENV_VAR_NAME = "codeDir"
 
-if not getenv(MY_CODE_DIR_ENV_VAR_NAME):
-    raise EnvironmentError(
-        f"Environment variable '{MY_CODE_DIR_ENV_VAR_NAME}' is not set."
-    )
-code_dir = Path(getenv(MY_CODE_DIR_ENV_VAR_NAME))
-config_file_path = code_dir / "beamStrahlung" / "uname_to_sys_map.json"
-
 
 class UnknownSystemError(Exception):
     """Custom exception raised when the system cannot be identified."""
@@ -47,13 +42,31 @@ def load_user_to_system_mapping(filepath: str) -> dict:
         return json.load(file)
 
 
+@lru_cache(maxsize=None)
+def get_code_dir() -> Path:
+    """
+    Returns the parent directory of the `k4geo` and `beamStrahlung` repositories.
+
+    Raises:
+        EnvironmentError: If the `codeDir` environment variable is not set.
+    """
+    code_dir = getenv(MY_CODE_DIR_ENV_VAR_NAME)
+    if not code_dir:
+        raise EnvironmentError(
+            f"Environment variable '{MY_CODE_DIR_ENV_VAR_NAME}' is not set."
+        )
+    return Path(code_dir)
+
+
+def get_config_file_path() -> Path:
+    return get_code_dir() / "beamStrahlung" / "uname_to_sys_map.json"
+
+
+@lru_cache(maxsize=None)
 def identify_system() -> str:
     """
     Identifies the current system based on the username from environment variables
-    and a configuration file mapping.
-
-    Args:
-        config_filepath (str): The path to the JSON configuration file.
+    and a configuration file mapping. The configuration file is only read once.
 
     Returns:
         str: The name of the system associated with the current username.
@@ -64,7 +77,7 @@ def identify_system() -> str:
         FileNotFoundError: If the specified configuration file does not exist.
         json.JSONDecodeError: If the file is not valid JSON.
     """
-    user_to_system = load_user_to_system_mapping(config_file_path)
+    user_to_system = load_user_to_system_mapping(get_config_file_path())
 
     current_user = getenv("USER")
 
@@ -77,17 +90,67 @@ def identify_system() -> str:
     return user_to_system[current_user]
 
 
-desy_dust_home_path = (
-    Path("/data/dust/user") / getenv("USER")
-    if identify_system() == DESY_NAF_MACHINE_IDENTIFIER
-    else None
-)
+@dataclass
+class PlatformConfig:
+    """Machine identification and all paths derived from it, resolved once."""
+
+    code_dir: Path
+    system: str
+    is_executed_on_desy_naf: bool
+    desy_dust_home_path: Path | None
+    home_directory: Path
+    bs_data_paths: Dict[str, Dict[str, Path]]
+    sr_data_paths: Dict[str, Dict[str, Path]]
+    file_extensions: Dict[str, str]
+
+    @property
+    def beamstrahlung_code_dir(self) -> Path:
+        return self.code_dir / "beamStrahlung"
+
+    @property
+    def k4geo_dir(self) -> Path:
+        return self.code_dir / "k4geo"
+
+
+@lru_cache(maxsize=None)
+def get_platform_config() -> PlatformConfig:
+    """
+    Resolves the machine and its paths on first use. Importing this module has
+    no side effects, so scripts only pay for it when they need a path.
+    """
+    system = identify_system()
+    is_executed_on_desy_naf = system == DESY_NAF_MACHINE_IDENTIFIER
+    desy_dust_home_path = (
+        Path("/data/dust/user") / getenv("USER") if is_executed_on_desy_naf else None
+    )
+    bs_data_paths, sr_data_paths, file_extensions = construct_paths(
+        desy_dust_home_path, is_executed_on_desy_naf
+    )
+    return PlatformConfig(
+        code_dir=get_code_dir(),
+        system=system,
+        is_executed_on_desy_naf=is_executed_on_desy_naf,
+        desy_dust_home_path=desy_dust_home_path,
+        home_directory=desy_dust_home_path if is_executed_on_desy_naf else Path.home(),
+        bs_data_paths=bs_data_paths,
+        sr_data_paths=sr_data_paths,
+        file_extensions=file_extensions,
+    )
+
+
+def __getattr__(name):
+    # lazy module attributes of the former import time configuration
+    if name == "code_dir":
+        return get_code_dir()
+    if name == "config_file_path":
+        return get_config_file_path()
+    if name == "desy_dust_home_path":
+        return get_platform_config().desy_dust_home_path
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def get_home_directory():
-    if identify_system() == DESY_NAF_MACHINE_IDENTIFIER:
-        return desy_dust_home_path
-    return Path.home()
+    return get_platform_config().home_directory
 
 def construct_SR_paths(
     desy_dust_home_path, is_executed_on_desy_naf
@@ -249,7 +312,7 @@ def get_path_for_current_machine(path_dict: dict) -> Path:
                          match any key in `path_dict`, indicating that the machine is
                          unknown or not configured.
     """
-    system_key = identify_system()
+    system_key = get_platform_config().system
 
     if system_key in path_dict:
         return path_dict[system_key]
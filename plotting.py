@@ -159,3 +159,54 @@ def plotting(
             if show_plots:
                 plt.show()
             bp.finish()
+
+
+def plot_density_profiles(
+    profiles: Dict,
+    scale_factor: float,
+    num_bunch_crossings: int = 1,
+    show_plots: bool = False,
+    save_plots: bool = False,
+    save_dir: Path | str = None,
+    det_mod: str = "",
+    scenario: str = "",
+) -> None:
+    """
+    Plot the fine-grained hit density profiles of `density_profiles.get_density_profiles`,
+    with the positions of the layers of the detector model as dashed lines.
+
+    Parameters:
+        profiles (Dict[str, DensityProfile]): Profiles per sub-detector key.
+        scale_factor (float): Scaling of the hits, see `scale_sr_hits`.
+        num_bunch_crossings (int, optional): Number of bunch crossings considered. Default is 1.
+    """
+    from get_subdet_params import compile_geometry
+
+    tables = compile_geometry(det_mod)
+    sub_det_cols = detector_model_configurations[det_mod].get_sub_detector_collection_info()
+    save_dir = Path(save_dir)
+    save_dir.mkdir(exist_ok=True)
+    for sub_det_key, profile in profiles.items():
+        plt.close("all")
+        prefix = sub_det_cols[sub_det_key].plot_collection_prefix
+        bp = BasePlotter(
+            save_plots,
+            save_dir / f"{prefix.replace(' ', '_')}_{det_mod}_{scenario}_{profile.coordinate}_density_profile",
+        )
+        _, ax = bp.plot()
+        ax.stairs(profile.get_density(scale_factor, num_bunch_crossings), profile.edges)
+        table = tables[sub_det_key]
+        layer_positions = np.concatenate([table.r_min, table.r_max]) if profile.coordinate == "r" else table.z_min
+        for position in np.unique(layer_positions):
+            ax.axvline(position, color="grey", linestyle="--", linewidth=0.5)
+        ax.set_title(f"{prefix}  {det_mod}@{scenario}")
+        if profile.coordinate == "r":
+            ax.set_xlabel("Radius r in mm")
+            ax.set_ylabel(r"Avg. hits per BX, mm of r and $\text{mm}^2$")
+        else:
+            ax.set_xlabel("|Z| Position in mm")
+            ax.set_ylabel(r"Avg. hits per BX, mm of z and $\text{mm}^2$")
+        ax.set_yscale("log")
+        if show_plots:
+            plt.show()
+        bp.finish()
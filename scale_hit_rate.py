@@ -1,6 +1,8 @@
 import json
 from pathlib import Path
-from get_subdet_params import get_params
+from get_subdet_params import get_model_params
+from get_hits_per_layer import get_layer_index
+from module_occupancy import get_layer_module_density
 
 path_to_v23_reference = Path("../fcc-ee-lattice/reference_parameters.json")
 
@@ -40,7 +42,7 @@ def scale_sr_hits(n_hits, scenario, background="synchrotron", num_bx=1):
 
 def scale_hits_dict(divided_hits, scenario, background, num_bx, det_mod):
     
-    det_params = get_params()[det_mod]
+    det_params = get_model_params(det_mod)
 
     hit_rates = {
         subdet: {
@@ -51,7 +53,7 @@ def scale_hits_dict(divided_hits, scenario, background, num_bx, det_mod):
     }
     hit_rates_per_mm = {
         subdet: {
-            layer: hits / det_params[subdet][layer.split("_")[0]]["a"][0]
+            layer: hits / det_params[subdet][layer.split("_")[0]]["a"][get_layer_index(layer)]
             for layer, hits in subdet_hits.items()
         }
         for subdet, subdet_hits in hit_rates.items()
@@ -59,16 +61,29 @@ def scale_hits_dict(divided_hits, scenario, background, num_bx, det_mod):
 
     occupancy = {
         subdet: {
-            layer: 100 * hits / det_params[subdet][layer.split("_")[0]]["n_pixels"][0]
+            layer: 100 * hits / det_params[subdet][layer.split("_")[0]]["n_pixels"][get_layer_index(layer)]
             for layer, hits in subdet_hits.items()
         }
         for subdet, subdet_hits in hit_rates.items()
     }
 
+    # occupancy of the hottest readout module of each layer
+    module_occupancy = {
+        subdet: {
+            layer: 100
+            * scale_sr_hits(get_layer_module_density(layer, hits, det_mod), scenario, background, num_bx)
+            * det_params[subdet][layer.split("_")[0]]["a"][get_layer_index(layer)]
+            / det_params[subdet][layer.split("_")[0]]["n_pixels"][get_layer_index(layer)]
+            for layer, hits in subdet_hits.items()
+        }
+        for subdet, subdet_hits in divided_hits.items()
+    }
+
     results_dict = {
         "per_bx": hit_rates,
         "per_bx_per_mm": hit_rates_per_mm,
-        "occupancy": occupancy
+        "occupancy": occupancy,
+        "module_occupancy": module_occupancy,
     }
 
     return results_dict
\ No newline at end of file
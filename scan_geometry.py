@@ -0,0 +1,603 @@
+"""
+Fast estimate of the hit rates of geometry variants of a simulated detector model.
+
+The cached hits of a simulated (reference) model are re-binned onto hypothetical
+layers, e.g. other vertex layer radii or z extents or another TPC inner radius,
+so many variants can be compared without simulating each of them:
+- a barrel layer takes the hits of the nearest simulated layer within its half
+  length and scales them to its radius with the power law of the hit density
+  over the radius fitted to the simulated layers;
+- an endcap disc does the same with the nearest simulated disc, its outer
+  radius and the density over z;
+- the TPC takes the hits inside its volume.
+Layers extending beyond the simulated ones assume a uniform hit density there
+and are flagged as extrapolated. Changes of passive material, e.g. of the beam
+pipe, change the background itself and can not be estimated this way.
+
+The hits are prepared once (radius, layer, sorted) and shared with the worker
+processes estimating the variants (see hit_store.py). The estimates are written
+as layer summaries (see layer_summary.py) of a scan version, one "detector model"
+per variant, so `create_table.py --version <scan>` tabulates them, and the
+variants are ranked by their highest hit rate. Only the promising variants then
+need a compact file variant and a full simulation with simall.
+
+    python scan_geometry.py --version v1 --detectorModel ILD_FCCee_v01 --scenario ... \\
+        --grid vb.r_shift=-2,0,2 tpc.r_inner=300,329,360
+"""
+
+import argparse
+import itertools
+import json
+from os import fspath
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Tuple
+
+from det_mod_configs import CHOICES_DETECTOR_MODELS
+from platform_paths import get_home_directory, resolve_path_with_env
+from simall import CHOICES_SCENARIOS, get_args
+
+# numpy, the geometry and the cache modules are only imported once the arguments are parsed
+
+REFERENCE_VARIANT = "reference"
+# sub-detector key: the layer values a variant can change (unsplit double layers)
+VARIANT_FIELDS = {
+    "vb": ("r", "z"),
+    "ve": ("z", "r"),
+    "tpc": ("r_inner", "r_outer", "z"),
+}
+# hit density ~ position^-exponent, used if it can not be fitted to the simulated layers
+DEFAULT_DENSITY_EXPONENT = 2.0
+RANKING_FILE_NAME = "scan_ranking.csv"
+VARIANTS_FILE_NAME = "scan_variants.json"
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Estimates the hit rates of geometry variants from the hits of a simulated detector model"
+    )
+    parser.add_argument(
+        "--version",
+        "--directory",
+        required=True,
+        type=str,
+        help="Version name / Directory containing the simulated data; can be relative to the 'dtDir' env var",
+    )
+    parser.add_argument(
+        "--detectorModel",
+        required=True,
+        choices=CHOICES_DETECTOR_MODELS,
+        type=str,
+        help="The simulated detector model the variants are derived from",
+    )
+    parser.add_argument(
+        "--background",
+        type=str,
+        choices=CHOICES_SCENARIOS.keys(),
+        help="Type of background data to read. Defaults to version if valid option or else beamstrahlung",
+    )
+    parser.add_argument(
+        "--scenario",
+        nargs="+",
+        type=str,
+        help="Specify one or more scenarios to scan",
+    )
+    parser.add_argument(
+        "--scanFile",
+        type=str,
+        help="JSON file of the variants: {\"variants\": {name: {\"vb\": {\"r\": [...]}}}, \"grid\": {\"vb.r_shift\": [...]}}",
+    )
+    parser.add_argument(
+        "--grid",
+        nargs="+",
+        default=[],
+        help="Grid of variants, e.g. 'vb.r_shift=-2,0,2' 'tpc.r_inner=300,329'. "
+        "Fields: vb r, z; ve z, r; tpc r_inner, r_outer, z; replaced, or changed with the suffix _shift or _scale",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        help="Version name / Directory of the estimates (default: scan_<detectorModel>); can be relative to the 'dtDir' env var",
+    )
+    parser.add_argument(
+        "--rankUnit",
+        type=str,
+        default="occupancy",
+        choices=("per_bx", "per_bx_per_mm", "occupancy"),
+        help="Unit of the hit rates the variants are ranked by",
+    )
+    parser.add_argument(
+        "--rankCollections",
+        nargs="+",
+        default=["vb", "ve"],
+        choices=VARIANT_FIELDS,
+        help="The variants are ranked by the highest hit rate of a layer of these collections",
+    )
+    parser.add_argument(
+        "--promising",
+        type=int,
+        default=5,
+        help="Number of best ranked variants listed for a full simulation",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of processes estimating the variants (default: number of CPUs, 1 runs them in this process)",
+    )
+    parser.add_argument(
+        "--backend",
+        default="shm",
+        choices=("shm", "mmap"),
+        help="How the hits are shared with the workers: shared memory or a memory-mapped file in the output directory",
+    )
+    parser.add_argument(
+        "--cacheDir",
+        type=str,
+        help="Directory of the cache files (default: <home directory>/promotion/data/bs_cache_combined_analysis)",
+    )
+    parser.add_argument(
+        "--cacheCodec",
+        type=str,
+        help="Codec of a newly written cache, e.g. 'float32+shuffle+zstd' (default: $bsCacheCodec or the fastest installed)",
+    )
+    return parser.parse_args()
+
+
+class ScanTask(NamedTuple):
+    """A variant to estimate: its layer tables and those of the simulated reference model."""
+
+    variant: str
+    tables: Dict
+    reference_tables: Dict
+    scenario: str
+    background: str
+    num_bx: int
+
+
+def get_layer_values(table, sub_det_key: str, double_layers: bool) -> Dict[str, List[float]]:
+    """The values of `VARIANT_FIELDS` of a layer table, a double layer given by its first layer."""
+    if sub_det_key == "tpc":
+        return {"r_inner": table.r_min.tolist(), "r_outer": table.r_max.tolist(), "z": table.z_max.tolist()}
+    step = 2 if double_layers else 1
+    values = {"r": table.r_max[::step].tolist()}
+    values["z"] = (table.z_min if sub_det_key == "ve" else table.z_max)[::step].tolist()
+    return values
+
+
+def apply_overrides(values: Dict[str, List[float]], overrides: Dict) -> Dict[str, List[float]]:
+    """
+    Applies the overrides of a variant to the layer values of a collection:
+    "<field>" replaces the values, "<field>_shift" adds to and "<field>_scale"
+    multiplies them.
+
+    Raises:
+        ValueError: If an override is not a field of the collection.
+    """
+    values = {field: list(layer_values) for field, layer_values in values.items()}
+    for key, value in overrides.items():
+        field, operation = key, None
+        for suffix in ("_shift", "_scale"):
+            if key.endswith(suffix) and key[: -len(suffix)] in values:
+                field, operation = key[: -len(suffix)], suffix
+        if field not in values:
+            raise ValueError(f"Unknown field '{key}', choose from {', '.join(values)} (with _shift or _scale)")
+        if operation == "_shift":
+            values[field] = [v + value for v in values[field]]
+        elif operation == "_scale":
+            values[field] = [v * value for v in values[field]]
+        else:
+            values[field] = [float(v) for v in (value if isinstance(value, list) else [value])]
+    return values
+
+
+def make_variant_tables(detector_model: str, overrides: Dict) -> Tuple[Dict, Dict]:
+    """
+    The layer tables of a variant of a model.
+
+    Returns:
+    - Tuple: The layer tables and the (unsplit) layer values of the changed collections.
+    """
+    import numpy as np
+
+    from det_mod_configs import detector_model_configurations
+    from get_subdet_params import compile_geometry, make_barrel_table, make_endcap_table, make_tpc_table
+
+    reference_tables = compile_geometry(detector_model)
+    collections = detector_model_configurations[detector_model].get_sub_detector_collection_info()
+    unknown = set(overrides) - set(reference_tables)
+    if unknown:
+        raise ValueError(f"{detector_model} has no collection(s) {', '.join(sorted(unknown))}")
+
+    tables, layer_values = dict(reference_tables), {}
+    for sub_det_key, collection_overrides in overrides.items():
+        table = reference_tables[sub_det_key]
+        double_layers = collections[sub_det_key].only_double_layers
+        values = apply_overrides(get_layer_values(table, sub_det_key, double_layers), collection_overrides)
+        layer_values[sub_det_key] = values
+        if sub_det_key == "vb":
+            tables[sub_det_key] = make_barrel_table(
+                values["r"], np.resize(values["z"], len(values["r"])), double_layers
+            )
+        elif sub_det_key == "ve":
+            tables[sub_det_key] = make_endcap_table(
+                values["z"], np.resize(values["r"], len(values["z"])), double_layers
+            )
+        else:
+            pad_area = table.area[0] / table.n_pixels[0]
+            tables[sub_det_key] = make_tpc_table(
+                values["r_inner"][0], values["r_outer"][0], values["z"][0], pad_area
+            )
+    return tables, layer_values
+
+
+def parse_grid(entries: List[str]) -> Dict[str, List]:
+    """Parses grid entries like 'vb.r_shift=-2,0,2' into {"vb.r_shift": [-2.0, 0.0, 2.0]}."""
+    grid = {}
+    for entry in entries:
+        key, separator, values = entry.partition("=")
+        if not separator or "." not in key:
+            raise ValueError(f"Invalid grid entry '{entry}', expected e.g. 'vb.r_shift=-2,0,2'")
+        grid[key.strip()] = [float(value) for value in values.split(",")]
+    return grid
+
+
+def get_variants(scan_file: str | None, grid_entries: List[str]) -> Dict[str, Dict]:
+    """
+    The variants of a scan file and the grid (all combinations of the grid values),
+    the reference without any change first.
+
+    Returns:
+    - Dict[str, Dict]: The overrides per sub-detector key of each variant.
+    """
+    variants, grid = {REFERENCE_VARIANT: {}}, {}
+    if scan_file:
+        with open(scan_file) as f:
+            scan = json.load(f)
+        variants.update(scan.get("variants", {}))
+        grid.update(scan.get("grid", {}))
+    grid.update(parse_grid(grid_entries))
+
+    for combination in itertools.product(*grid.values()):
+        overrides = {}
+        for key, value in zip(grid, combination):
+            sub_det_key, field = key.split(".", 1)
+            overrides.setdefault(sub_det_key, {})[field] = value
+        name = "+".join(f"{key}={value:g}" for key, value in zip(grid, combination))
+        variants[name] = overrides
+    return variants
+
+
+def get_layer_indices(values, layer_positions):
+    """Index of the nearest layer of every hit, the same division as `divide_hits`."""
+    import numpy as np
+
+    return np.searchsorted((layer_positions[:-1] + layer_positions[1:]) / 2, values).astype(np.int16)
+
+
+def get_scan_hits(hits: Dict, reference_tables: Dict) -> Dict[str, Dict]:
+    """
+    The columns the estimates need, sorted so that every cut is a `searchsorted`:
+    - vb: the layer of each hit and |z|, sorted by layer and |z|;
+    - ve: the layer of each hit at positive z (as `divide_hits`) and its radius, sorted by layer and radius;
+    - tpc: the radius and |z|, sorted by radius.
+    """
+    import numpy as np
+
+    scan_hits = {}
+    if len(reference_tables.get("vb", ())) and "vb" in hits:
+        layer = get_layer_indices(np.hypot(hits["vb"]["x"], hits["vb"]["y"]), reference_tables["vb"].r_max)
+        abs_z = np.abs(hits["vb"]["z"])
+        order = np.lexsort((abs_z, layer))
+        scan_hits["vb"] = {"layer": layer[order], "abs_z": abs_z[order]}
+    if len(reference_tables.get("ve", ())) and "ve" in hits:
+        positive = hits["ve"]["z"] > 0
+        layer = get_layer_indices(hits["ve"]["z"][positive], reference_tables["ve"].z_min)
+        r = np.hypot(hits["ve"]["x"][positive], hits["ve"]["y"][positive])
+        order = np.lexsort((r, layer))
+        scan_hits["ve"] = {"layer": layer[order], "r": r[order]}
+    if len(reference_tables.get("tpc", ())) and "tpc" in hits:
+        r = np.hypot(hits["tpc"]["x"], hits["tpc"]["y"])
+        order = np.argsort(r)
+        scan_hits["tpc"] = {"r": r[order], "abs_z": np.abs(hits["tpc"]["z"])[order]}
+    return scan_hits
+
+
+def fit_density_exponent(n_hits, positions, areas) -> float:
+    """Exponent of the power law hit density ~ position^-exponent fitted to the simulated layers."""
+    import numpy as np
+
+    with_hits = n_hits > 0
+    if len(np.unique(positions[with_hits])) < 2:
+        return DEFAULT_DENSITY_EXPONENT
+    slope, _ = np.polyfit(np.log(positions[with_hits]), np.log(n_hits[with_hits] / areas[with_hits]), 1)
+    return -slope
+
+
+def estimate_layers(layer, values, reference_positions, reference_extents, positions, extents, area_power, exponent):
+    """
+    Estimated hits of layers at `positions` (barrel radii or disc z) with `extents`
+    (half lengths or outer radii) from the hits of the nearest simulated layer.
+    `values` (|z| or radii) are sorted within the sorted `layer` indices.
+
+    Returns:
+    - Tuple: The estimated hits and whether they are extrapolated beyond the simulated layers.
+    """
+    import numpy as np
+
+    offsets = np.searchsorted(layer, np.arange(len(reference_positions) + 1))
+    n_hits, extrapolated = np.zeros(len(positions)), np.zeros(len(positions), dtype=bool)
+    for i, (position, extent) in enumerate(zip(positions, extents)):
+        j = np.argmin(np.abs(reference_positions - position))
+        start, stop = offsets[j], offsets[j + 1]
+        if extent < reference_extents[j]:
+            n_hits[i] = np.searchsorted(values[start:stop], extent)
+        else:
+            # a uniform hit density beyond the simulated layer
+            n_hits[i] = (stop - start) * (extent / reference_extents[j]) ** area_power
+        n_hits[i] *= (position / reference_positions[j]) ** -exponent
+        extrapolated[i] = (
+            extent > reference_extents[j]
+            or position < reference_positions.min()
+            or position > reference_positions.max()
+        )
+    return n_hits, extrapolated
+
+
+def estimate_barrel(columns, reference, candidate):
+    import numpy as np
+
+    counts = np.bincount(columns["layer"], minlength=len(reference))
+    exponent = fit_density_exponent(counts, reference.r_max, 2 * np.pi * reference.r_max * 2 * reference.z_max)
+    # the area of a layer grows with its radius, so the hits scale with r^(1 - exponent)
+    return estimate_layers(
+        columns["layer"], columns["abs_z"], reference.r_max, reference.z_max,
+        candidate.r_max, candidate.z_max, 1, exponent - 1,
+    )
+
+
+def estimate_endcap(columns, reference, candidate):
+    import numpy as np
+
+    counts = np.bincount(columns["layer"], minlength=len(reference))
+    exponent = fit_density_exponent(counts, reference.z_min, np.pi * reference.r_max**2)
+    return estimate_layers(
+        columns["layer"], columns["r"], reference.z_min, reference.r_max,
+        candidate.z_min, candidate.r_max, 2, exponent,
+    )
+
+
+def estimate_tpc(columns, reference, candidate):
+    """Hits inside the TPC volume of the candidate, scaled by volume where it exceeds the simulated one."""
+    import numpy as np
+
+    r_inner, r_outer, half_length = candidate.r_min[0], candidate.r_max[0], candidate.z_max[0]
+    # without a simulated half length all hits are inside
+    reference_half_length = np.inf if np.isnan(reference.z_max[0]) else reference.z_max[0]
+    if np.isnan(half_length):
+        half_length = reference_half_length
+    low, high = max(r_inner, reference.r_min[0]), min(r_outer, reference.r_max[0])
+    extrapolated = r_inner < reference.r_min[0] or r_outer > reference.r_max[0] or half_length > reference_half_length
+    if high <= low:
+        return np.zeros(1), np.array([True])
+
+    start, stop = np.searchsorted(columns["r"], [low, high])
+    abs_z = columns["abs_z"][start:stop]
+    n_hits = np.count_nonzero(abs_z < half_length) if half_length < reference_half_length else len(abs_z)
+    n_hits *= (r_outer**2 - r_inner**2) / (high**2 - low**2)
+    if np.isfinite(half_length) and half_length > reference_half_length:
+        n_hits *= half_length / reference_half_length
+    return np.array([n_hits], dtype=float), np.array([extrapolated])
+
+
+ESTIMATORS = {"vb": estimate_barrel, "ve": estimate_endcap, "tpc": estimate_tpc}
+
+
+def estimate_variant(scan_hits: Dict, task: ScanTask) -> Dict:
+    """
+    Estimates the hit rates of the layers of a variant.
+
+    Returns:
+    - Dict[str, np.ndarray]: Layer summary columns (see layer_summary.py) with the
+      variant as detector model, and whether each layer is extrapolated.
+    """
+    import numpy as np
+
+    from get_subdet_params import PARAM_KEYS
+    from layer_summary import SUMMARY_FORMAT, UNITS
+    from scale_hit_rate import scale_sr_hits
+
+    records = []
+    for sub_det_key, columns in scan_hits.items():
+        table = task.tables[sub_det_key]
+        n_hits, extrapolated = ESTIMATORS[sub_det_key](columns, task.reference_tables[sub_det_key], table)
+        group, key = PARAM_KEYS[sub_det_key]
+        for i in range(len(table)):
+            layer = "TPC" if sub_det_key == "tpc" else f"{key}_{i + 1}"
+            records.append((group, layer, n_hits[i], table.area[i], table.n_pixels[i], extrapolated[i]))
+
+    # the scaling is linear in the number of hits
+    scale = scale_sr_hits(1, task.scenario, task.background, task.num_bx)
+    n_hits = np.array([r[2] for r in records], dtype=float)
+    columns = {
+        "summary_format": np.int64(SUMMARY_FORMAT),
+        "detector_model": np.full(len(records), task.variant),
+        "background": np.full(len(records), str(task.background)),
+        "scenario": np.full(len(records), task.scenario),
+        "subdetector": np.array([r[0] for r in records], dtype=str),
+        "layer": np.array([r[1] for r in records], dtype=str),
+        "num_bunch_crossings": np.full(len(records), task.num_bx),
+        "n_hits": n_hits,
+        "n_hits_per_bx": n_hits / task.num_bx,
+        "area": np.array([r[3] for r in records], dtype=float),
+        "n_pixels": np.array([r[4] for r in records], dtype=float),
+        "per_bx": n_hits * scale,
+        # the hits are not re-binned onto modules
+        "module_per_bx_per_mm": np.full(len(records), np.nan),
+        "extrapolated": np.array([r[5] for r in records], dtype=bool),
+    }
+    for unit, get_rate in UNITS.items():
+        columns[unit] = get_rate(columns)
+    return columns
+
+
+def get_ranking(summaries: List[Dict], unit: str, collections: List[str]) -> List[Dict]:
+    """
+    Ranks the variant estimates by the highest hit rate in `unit` of a layer of
+    `collections`, lowest first.
+    """
+    import numpy as np
+
+    from get_subdet_params import PARAM_KEYS
+
+    prefixes = tuple("TPC" if c == "tpc" else PARAM_KEYS[c][1] + "_" for c in collections)
+    ranking = []
+    for columns in summaries:
+        selected = np.char.startswith(columns["layer"], prefixes[0])
+        for prefix in prefixes[1:]:
+            selected |= np.char.startswith(columns["layer"], prefix)
+        if not selected.any():
+            continue
+        hottest = np.argmax(np.where(selected, columns[unit], -np.inf))
+        ranking.append(
+            {
+                "variant": str(columns["detector_model"][0]),
+                "scenario": str(columns["scenario"][0]),
+                "max_rate": float(columns[unit][hottest]),
+                "hottest_layer": str(columns["layer"][hottest]),
+                "extrapolated_layers": int(np.count_nonzero(columns["extrapolated"][selected])),
+            }
+        )
+    reference_rates = {r["scenario"]: r["max_rate"] for r in ranking if r["variant"] == REFERENCE_VARIANT}
+    for entry in ranking:
+        reference_rate = reference_rates.get(entry["scenario"], np.nan)
+        entry["vs_reference"] = entry["max_rate"] / reference_rate if reference_rate else np.nan
+    return sorted(ranking, key=lambda entry: (entry["scenario"], entry["max_rate"]))
+
+
+def load_hits(directory: Path, detector_model: str, scenario: str, args) -> Tuple[Dict, int]:
+    """The (cached) hits of a simulated combination and its number of bunch crossings."""
+    from analyze_available_data import parse_files, sort_detector_data
+    from caching import handle_cache_operations
+    from data_inventory import DataInventory
+
+    inventory = DataInventory(directory).refresh()
+    detector_data = sort_detector_data(parse_files(directory, inventory))
+    if detector_model not in detector_data or scenario not in detector_data[detector_model]:
+        raise ValueError(
+            f"No files found for the combination: Detector Model='{detector_model}', Scenario='{scenario}'"
+        )
+    bX_identifiers = list(detector_data[detector_model][scenario].keys())
+    file_paths = [
+        file_path
+        for bX_identifier in bX_identifiers
+        for file_path in inventory.get_file_paths(detector_model, scenario, bX_identifier)
+    ]
+    hits = handle_cache_operations(
+        args.cacheDir,
+        detector_model,
+        scenario,
+        len(bX_identifiers),
+        file_paths,
+        bX_identifiers=bX_identifiers,
+        codec=args.cacheCodec,
+    )
+    return hits, len(bX_identifiers)
+
+
+def scan_scenario(directory, output_dir, scenario, variant_tables, args) -> List[Dict]:
+    """Estimates all variants for a scenario in parallel and writes their layer summaries."""
+    from get_subdet_params import compile_geometry
+    from hit_store import SharedHitStore, run_with_shared_hits
+    from layer_summary import get_summary_file_path, write_summary
+
+    hits, num_bx = load_hits(directory, args.detectorModel, scenario, args)
+    reference_tables = compile_geometry(args.detectorModel)
+    scan_hits = get_scan_hits(hits, reference_tables)
+    del hits
+
+    tasks = [
+        ScanTask(variant, tables, reference_tables, scenario, args.background, num_bx)
+        for variant, tables in variant_tables.items()
+    ]
+    print(f"Estimating {len(tasks)} variants of {args.detectorModel} for {scenario} ({num_bx} bX)")
+    if args.workers == 1:
+        summaries = [estimate_variant(scan_hits, task) for task in tasks]
+    else:
+        with SharedHitStore(scan_hits, args.backend, output_dir) as store:
+            summaries = run_with_shared_hits(store.handle, estimate_variant, tasks, args.workers)
+
+    for task, columns in zip(tasks, summaries):
+        write_summary(get_summary_file_path(output_dir, task.variant, scenario), columns)
+    return summaries
+
+
+def write_ranking(output_dir: Path, ranking: List[Dict]) -> Path:
+    import csv
+
+    ranking_file = output_dir / RANKING_FILE_NAME
+    with open(ranking_file, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(ranking[0]))
+        writer.writeheader()
+        writer.writerows(ranking)
+    return ranking_file
+
+
+def print_ranking(ranking: List[Dict], variants: Dict[str, Dict], args) -> None:
+    import numpy as np
+    from tabulate import tabulate
+
+    print(
+        tabulate(
+            [list(entry.values()) for entry in ranking],
+            headers=["Variant", "Scenario", f"Max {args.rankUnit}", "Hottest Layer", "Extrapolated", "vs Reference"],
+            tablefmt="grid",
+            floatfmt=".3g",
+        )
+    )
+    # worst ratio to the reference over the scenarios
+    worst = {}
+    for entry in ranking:
+        if entry["variant"] != REFERENCE_VARIANT:
+            worst[entry["variant"]] = max(worst.get(entry["variant"], -np.inf), entry["vs_reference"])
+    promising = sorted(worst, key=worst.get)
+    print("\nPromising variants for a full simulation (compact file variant + simall):")
+    for variant in promising[: args.promising]:
+        print(f"  {variant}: {json.dumps(variants[variant])}")
+
+
+def main():
+    args = get_args(parse_arguments)
+    if args.cacheDir is None:
+        args.cacheDir = fspath(get_home_directory() / "promotion/data/bs_cache_combined_analysis")
+    directory = resolve_path_with_env(args.version, "dtDir")
+    output_dir = resolve_path_with_env(args.output or f"scan_{args.detectorModel}", "dtDir")
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    variants = get_variants(args.scanFile, args.grid)
+    variant_tables, variant_values = {}, {}
+    for variant, overrides in variants.items():
+        variant_tables[variant], variant_values[variant] = make_variant_tables(args.detectorModel, overrides)
+    with open(output_dir / VARIANTS_FILE_NAME, "w") as f:
+        json.dump(
+            {
+                "detector_model": args.detectorModel,
+                "version": args.version,
+                "variants": {v: {"overrides": variants[v], "layers": variant_values[v]} for v in variants},
+            },
+            f,
+            indent=4,
+        )
+
+    summaries = []
+    for scenario in args.scenario:
+        summaries += scan_scenario(directory, output_dir, scenario, variant_tables, args)
+
+    ranking = get_ranking(summaries, args.rankUnit, args.rankCollections)
+    if not ranking:
+        print(f"No layers of {', '.join(args.rankCollections)} to rank")
+        return
+    print_ranking(ranking, variants, args)
+    print(f"Ranking written to {write_ranking(output_dir, ranking)}, tables: python create_table.py --version {output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,35 +9,38 @@ from det_mod_configs import (
     get_paths_and_detector_configs,
 )
 from platform_paths import (
-    DESY_NAF_MACHINE_IDENTIFIER,
     SIM_DATA_SUBDIR_NAME,
-    code_dir,
     construct_paths,
-    desy_dust_home_path,
     get_path_for_current_machine,
-    identify_system,
+    get_platform_config,
 )
-from submit_utils_4_simall import submit_job
-is_executed_on_DESY_NAF = identify_system() == DESY_NAF_MACHINE_IDENTIFIER
-
-# define paths for later use
-beamstrahlung_code_dir = code_dir / "beamStrahlung"
-k4geoDir = code_dir / "k4geo"
-out_Dir_base_path = desy_dust_home_path if is_executed_on_DESY_NAF else Path.home()
-bs_data_paths, sr_data_paths, file_extensions = construct_paths(
-    desy_dust_home_path, is_executed_on_DESY_NAF
+from campaign_state import CAMPAIGN_STATE_FILE_NAME, CampaignState
+from job_planner import (
+    DEFAULT_TARGET_WALL_TIME,
+    get_cost_model,
+    pack_shards,
+    plan_shards,
+    write_plan_sidecar,
 )
+from local_executor import LocalExecutor
+from submit_utils_4_simall import JOB_SEPARATOR, CondorBulkSubmission, submit_job
+
+# The machine dependent paths are resolved lazily by get_platform_config(),
+# the scenario names do not depend on the machine
+_bs_scenario_paths, _sr_scenario_paths, _ = construct_paths(None, False)
 
 # single source of truth, keys of bs_data_paths become values of tuple
 CHOICES_SCENARIOS = {
-    "synchrotron" : tuple(sr_data_paths),
-    "beamstrahlung" : tuple(bs_data_paths),
+    "synchrotron" : tuple(_sr_scenario_paths),
+    "beamstrahlung" : tuple(_bs_scenario_paths),
 }
 DEFAULT_SCENARIOS = {
     "synchrotron" : ("182GeV_nzco_10urad",),
     "beamstrahlung" : ("FCC240",),
 }
 
+DDSIM_EXECUTABLE = "ddsim"
+
 # Source the setup script (this will be a no-op in Python, since sourcing doesn't propagate in subprocess)
 SETUP_SCRIPT_PATH = "/cvmfs/sw-nightlies.hsf.org/key4hep/setup.sh"
 
@@ -45,10 +48,8 @@ SETUP_SCRIPT_PATH = "/cvmfs/sw-nightlies.hsf.org/key4hep/setup.sh"
 det_mod_configs_dict = get_paths_and_detector_configs()
 
 
-def parse_arguments():
-    parser = argparse.ArgumentParser(
-        description="Process simulation parameters for FCCee and ILC."
-    )
+def get_argument_parser(description="Process simulation parameters for FCCee and ILC."):
+    parser = argparse.ArgumentParser(description=description)
 
     parser.add_argument(
         "--bunchCrossingEnd",
@@ -98,11 +99,53 @@ def parse_arguments():
         help="Accelerator configurations to analyze (choose one or more)",
     )
 
+    parser.add_argument(
+        "--targetWallTime",
+        type=int,
+        default=DEFAULT_TARGET_WALL_TIME,
+        help=f"Target wall time per job in seconds used to split and pack input files (default: {DEFAULT_TARGET_WALL_TIME})",
+    )
+
     parser.add_argument(
         "--submit_jobs", action="store_true", help="Submit job(s) if this flag is set"
     )
 
-    return parser.parse_args()
+    parser.add_argument(
+        "--forceResubmit",
+        action="store_true",
+        help="Submit all jobs, including those whose output already exists and is complete",
+    )
+
+    parser.add_argument(
+        "--batchSystem",
+        choices=["condor", "bsub", "local"],
+        help="Batch backend; defaults to condor on DESY NAF and bsub elsewhere. "
+        "'local' runs the jobs in a process pool on this machine",
+    )
+
+    parser.add_argument(
+        "--localExecutable",
+        type=str,
+        help="Executable used instead of ddsim by the local backend, e.g. a stub for testing",
+    )
+
+    parser.add_argument(
+        "--maxLocalJobs",
+        type=int,
+        help="Maximum number of concurrent local jobs (default: number of cores, further limited by memory)",
+    )
+
+    parser.add_argument(
+        "--bulkSubmission",
+        action="store_true",
+        help="Collect all Condor jobs into a single submit file and submit them with one condor_submit call",
+    )
+
+    return parser
+
+
+def parse_arguments():
+    return get_argument_parser().parse_args()
 
 def get_args(parse_args=parse_arguments):
     args = parse_args()
@@ -130,9 +173,9 @@ def get_args(parse_args=parse_arguments):
 def replace_BX_number_in_string(type_name: str, BX_n: int, background: str) -> str:
 
     if background == "beamstrahlung":
-        data_paths = bs_data_paths
+        data_paths = get_platform_config().bs_data_paths
     else:
-        data_paths = sr_data_paths
+        data_paths = get_platform_config().sr_data_paths
 
     if type_name == "ILC250":
         return str(get_path_for_current_machine(data_paths[type_name])).replace(
@@ -160,29 +203,32 @@ def save_bX_count(scenario, background, out_dir):
     else:
         print(f"⚠️ No files found for scenario {scenario}, skipping count.")
 
-def main():
-    # # Function to simulate sourcing (can only be done inside the same shell process)
-    # def source_setup_script(script):
-    #     return subprocess.run(
-    #         f"source {script} && env", shell=True, capture_output=True, text=True
-    #     )
+def get_parent_out_dir(version: str) -> Path:
+    return get_platform_config().home_directory / "promotion" / "data" / SIM_DATA_SUBDIR_NAME / version
 
-    # # Note: The setup script source cannot affect the Python environment, but we simulate it in case needed.
-    # source_setup_script(setupScriptPath)  # This will not affect the Python environment
-
-    print(is_executed_on_DESY_NAF)
-    args = get_args()
-    parent_out_dir = (
-        out_Dir_base_path / "promotion" / "data" / SIM_DATA_SUBDIR_NAME / args.version
-    ) 
-    parent_out_dir.mkdir(parents=True, exist_ok=True)
 
+def iterate_planned_jobs(args, parent_out_dir, campaign, batch_system):
+    """
+    Plans the jobs of all selected scenarios, bunch crossings and detector
+    models and yields them one by one as
+    (detector model, scenario, bunch crossing, job, ddsim arguments).
+    The jobs are recorded in the campaign as submitted with `batch_system`.
+    """
+    platform_config = get_platform_config()
     det_mod_configs_dict_filtered = {
         key: value
         for key, value in det_mod_configs_dict.items()
         if key in args.detectorModel
     }
 
+    # Cost models calibrated from the logs of earlier campaigns of the same models
+    cost_models = {
+        det_mod_name: get_cost_model(
+            det_mod_configs.accelerator.name, det_mod_name, parent_out_dir.parent
+        )
+        for det_mod_name, det_mod_configs in det_mod_configs_dict_filtered.items()
+    }
+
     # Iterate over the beam strahlung scenarios
     for scenario_name in args.scenario:
 
@@ -206,68 +252,148 @@ def main():
                 
                 out_dir.mkdir(parents=True, exist_ok=True)
 
-                input_files = glob(os.path.join(folder_path_with_bX, f"*.{file_extensions[args.background]}"))
-
-                for i, input_file_path in enumerate(input_files):
+                input_files = glob(os.path.join(folder_path_with_bX, f"*.{platform_config.file_extensions[args.background]}"))
 
-                    # Construct the output file names
-                    out_name = (
-                        out_dir / f"{det_mod_name}-{scenario_name}-bX_{str(bunchcrossing).zfill(4)}-nEvts_{args.nEvents}-part_{i}"
+                if det_mod_configs.is_accelerator_ilc():
+                    # Determine particles per event value for "ILC" scenario
+                    particles_per_event = (
+                        args.guineaPigPartPerE
+                        if 1 <= args.guineaPigPartPerE <= 5000
+                        else 5000
                     )
+                else:
+                    # Use the provided particles per event for non-"ILC" scenarios
+                    particles_per_event = args.guineaPigPartPerE
+
+                # Size the shards by their estimated CPU time and memory,
+                # a plan recorded by an earlier run with the same parameters keeps the output names stable
+                plan_parameters = {
+                    "n_events": args.nEvents,
+                    "particles_per_event": particles_per_event,
+                    "target_wall_time": args.targetWallTime,
+                }
+                shards = campaign.get_planned_shards(out_dir, input_files, plan_parameters)
+                if shards is None:
+                    shards = plan_shards(
+                        input_files,
+                        out_dir,
+                        f"{det_mod_name}-{scenario_name}-bX_{str(bunchcrossing).zfill(4)}-nEvts_{args.nEvents}",
+                        particles_per_event,
+                        cost_models[det_mod_name],
+                        args.targetWallTime,
+                        args.nEvents,
+                    )
+                    campaign.record_planned_shards(out_dir, input_files, plan_parameters, shards)
+
+                # Only missing or corrupt outputs are simulated (again)
+                if not args.forceResubmit:
+                    n_planned = len(shards)
+                    shards = [
+                        shard for shard in shards
+                        if campaign.needs_submission(shard, args.nEvents)
+                    ]
+                    if len(shards) < n_planned:
+                        print(f"Skipping {n_planned - len(shards)} of {n_planned} shards in {out_dir}: complete or in flight")
 
-                    print(folder_path_with_bX)
+                jobs = pack_shards(shards, args.targetWallTime)
 
-                    # Define the executable and arguments separately
-                    executable = "ddsim"
-                    arguments = [
-                        "--steeringFile",
-                        str(beamstrahlung_code_dir / "ddsim_keep_microcurlers_10MeV.py"),
-                        "--compactFile",
-                        str(k4geoDir / det_mod_configs.get_compact_file_path()),
-                        "--inputFile",
-                        str(input_file_path),
-                        "--outputFile",
-                        str(out_name.with_suffix(".edm4hep.root")),
-                        "--numberOfEvents",
-                        str(args.nEvents),
-                        "--crossingAngleBoost",
-                        str(det_mod_configs.get_crossing_angle()),
-                    ]
+                for job in jobs:
+                    print(folder_path_with_bX)
 
-                    if det_mod_configs.is_accelerator_ilc:
-                        # increased resources needed
-                        more_resources = True
-                        # Determine particles per event value for "ILC" scenario
-                        particles_per_event = (
-                            str(args.guineaPigPartPerE)
-                            if 1 <= args.guineaPigPartPerE <= 5000
-                            else str(5000)
+                    # Define the arguments of all shards packed into the job
+                    arguments = []
+                    for shard in job.shards:
+                        if arguments:
+                            arguments.append(JOB_SEPARATOR)
+                        arguments.extend(
+                            [
+                                "--steeringFile",
+                                str(platform_config.beamstrahlung_code_dir / "ddsim_keep_microcurlers_10MeV.py"),
+                                "--compactFile",
+                                str(platform_config.k4geo_dir / det_mod_configs.get_compact_file_path()),
+                                "--inputFile",
+                                str(shard.input_file),
+                                "--outputFile",
+                                str(shard.out_name.with_suffix(".edm4hep.root")),
+                                "--numberOfEvents",
+                                str(shard.n_events if shard.n_events > 0 else args.nEvents),
+                                "--skipNEvents",
+                                str(shard.skip_events),
+                                "--crossingAngleBoost",
+                                str(det_mod_configs.get_crossing_angle()),
+                                # Add particles per event argument
+                                "--guineapig.particlesPerEvent",
+                                str(particles_per_event),
+                            ]
                         )
-                    else:
-                        # Use the provided particles per event for non-"ILC" scenarios
-                        particles_per_event = str(args.guineaPigPartPerE)
-
-                    # Add particles per event argument
-                    arguments.extend(
-                        [
-                            "--guineapig.particlesPerEvent",
-                            particles_per_event,
-                        ]
-                    )
 
-                    # Decide whether to use Condor or bsub
-                    batch_system = "condor" if is_executed_on_DESY_NAF else "bsub"
-
-                    # Submit the job using the appropriate batch system
-                    submit_job(
-                        batch_system,
-                        arguments,
-                        out_name,
-                        args.submit_jobs,
-                        beamstrahlung_code_dir,
-                        executable,
-                        more_rscrs=more_resources,
-                    )
+                    write_plan_sidecar(job)
+                    if args.submit_jobs:
+                        campaign.record_submission(job, batch_system)
+
+                    yield det_mod_name, scenario_name, bunchcrossing, job, arguments
+
+                # keep the state in sync in case the run is interrupted,
+                # a dry run must not fix the plan of the next real run
+                if args.submit_jobs:
+                    campaign.save()
+
+
+def main():
+    # # Function to simulate sourcing (can only be done inside the same shell process)
+    # def source_setup_script(script):
+    #     return subprocess.run(
+    #         f"source {script} && env", shell=True, capture_output=True, text=True
+    #     )
+
+    # # Note: The setup script source cannot affect the Python environment, but we simulate it in case needed.
+    # source_setup_script(setupScriptPath)  # This will not affect the Python environment
+
+    args = get_args()
+    platform_config = get_platform_config()
+    print(platform_config.is_executed_on_desy_naf)
+    parent_out_dir = get_parent_out_dir(args.version)
+    parent_out_dir.mkdir(parents=True, exist_ok=True)
+
+    # Planned shards and validated outputs of earlier runs of this campaign
+    campaign = CampaignState(parent_out_dir / CAMPAIGN_STATE_FILE_NAME)
+
+    # Decide whether to use Condor or bsub, unless chosen explicitly
+    batch_system = args.batchSystem or ("condor" if platform_config.is_executed_on_desy_naf else "bsub")
+
+    bulk_submission = (
+        CondorBulkSubmission(
+            parent_out_dir / f"{args.version}_campaign.condor",
+            platform_config.beamstrahlung_code_dir,
+        )
+        if args.bulkSubmission and batch_system == "condor"
+        else None
+    )
+    local_executor = (
+        LocalExecutor(args.maxLocalJobs, executable=args.localExecutable)
+        if batch_system == "local"
+        else None
+    )
+
+    for _, _, _, job, arguments in iterate_planned_jobs(args, parent_out_dir, campaign, batch_system):
+        # Submit the job using the appropriate batch system
+        submit_job(
+            batch_system,
+            arguments,
+            job.name,
+            args.submit_jobs,
+            platform_config.beamstrahlung_code_dir,
+            DDSIM_EXECUTABLE,
+            request_memory=job.request_memory,
+            request_runtime=job.request_runtime,
+            bulk_submission=bulk_submission,
+            local_executor=local_executor,
+        )
+
+    if bulk_submission is not None:
+        bulk_submission.submit(args.submit_jobs)
+    if local_executor is not None:
+        local_executor.run(args.submit_jobs)
 
 
 if __name__ == "__main__":
@@ -1,4 +1,161 @@
 import subprocess
+from pathlib import Path
+
+# separates the argument lists of several shards packed into one job
+JOB_SEPARATOR = ":::"
+
+CONDOR_EXEC_NAME = "condor_sub_exec.sh"
+CONDOR_PYTHON_EXEC_NAME = "condor_python_exec.sh"
+CONDOR_SUBMIT_COMMAND = "condor_submit"
+# the DESY NAF default for jobs without an explicit runtime request
+DEFAULT_REQUEST_RUNTIME = 10800
+
+
+def quote_condor_argument(argument):
+    """
+    Quotes an argument for the double-quoted `Arguments` syntax of Condor:
+    arguments with white space or quotes are put in single quotes, in which
+    single and double quotes are escaped by repeating them.
+    """
+    if not any(c in argument for c in " \t'\""):
+        return argument
+    return "'" + argument.replace("'", "''").replace('"', '""') + "'"
+
+
+def get_condor_resources(more_rscrs=False, request_memory=None, request_runtime=None):
+    """
+    Returns the resource requests of a Condor job. `request_memory` (MB) and
+    `request_runtime` (s) override the blanket `more_rscrs` resources, e.g. with
+    the estimates of the job planner.
+    """
+    if more_rscrs:
+        resources = {"request_memory": 32768, "request_runtime": 21600}
+    else:
+        resources = {"request_memory": 4096}
+    if request_memory is not None:
+        resources["request_memory"] = request_memory
+    if request_runtime is not None:
+        resources["request_runtime"] = request_runtime
+    return resources
+
+
+def get_common_condor_params(bs_code_dir, exec_name=CONDOR_EXEC_NAME):
+    return {
+        "Universe": "vanilla",
+        "Executable": exec_name,
+        "transfer_input_files": bs_code_dir / exec_name,
+        "environment": '"k4gDir=$ENV(k4gDir) codeDir=$ENV(codeDir) dtDir=$ENV(dtDir) USER=$ENV(USER)"',
+    }
+
+
+def write_condor_submit_file(
+    arguments,
+    output_file_base_name,
+    bs_code_dir,
+    more_rscrs=False,
+    request_memory=None,
+    request_runtime=None,
+    exec_name=CONDOR_EXEC_NAME,
+):
+    """Writes the submit file `<output_file_base_name>.condor` of a single job and returns its path."""
+    condor_params = {
+        **get_common_condor_params(bs_code_dir, exec_name),
+        "Arguments": f'"{" ".join(map(quote_condor_argument, arguments))}"',
+        "Log": f"{output_file_base_name}.log",
+        "Output": f"{output_file_base_name}.out",
+        "Error": f"{output_file_base_name}.err",
+        **get_condor_resources(more_rscrs, request_memory, request_runtime),
+    }
+
+    # Create the script content using the dictionary
+    condor_script_content = (
+        "\n".join(f"{key} = {value}" for key, value in condor_params.items())
+        + "\nQueue\n"
+    )
+    condor_submit_file = output_file_base_name.with_suffix(".condor")
+    with open(condor_submit_file, "w", encoding="utf-8") as f:
+        f.write(condor_script_content)
+    return condor_submit_file
+
+
+def run_condor_submit(condor_submit_file, sub_jobs, condor_submit=CONDOR_SUBMIT_COMMAND):
+    condor_command = [condor_submit, str(condor_submit_file)]
+    if sub_jobs:
+        subprocess.run(condor_command, check=True)
+    else:
+        print(" ".join(condor_command), end="\n\n")
+
+
+class CondorBulkSubmission:
+    """
+    Collects the jobs of a whole campaign into a single submit description.
+
+    Every job becomes one row of the itemdata table of a `queue ... from`
+    statement, so the campaign is submitted with one `condor_submit` call and
+    one schedd round-trip instead of one per job.
+    """
+
+    # the arguments contain spaces and have to be the last item of a row
+    ITEM_VARIABLES = ("job_base_name", "job_memory", "job_runtime", "job_args")
+
+    def __init__(self, condor_submit_file, bs_code_dir, condor_submit=CONDOR_SUBMIT_COMMAND):
+        self.condor_submit_file = Path(condor_submit_file)
+        self.bs_code_dir = bs_code_dir
+        self.condor_submit = condor_submit
+        self.rows = []
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add_job(
+        self,
+        arguments,
+        output_file_base_name,
+        more_rscrs=False,
+        request_memory=None,
+        request_runtime=None,
+    ):
+        resources = get_condor_resources(more_rscrs, request_memory, request_runtime)
+        base_name = str(output_file_base_name)
+        if any(c in base_name for c in " ,"):
+            raise ValueError(f"Job names must not contain spaces or commas: {base_name}")
+        self.rows.append(
+            (
+                base_name,
+                resources["request_memory"],
+                resources.get("request_runtime", DEFAULT_REQUEST_RUNTIME),
+                " ".join(map(quote_condor_argument, arguments)),
+            )
+        )
+
+    def get_submit_description(self):
+        condor_params = {
+            **get_common_condor_params(self.bs_code_dir),
+            "Arguments": '"$(job_args)"',
+            "Log": "$(job_base_name).log",
+            "Output": "$(job_base_name).out",
+            "Error": "$(job_base_name).err",
+            "request_memory": "$(job_memory)",
+            "request_runtime": "$(job_runtime)",
+        }
+        item_data = "\n".join(
+            ", ".join(str(item) for item in row) for row in self.rows
+        )
+        return (
+            "\n".join(f"{key} = {value}" for key, value in condor_params.items())
+            + f"\nQueue {', '.join(self.ITEM_VARIABLES)} from (\n{item_data}\n)\n"
+        )
+
+    def submit(self, sub_jobs):
+        """Writes the submit description and submits all collected jobs at once."""
+        if not self.rows:
+            print("No jobs to submit.")
+            return
+        self.condor_submit_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.condor_submit_file, "w", encoding="utf-8") as f:
+            f.write(self.get_submit_description())
+        print(f"{len(self.rows)} jobs collected in {self.condor_submit_file}")
+        run_condor_submit(self.condor_submit_file, sub_jobs, self.condor_submit)
 
 
 def submit_job(
@@ -9,53 +166,54 @@ def submit_job(
     bs_code_dir,
     executable_4KEK=None,
     more_rscrs=False,
+    request_memory=None,
+    request_runtime=None,
+    bulk_submission=None,
+    local_executor=None,
 ):
-    """Prepare and submit a job using the chosen batch system."""
-    if system_type == "condor":
-        # Create the Condor submit script
-        exec_name = "condor_sub_exec.sh"
-        condor_params = {
-            "Universe": "vanilla",
-            "Executable": exec_name,
-            "Arguments": f'"{" ".join(arguments)}"',
-            "transfer_input_files": bs_code_dir / exec_name,
-            "Log": f"{output_file_base_name}.log",
-            "Output": f"{output_file_base_name}.out",
-            "Error": f"{output_file_base_name}.err",
-            "environment": '"k4gDir=$ENV(k4gDir) codeDir=$ENV(codeDir)"',
-        }
-        if more_rscrs:
-            condor_params["request_memory"] = 32768
-            condor_params["request_runtime"] = 21600
-        else:
-            condor_params["request_memory"] = 4096
+    """
+    Prepare and submit a job using the chosen batch system.
 
-        # Create the script content using the dictionary
-        condor_script_content = (
-            "\n".join(f"{key} = {value}" for key, value in condor_params.items())
-            + "\nQueue\n"
+    If a `CondorBulkSubmission` is given, Condor jobs are only added to it and
+    are submitted together by `bulk_submission.submit`. Jobs of the "local"
+    system are added to `local_executor` and run by `local_executor.run`.
+    """
+    if system_type == "local":
+        local_executor.add_job(
+            executable_4KEK, arguments, output_file_base_name, request_memory
         )
-        condor_submit_file = output_file_base_name.with_suffix(".condor")
-        with open(condor_submit_file, "w", encoding="utf-8") as f:
-            f.write(condor_script_content)
 
-        condor_command = f"condor_submit {condor_submit_file}"
-        if sub_jobs:
-            subprocess.run(condor_command, shell=True, check=True)
-        else:
-            print(condor_command, end="\n\n")
+    elif system_type == "condor":
+        if bulk_submission is not None:
+            bulk_submission.add_job(
+                arguments,
+                output_file_base_name,
+                more_rscrs,
+                request_memory,
+                request_runtime,
+            )
+            return
+
+        condor_submit_file = write_condor_submit_file(
+            arguments,
+            output_file_base_name,
+            bs_code_dir,
+            more_rscrs,
+            request_memory,
+            request_runtime,
+        )
+        run_condor_submit(condor_submit_file, sub_jobs)
 
     else:
         # Use bsub submission (used at KEK)
         output_log_file_name_4KEK = output_file_base_name.with_suffix(".log")
-        arguments.extend(
-            [
-                ">",
-                str(output_log_file_name_4KEK),
-                "2>&1",
-            ]
+        # packed shards are run one after the other
+        commands = " ".join([executable_4KEK, *arguments]).replace(
+            f" {JOB_SEPARATOR} ", f" && {executable_4KEK} "
+        )
+        bsub_command = (
+            f'bsub -q l "({commands}) > {output_log_file_name_4KEK} 2>&1"'
         )
-        bsub_command = f'bsub -q l "{executable_4KEK} {" ".join(arguments)}"'
         if sub_jobs:
             subprocess.run(bsub_command, shell=True, check=True)
         else:
@@ -0,0 +1,51 @@
+from pathlib import Path
+
+from submit_utils_4_simall import JOB_SEPARATOR, CondorBulkSubmission
+
+
+def make_stub_condor_submit(tmp_path):
+    """A `condor_submit` that records its arguments and the submit file of every call."""
+    calls_file = tmp_path / "calls.txt"
+    stub = tmp_path / "condor_submit"
+    stub.write_text(f'#!/bin/sh\necho "$@" >> {calls_file}\ncat "$1" > {tmp_path}/submitted.condor\n')
+    stub.chmod(0o755)
+    return stub, calls_file
+
+
+def test_bulk_submission_submits_all_jobs_with_one_call(tmp_path):
+    stub, calls_file = make_stub_condor_submit(tmp_path)
+    submit_file = tmp_path / "campaign" / "bulk.condor"
+    bulk_submission = CondorBulkSubmission(submit_file, Path("/code"), condor_submit=str(stub))
+
+    bulk_submission.add_job(
+        ["--inputFile", "a.pairs", JOB_SEPARATOR, "--inputFile", "b.pairs"],
+        tmp_path / "job_0",
+        request_memory=2048,
+        request_runtime=3600,
+    )
+    bulk_submission.add_job(
+        ["--inputFile", "my dir/c.pairs", "--tag", "it's"],
+        tmp_path / "job_1",
+    )
+    bulk_submission.submit(sub_jobs=True)
+
+    assert calls_file.read_text().splitlines() == [str(submit_file)]
+    description = (tmp_path / "submitted.condor").read_text()
+    assert description == submit_file.read_text()
+    assert 'Arguments = "$(job_args)"' in description
+    assert description.endswith(
+        "Queue job_base_name, job_memory, job_runtime, job_args from (\n"
+        f"{tmp_path / 'job_0'}, 2048, 3600, --inputFile a.pairs ::: --inputFile b.pairs\n"
+        f"{tmp_path / 'job_1'}, 4096, 10800, --inputFile 'my dir/c.pairs' --tag 'it''s'\n"
+        ")\n"
+    )
+
+
+def test_bulk_submission_without_jobs_does_not_submit(tmp_path):
+    stub, calls_file = make_stub_condor_submit(tmp_path)
+    bulk_submission = CondorBulkSubmission(tmp_path / "bulk.condor", Path("/code"), condor_submit=str(stub))
+
+    bulk_submission.submit(sub_jobs=True)
+
+    assert not calls_file.exists()
+    assert not (tmp_path / "bulk.condor").exists()
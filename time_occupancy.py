@@ -0,0 +1,169 @@
+"""
+Time resolved occupancy of the layers, from the hit time column `t` (ns).
+
+Late hits, e.g. of backscattering particles or of the micro-curlers kept by the
+10 MeV `TPCLowPtCut`, arrive after the next bunch crossings at short bunch
+spacings and pile up in the readout windows. The hit times of every layer are
+sorted once; the number of hits before any time is then a `searchsorted`, so
+the counts of all time slices and readout windows follow from cumulative
+counts without filtering the hits again:
+- time slices: the hits of a crossing with `t` in [low, high);
+- readout windows: the hits of a steady train of crossings with the bunch
+  spacing arriving within a window of the given length that opens at a
+  crossing, i.e. the hits of the crossings during the window and the late
+  hits of all earlier crossings.
+
+The counts are converted to occupancies (%) with the layer summary of the
+combination (see layer_summary.py), so the slice [0, inf) equals the table.
+"""
+
+from pathlib import Path
+from typing import Dict, List, NamedTuple
+
+import numpy as np
+
+TIME_SUBDIR_NAME = "time_data"
+TIME_FILE_SUFFIX = "_time.npz"
+# bunch spacing (ns) per scenario, others are treated as single crossings unless given
+BUNCH_SPACINGS = {
+    "FCC091": 20.0,
+    "45GeV_halo": 20.0,
+    "ILC250": 554.0,
+}
+SLICE, WINDOW = "slice", "window"
+
+
+class LayerTimes(NamedTuple):
+    """The sorted hit times of a layer of `divide_hits`."""
+
+    subdetector: str
+    layer: str
+    times: np.ndarray
+
+
+def get_layer_times(divided_hits) -> List[LayerTimes]:
+    return [
+        LayerTimes(subdet, layer, np.sort(hits["t"]))
+        for subdet, subdet_hits in divided_hits.items()
+        for layer, hits in subdet_hits.items()
+    ]
+
+
+def count_before(times: np.ndarray, limits) -> np.ndarray:
+    """Number of the sorted `times` before each of the `limits`."""
+    return np.searchsorted(times, limits, side="left")
+
+
+def count_in_slices(times: np.ndarray, edges) -> np.ndarray:
+    """Hits of the sorted `times` in the slices [edges[i], edges[i + 1])."""
+    return np.diff(count_before(times, edges))
+
+
+def count_in_windows(times: np.ndarray, windows, bunch_spacing: float = np.inf) -> np.ndarray:
+    """
+    Hits of a steady train of crossings with `bunch_spacing` (ns) in readout
+    windows of the lengths `windows` (ns) opening at a crossing, per crossing
+    of the sample. A crossing m spacings after the opening contributes its hits
+    with t < window - m·spacing, a crossing k spacings before the opening
+    those with k·spacing <= t < k·spacing + window.
+    """
+    windows = np.asarray(windows, dtype=float)
+    counts = count_before(times, windows).astype(float)
+    if not np.isfinite(bunch_spacing) or not len(times):
+        return counts
+
+    # the late hits of earlier crossings, per spacing slot s·spacing <= t < (s + 1)·spacing;
+    # only slots with hits contribute, so late outliers cost nothing
+    slots = np.unique(np.floor(times / bunch_spacing))
+    slots = slots[slots >= 1]
+    starts = slots * bunch_spacing
+    slot_counts = count_before(times, starts + bunch_spacing) - count_before(times, starts)
+
+    for i, window in enumerate(windows):
+        # crossings during the window
+        later = np.arange(1, int(np.ceil(window / bunch_spacing))) * bunch_spacing
+        counts[i] += count_before(times, window - later).sum()
+        # window = q·spacing + rest: slot s is covered entirely by min(s, q) earlier
+        # crossings and its first `rest` ns by the crossing s + q spacings before
+        q, rest = divmod(window, bunch_spacing)
+        counts[i] += (slot_counts * np.minimum(slots, q)).sum()
+        late = starts[slots >= q + 1]
+        counts[i] += (count_before(times, late + rest) - count_before(times, late)).sum()
+    return counts
+
+
+def get_time_occupancy(
+    divided_hits, summary: Dict[str, np.ndarray], slice_edges=(), windows=(), bunch_spacing: float = np.inf
+) -> Dict[str, np.ndarray]:
+    """
+    Counts and occupancies of the layers in the time slices and readout windows.
+
+    Parameters:
+    - divided_hits: Hits divided into layers by `divide_hits`, with the `t` column.
+    - summary (Dict[str, np.ndarray]): Layer summary of the same hits, see `get_layer_summary`.
+    - slice_edges: Edges of the time slices in ns.
+    - windows: Lengths of the readout windows in ns.
+    - bunch_spacing (float): Bunch spacing in ns, inf for single crossings.
+
+    Returns:
+    - Dict[str, np.ndarray]: Columns subdetector, layer, kind ("slice" or "window"),
+      low and high (ns), n_hits (of the whole sample) and occupancy (%),
+      one row per layer and slice or window.
+    """
+    slice_edges = np.asarray(slice_edges, dtype=float)
+    windows = np.asarray(windows, dtype=float)
+    # occupancy per hit of each layer
+    occupancy_per_hit = {
+        (subdet, layer): occupancy / n_hits if n_hits else 0.0
+        for subdet, layer, occupancy, n_hits in zip(
+            summary["subdetector"], summary["layer"], summary["occupancy"], summary["n_hits"]
+        )
+    }
+
+    rows = []
+    for layer_times in get_layer_times(divided_hits):
+        factor = occupancy_per_hit[(layer_times.subdetector, layer_times.layer)]
+        if len(slice_edges) > 1:
+            counts = count_in_slices(layer_times.times, slice_edges)
+            for low, high, count in zip(slice_edges[:-1], slice_edges[1:], counts):
+                rows.append((layer_times.subdetector, layer_times.layer, SLICE, low, high, count, count * factor))
+        if len(windows):
+            counts = count_in_windows(layer_times.times, windows, bunch_spacing)
+            for window, count in zip(windows, counts):
+                rows.append((layer_times.subdetector, layer_times.layer, WINDOW, 0.0, window, count, count * factor))
+
+    names = ("subdetector", "layer", "kind", "low", "high", "n_hits", "occupancy")
+    columns = {name: np.array([row[i] for row in rows]) for i, name in enumerate(names)}
+    for name in ("low", "high", "n_hits", "occupancy"):
+        columns[name] = columns[name].astype(float)
+    return columns
+
+
+def get_time_file_path(directory: Path, detector_model: str, scenario: str) -> Path:
+    return Path(directory) / TIME_SUBDIR_NAME / f"{detector_model}_{scenario}{TIME_FILE_SUFFIX}"
+
+
+def print_time_occupancy(columns: Dict[str, np.ndarray]) -> None:
+    """Prints the occupancies (%) of the layers, one column per slice or window."""
+    from tabulate import tabulate
+
+    for kind, label in ((SLICE, "t in [{low:g}, {high:g}) ns"), (WINDOW, "{high:g} ns window")):
+        selected = columns["kind"] == kind
+        if not selected.any():
+            continue
+        headers = list(
+            dict.fromkeys(
+                label.format(low=low, high=high)
+                for low, high in zip(columns["low"][selected], columns["high"][selected])
+            )
+        )
+        layers = list(dict.fromkeys(zip(columns["subdetector"][selected], columns["layer"][selected])))
+        occupancy = columns["occupancy"][selected].reshape(len(layers), len(headers))
+        print(
+            tabulate(
+                [[subdet, layer, *values] for (subdet, layer), values in zip(layers, occupancy)],
+                headers=["Subdetector", "layer", *headers],
+                tablefmt="grid",
+                floatfmt=".2e",
+            )
+        )